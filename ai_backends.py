@@ -0,0 +1,140 @@
+import re
+import time
+import random
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import List, Dict, Any
+try:
+    from google.cloud import language_v1
+except ImportError:
+    language_v1 = None
+
+logger = logging.getLogger(__name__)
+
+
+class AIBackend(ABC):
+    """
+    Interface of the language services used for AI PHI detection.
+
+    Backends return plain data so AIPhiDetector does not depend on a client
+    library. Offsets are code point positions in the analyzed text. Backends
+    must be safe to call from several threads at once.
+    """
+
+    @abstractmethod
+    def analyze_entities(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Entities in the text as dicts with 'name', 'type' (e.g. 'PERSON'),
+        'salience', 'metadata' and 'mentions' (a list of {'text', 'offset'}).
+        """
+
+    @abstractmethod
+    def analyze_sentiment(self, text: str) -> Dict[str, float]:
+        """Document sentiment as a dict with 'score' and 'magnitude'."""
+
+    @abstractmethod
+    def classify_text(self, text: str) -> List[str]:
+        """Content category names of the text, e.g. '/Health/Medical Facilities'."""
+
+
+class GoogleLanguageBackend(AIBackend):
+    """Backend for the Google Cloud Natural Language API."""
+
+    def __init__(self, api_key: str):
+        if language_v1 is None:
+            raise ImportError("google-cloud-language is not installed")
+        self.client = language_v1.LanguageServiceClient.from_api_key(api_key)
+
+    def _document(self, text: str, language: str = None):
+        if language:
+            return language_v1.Document(content=text, type_=language_v1.Document.Type.PLAIN_TEXT, language=language)
+        return language_v1.Document(content=text, type_=language_v1.Document.Type.PLAIN_TEXT)
+
+    def analyze_entities(self, text: str) -> List[Dict[str, Any]]:
+        # UTF32 offsets are code point offsets, i.e. Python string indexes
+        response = self.client.analyze_entities(
+            document=self._document(text, language="en"),
+            encoding_type=language_v1.EncodingType.UTF32
+        )
+        return [
+            {
+                'name': entity.name,
+                'type': entity.type_.name,
+                'salience': entity.salience,
+                'metadata': dict(entity.metadata),
+                'mentions': [
+                    {'text': mention.text.content, 'offset': mention.text.begin_offset}
+                    for mention in entity.mentions
+                ]
+            }
+            for entity in response.entities
+        ]
+
+    def analyze_sentiment(self, text: str) -> Dict[str, float]:
+        response = self.client.analyze_sentiment(document=self._document(text))
+        return {
+            'score': response.document_sentiment.score,
+            'magnitude': response.document_sentiment.magnitude
+        }
+
+    def classify_text(self, text: str) -> List[str]:
+        response = self.client.classify_text(document=self._document(text))
+        return [category.name for category in response.categories]
+
+
+class StubBackend(AIBackend):
+    """
+    In-process stand-in for a language service, for testing and benchmarking
+    offline. Entities are found with simple regexes, and every call sleeps for
+    `latency` seconds (plus up to `jitter` more) to mimic a network round-trip.
+    """
+
+    ENTITY_PATTERNS = [
+        ('PERSON', re.compile(r'\b(?:Dr|Mr|Mrs|Ms)\.?\s+[A-Z][a-z]+(?:\s+[A-Z][a-z]+)?\b|\b[A-Z][a-z]+\s+[A-Z][a-z]+\b')),
+        ('DATE', re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b')),
+        ('PHONE_NUMBER', re.compile(r'\(?\b\d{3}\)?[-.\s]?\d{3}[-.]\d{4}\b')),
+        ('LOCATION', re.compile(r'\b(?:in|at|from)\s+([A-Z][a-z]{3,})\b')),
+    ]
+    MEDICAL_TERMS = ('patient', 'pt', 'diagnosis', 'treatment', 'clinic', 'hospital', 'pain', 'medication')
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = Counter()
+
+    def _wait(self, method: str):
+        with self._lock:
+            self.calls[method] += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def analyze_entities(self, text: str) -> List[Dict[str, Any]]:
+        self._wait('analyze_entities')
+        entities = {}
+        for entity_type, pattern in self.ENTITY_PATTERNS:
+            for match in pattern.finditer(text):
+                group = 1 if pattern.groups else 0
+                name = match.group(group)
+                entity = entities.setdefault((entity_type, name), {
+                    'name': name,
+                    'type': entity_type,
+                    'salience': 0.5,
+                    'metadata': {},
+                    'mentions': []
+                })
+                entity['mentions'].append({'text': name, 'offset': match.start(group)})
+        return list(entities.values())
+
+    def analyze_sentiment(self, text: str) -> Dict[str, float]:
+        self._wait('analyze_sentiment')
+        return {'score': 0.0, 'magnitude': 0.0}
+
+    def classify_text(self, text: str) -> List[str]:
+        self._wait('classify_text')
+        words = set(re.findall(r'[a-z]+', text.lower()))
+        return ['/Health'] if words.intersection(self.MEDICAL_TERMS) else []
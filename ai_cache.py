@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import logging
+import threading
+from typing import List, Dict, Any, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'ai_cache.db')
+DEFAULT_TTL_DAYS = 30
+DEFAULT_MAX_ENTRIES = 100000
+
+
+class AIResultStore:
+    """
+    Persistent SQLite store of AI analysis results, keyed by a hash of the
+    analyzed text and the feature set that produced the result (backend and
+    API calls). AIPhiDetector stores findings without the text they found.
+    Entries expire after ttl_seconds, and the least recently used entries are
+    evicted beyond max_entries. Safe to share between threads.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl_seconds: float = DEFAULT_TTL_DAYS * 86400,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            # Owner only: findings keep the types and offsets of PHI in source data
+            os.chmod(path, 0o600)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS ai_results (
+                key TEXT PRIMARY KEY,
+                feature_set TEXT NOT NULL,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS ix_ai_results_accessed ON ai_results (accessed_at)")
+        self.conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional['AIResultStore']:
+        """
+        Store configured by AI_CACHE_PATH, AI_CACHE_TTL_DAYS and AI_CACHE_MAX_ENTRIES,
+        or None if AI_CACHE_PATH is set to an empty string.
+        """
+        path = os.environ.get('AI_CACHE_PATH', DEFAULT_PATH)
+        if not path:
+            return None
+        try:
+            return cls(
+                path,
+                ttl_seconds=float(os.environ.get('AI_CACHE_TTL_DAYS', DEFAULT_TTL_DAYS)) * 86400,
+                max_entries=int(os.environ.get('AI_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES))
+            )
+        except Exception as e:
+            logger.warning(f"AI result cache disabled: {str(e)}")
+            return None
+
+    @staticmethod
+    def make_key(text: str, feature_set: str) -> str:
+        """Store key for a text analyzed with a feature set."""
+        digest = hashlib.sha256(feature_set.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Unexpired results for the keys that are in the store."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, result FROM ai_results WHERE key IN ({placeholders}) AND created_at >= ?",
+                    chunk + [now - self.ttl_seconds]
+                ).fetchall()
+                found.update((key, json.loads(result)) for key, result in rows)
+            if found:
+                self.conn.executemany("UPDATE ai_results SET accessed_at = ? WHERE key = ?",
+                                      [(now, key) for key in found])
+                self.conn.commit()
+        return found
+
+    def get(self, key: str) -> Optional[Any]:
+        """Unexpired result for the key, or None."""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, Any], feature_set: str):
+        """Store results by key, evicting old entries if the store is over its limits."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, feature_set, json.dumps(result, default=str), now, now) for key, result in items.items()]
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO ai_results VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self._writes += len(rows)
+            # Check the limits every so often rather than on every write
+            if self._writes >= max(1, self.max_entries // 100):
+                self._writes = 0
+                self._evict()
+
+    def put(self, key: str, result: Any, feature_set: str):
+        """Store one result."""
+        self.put_many({key: result}, feature_set)
+
+    def prune(self) -> int:
+        """Remove expired entries and entries beyond max_entries. Returns the number removed."""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        removed = self.conn.execute("DELETE FROM ai_results WHERE created_at < ?",
+                                    (time.time() - self.ttl_seconds,)).rowcount
+        count = self.conn.execute("SELECT COUNT(*) FROM ai_results").fetchone()[0]
+        if count > self.max_entries:
+            removed += self.conn.execute(
+                "DELETE FROM ai_results WHERE key IN "
+                "(SELECT key FROM ai_results ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,)
+            ).rowcount
+        self.conn.commit()
+        if removed:
+            logger.info(f"Evicted {removed} AI result cache entries")
+        return removed
+
+    def export(self, file_path: str) -> int:
+        """Write all unexpired entries to a JSON lines file. Returns the number written."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, feature_set, result, created_at FROM ai_results WHERE created_at >= ?",
+                (time.time() - self.ttl_seconds,)
+            ).fetchall()
+        with open(file_path, 'w', encoding='utf-8') as f:
+            for key, feature_set, result, created_at in rows:
+                f.write(json.dumps({'key': key, 'feature_set': feature_set,
+                                    'result': json.loads(result), 'created_at': created_at}) + '\n')
+        logger.info(f"Exported {len(rows)} AI result cache entries to {file_path}")
+        return len(rows)
+
+    def load(self, file_path: str) -> int:
+        """Bulk load entries written by export, keeping their age. Returns the number loaded."""
+        now = time.time()
+        rows = []
+        with open(file_path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    rows.append((entry['key'], entry['feature_set'], json.dumps(entry['result']),
+                                 entry.get('created_at', now), now))
+        with self._lock:
+            self.conn.executemany("INSERT OR REPLACE INTO ai_results VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+            self._evict()
+        logger.info(f"Loaded {len(rows)} AI result cache entries from {file_path}")
+        return len(rows)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Entry counts per feature set."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT feature_set, COUNT(*) FROM ai_results GROUP BY feature_set"
+            ).fetchall()
+        return {
+            'path': self.path,
+            'entries': sum(count for _, count in rows),
+            'max_entries': self.max_entries,
+            'ttl_days': self.ttl_seconds / 86400,
+            'feature_sets': dict(rows)
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def warm(texts: List[str], batch_size: int = 1000) -> int:
+    """Run AI analysis for the texts so that later scans find them in the store."""
+    from ai_service import AIPhiDetector
+
+    detector = AIPhiDetector()
+    if detector.result_store is None:
+        raise ValueError("AI result cache is disabled (AI_CACHE_PATH is empty)")
+    for i in range(0, len(texts), batch_size):
+        detector.analyze_medical_texts(texts[i:i + batch_size])
+    detector.close()
+    return len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the persistent AI result cache")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show cache size")
+    subparsers.add_parser('prune', help="Remove expired and excess entries")
+    export_parser = subparsers.add_parser('export', help="Export entries to a JSON lines file")
+    export_parser.add_argument('file')
+    load_parser = subparsers.add_parser('load', help="Load entries from an exported file")
+    load_parser.add_argument('file')
+    warm_parser = subparsers.add_parser('warm', help="Analyze texts from a file (one per line) into the cache")
+    warm_parser.add_argument('file')
+    args = parser.parse_args()
+
+    if args.command == 'warm':
+        with open(args.file, encoding='utf-8') as f:
+            texts = [line.rstrip('\n') for line in f if line.strip()]
+        print(f"Warmed {warm(texts)} texts")
+        return
+
+    store = AIResultStore.from_env()
+    if store is None:
+        parser.error("AI result cache is disabled (AI_CACHE_PATH is empty)")
+    if args.command == 'stats':
+        print(json.dumps(store.get_stats(), indent=2))
+    elif args.command == 'prune':
+        print(f"Removed {store.prune()} entries")
+    elif args.command == 'export':
+        print(f"Exported {store.export(args.file)} entries")
+    elif args.command == 'load':
+        print(f"Loaded {store.load(args.file)} entries")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,111 @@
 import os
+import time
+import bisect
 import logging
-from google.cloud import language_v1
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
+from ai_backends import AIBackend, GoogleLanguageBackend
+from ai_cache import AIResultStore
 
 logger = logging.getLogger(__name__)
 
+# Short texts are packed into documents of up to this many characters, one request each
+MAX_DOCUMENT_CHARS = 20000
+DOCUMENT_SEPARATOR = '\n\n'
+ANALYSIS_METHODS = ('analyze_entities', 'analyze_sentiment', 'classify_text')
+
+
+class RateLimiter:
+    """
+    Token bucket limiting calls to `rate` per second, with bursts of up to
+    `burst` calls. Safe to share between threads.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = rate
+        self.burst = burst or max(1, int(rate))
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Reserve a token now; if the bucket is empty, wait until it has refilled
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
 class AIPhiDetector:
     """
     AI-powered PHI detection service using Google Cloud Natural Language API
     for enhanced detection in unstructured text data.
+
+    The language service calls go through a pluggable backend (see ai_backends)
+    and run concurrently on a thread pool of max_concurrency workers, optionally
+    throttled to requests_per_second. Both default to the AI_MAX_CONCURRENCY and
+    AI_REQUESTS_PER_SECOND environment variables.
+
+    Results are looked up in a persistent result_store (see ai_cache) before
+    calling out. The Google backend uses the store configured by the AI_CACHE_*
+    environment variables unless another one is passed.
     """
 
-    def __init__(self):
-        self.api_key = os.environ.get('GOOGLE_API_KEY')
-        if not self.api_key:
-            raise ValueError("Google API key not found in environment variables")
-        
-        # Initialize Google Cloud client
-        self.client = language_v1.LanguageServiceClient.from_api_key(self.api_key)
+    def __init__(self, backend: AIBackend = None, max_concurrency: int = None,
+                 requests_per_second: float = None, max_document_chars: int = MAX_DOCUMENT_CHARS,
+                 result_store: AIResultStore = None):
+        if backend is None:
+            self.api_key = os.environ.get('GOOGLE_API_KEY')
+            if not self.api_key:
+                raise ValueError("Google API key not found in environment variables")
+
+            # Initialize Google Cloud client
+            backend = GoogleLanguageBackend(self.api_key)
+            if result_store is None:
+                result_store = AIResultStore.from_env()
+        self.backend = backend
+        self.result_store = result_store
+        # Stored results are only reused for the same backend and API calls
+        self.feature_set = f"{type(backend).__name__}/{'+'.join(ANALYSIS_METHODS)}"
+
+        if max_concurrency is None:
+            max_concurrency = int(os.environ.get('AI_MAX_CONCURRENCY', 8))
+        if requests_per_second is None:
+            requests_per_second = float(os.environ.get('AI_REQUESTS_PER_SECOND', 0))
+        self.max_concurrency = max_concurrency
+        self.max_document_chars = max_document_chars
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='ai-phi')
+        self.rate_limiter = RateLimiter(requests_per_second) if requests_per_second > 0 else None
 
     def analyze_text(self, text: str) -> List[Dict[str, Any]]:
         """
         Analyze text using Google Cloud NLP to detect potential PHI.
         """
+        feature_set = f"{type(self.backend).__name__}/analyze_entities"
+        key = self.result_store.make_key(text, feature_set) if self.result_store is not None else None
+        if key is not None:
+            findings = self._stored_results([key], [text]).get(key)
+            if findings is not None:
+                return findings
+
         try:
-            # Prepare the document
-            document = language_v1.Document(
-                content=text,
-                type_=language_v1.Document.Type.PLAIN_TEXT,
-                language="en"
-            )
-
-            # Analyze entities
-            response = self.client.analyze_entities(
-                document=document,
-                encoding_type=language_v1.EncodingType.UTF8
-            )
-
-            findings = []
-            for entity in response.entities:
-                # Map Google entity types to PHI types
-                phi_type = self._map_entity_to_phi(entity.type_.name)
-                if phi_type:
-                    findings.append({
-                        'type': phi_type,
-                        'value': entity.name,
-                        'start': text.find(entity.name),
-                        'end': text.find(entity.name) + len(entity.name),
-                        'confidence': entity.salience,
-                        'metadata': entity.metadata
-                    })
-
-            return findings
+            entities = self._call('analyze_entities', text)
+            findings = self._split_findings(entities, [text], [0])[0]
 
         except Exception as e:
             logger.error(f"Error in AI PHI detection: {str(e)}")
             return []
 
+        if key is not None:
+            self._store_results({key: findings}, feature_set)
+        return findings
+
     def _map_entity_to_phi(self, entity_type: str) -> str:
         """
         Map Google entity types to PHI categories.
@@ -78,46 +127,186 @@ class AIPhiDetector:
         """
         Specialized analysis for medical text with context awareness.
         """
+        return self.analyze_medical_texts([text])[0]
+
+    def analyze_medical_texts(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        analyze_medical_text for many texts at once. Texts found in the result
+        store are not sent again. The rest are packed into shared documents, and
+        the entity, sentiment and classification calls for all documents run
+        concurrently. Medical context is derived per document.
+        """
+        if self.result_store is None:
+            return [result or self._empty_result() for result in self._analyze_documents(texts)]
+
+        keys = [self.result_store.make_key(text, self.feature_set) for text in texts]
+        results = self._stored_results(keys, texts)
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in results:
+                missing.setdefault(key, text)
+
+        if missing:
+            analyzed = dict(zip(missing, self._analyze_documents(list(missing.values()))))
+            # Failed analyses are not stored, so they are retried next time
+            self._store_results({key: result for key, result in analyzed.items() if result is not None},
+                                self.feature_set)
+            results.update(analyzed)
+
+        return [results[key] or self._empty_result() for key in keys]
+
+    def _analyze_documents(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Analyze texts with the backend; None for texts whose entity analysis failed."""
+        documents = []
+        for indexes in self._pack_texts(texts):
+            content = DOCUMENT_SEPARATOR.join(texts[i] for i in indexes)
+            calls = {method: self.executor.submit(self._call, method, content) for method in ANALYSIS_METHODS}
+            documents.append((indexes, calls))
+
+        results = [None] * len(texts)
+        for indexes, calls in documents:
+            document_texts = [texts[i] for i in indexes]
+            try:
+                # Get basic entity analysis
+                entities = calls['analyze_entities'].result()
+            except Exception as e:
+                logger.error(f"Error in medical text analysis: {str(e)}")
+                continue
+
+            # Sentiment and classification only add context, so their failures are not fatal
+            sentiment = self._optional_result(calls['analyze_sentiment'], {})
+            categories = self._optional_result(calls['classify_text'], [])
+
+            starts = []
+            offset = 0
+            for text in document_texts:
+                starts.append(offset)
+                offset += len(text) + len(DOCUMENT_SEPARATOR)
+
+            for i, findings in zip(indexes, self._split_findings(entities, document_texts, starts)):
+                # Enhance findings with medical context
+                medical_context = self._analyze_medical_context(findings, sentiment, categories)
+                results[i] = {
+                    'findings': findings,
+                    'medical_context': medical_context,
+                    'confidence': self._calculate_medical_confidence(findings, medical_context)
+                }
+
+        return results
+
+    def _empty_result(self) -> Dict[str, Any]:
+        return {'findings': [], 'medical_context': {}, 'confidence': 0.0}
+
+    def _stored_results(self, keys: List[str], texts: List[str]) -> Dict[str, Any]:
+        """Results found in the result store; a broken store only costs remote calls."""
         try:
-            # Get basic entity analysis
-            findings = self.analyze_text(text)
-            
-            # Additional medical-specific analysis
-            document = language_v1.Document(
-                content=text,
-                type_=language_v1.Document.Type.PLAIN_TEXT
-            )
-            
-            # Get document sentiment to understand context
-            sentiment = self.client.analyze_sentiment(document=document)
-            
-            # Get content classification
-            classification = self.client.classify_text(document=document)
-            
-            # Enhance findings with medical context
-            medical_context = self._analyze_medical_context(
-                findings, 
-                sentiment.document_sentiment,
-                classification.categories if classification.categories else []
-            )
-            
-            return {
-                'findings': findings,
-                'medical_context': medical_context,
-                'confidence': self._calculate_medical_confidence(findings, medical_context)
-            }
-            
+            stored = self.result_store.get_many(keys)
+        except Exception as e:
+            logger.warning(f"AI result cache lookup failed: {str(e)}")
+            return {}
+        # Finding values are not stored, they are cut back out of the text by their offsets
+        texts = dict(zip(keys, texts))
+        return {key: self._with_findings(result, [dict(finding, value=texts[key][finding['start']:finding['end']])
+                                                  for finding in self._findings_of(result)])
+                for key, result in stored.items()}
+
+    def _store_results(self, results: Dict[str, Any], feature_set: str):
+        """Store results without the PHI they found: findings keep their type, offsets and confidence only."""
+        results = {key: self._with_findings(result, [{name: value for name, value in finding.items() if name != 'value'}
+                                                     for finding in self._findings_of(result)])
+                   for key, result in results.items()}
+        try:
+            self.result_store.put_many(results, feature_set)
         except Exception as e:
-            logger.error(f"Error in medical text analysis: {str(e)}")
-            return {'findings': [], 'medical_context': {}, 'confidence': 0.0}
+            logger.warning(f"AI result cache update failed: {str(e)}")
+
+    @staticmethod
+    def _findings_of(result) -> List[Dict[str, Any]]:
+        """Findings of an analyze_text (a list) or analyze_medical_text (a dict) result."""
+        return result['findings'] if isinstance(result, dict) else result
+
+    @staticmethod
+    def _with_findings(result, findings: List[Dict[str, Any]]):
+        return dict(result, findings=findings) if isinstance(result, dict) else findings
+
+    def _call(self, method: str, text: str):
+        """Call a backend method, waiting for the rate limiter first."""
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        return getattr(self.backend, method)(text)
+
+    def _optional_result(self, future, default):
+        """Result of a context call, or the default if it failed."""
+        try:
+            return future.result()
+        except Exception as e:
+            logger.warning(f"AI context analysis failed: {str(e)}")
+            return default
+
+    def _pack_texts(self, texts: List[str]) -> List[List[int]]:
+        """Group text indexes into documents of at most max_document_chars characters."""
+        documents = []
+        current = []
+        size = 0
+        for i, text in enumerate(texts):
+            added = len(text) + (len(DOCUMENT_SEPARATOR) if current else 0)
+            if current and size + added > self.max_document_chars:
+                documents.append(current)
+                current = []
+                size = 0
+                added = len(text)
+            current.append(i)
+            size += added
+        if current:
+            documents.append(current)
+        return documents
+
+    def _split_findings(self, entities: List[Dict[str, Any]], texts: List[str], starts: List[int]) -> List[List[Dict[str, Any]]]:
+        """
+        Map entities of a packed document back to its texts: one finding per
+        entity and text, at the entity's first mention in that text.
+        """
+        content = DOCUMENT_SEPARATOR.join(texts)
+        findings = [[] for _ in texts]
+        for entity in entities:
+            # Map Google entity types to PHI types
+            phi_type = self._map_entity_to_phi(entity['type'])
+            if not phi_type:
+                continue
+
+            mentions = entity.get('mentions') or [{'text': entity['name'], 'offset': content.find(entity['name'])}]
+            seen = set()
+            for mention in mentions:
+                if mention['offset'] < 0:
+                    continue
+                i = bisect.bisect_right(starts, mention['offset']) - 1
+                start = mention['offset'] - starts[i]
+                end = start + len(mention['text'])
+                # Skip mentions that run into the separator or the next text
+                if i in seen or end > len(texts[i]):
+                    continue
+                seen.add(i)
+                findings[i].append({
+                    'type': phi_type,
+                    'value': mention['text'],
+                    'start': start,
+                    'end': end,
+                    'confidence': entity['salience'],
+                    'metadata': entity.get('metadata', {})
+                })
+        return findings
+
+    def close(self):
+        """Stop the worker threads."""
+        self.executor.shutdown(wait=False)
 
-    def _analyze_medical_context(self, findings: List[Dict], sentiment: Any, categories: List) -> Dict[str, Any]:
+    def _analyze_medical_context(self, findings: List[Dict], sentiment: Any, categories: List[str]) -> Dict[str, Any]:
         """
         Analyze medical context of the findings.
         """
         context = {
-            'is_medical_content': any('health' in cat.name.lower() or 'medical' in cat.name.lower() 
-                                    for cat in categories),
+            'is_medical_content': any('health' in name.lower() or 'medical' in name.lower() 
+                                    for name in categories),
             'potential_diagnosis': False,
             'contains_measurements': False,
             'contains_medications': False
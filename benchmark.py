@@ -0,0 +1,473 @@
+import json
+import argparse
+import timeit
+import logging
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_NOTE = (
+    "Patient John Smith (MRN: 12345678) was seen by Dr. Alice Walker MD on 03/14/2023. "
+    "Pt# 556677 reports intermittent chest pain radiating to the left arm. "
+    "SSN 123-45-6789, phone (555) 123-4567, email john.smith@example.com. "
+    "Lives at 123 Main Street, Springfield, zip 62704. Age: 67 years old. "
+    "NPI 1234567890. Insurance ID ABC123456, Group Number GRP1234. Device ID DEV-12345. "
+)
+
+SAMPLE_PROSE = (
+    "The patient presented with intermittent discomfort associated with mild dyspnea on exertion. "
+    "Review of systems otherwise negative. Physical examination revealed a well-appearing adult "
+    "in no acute distress; lungs clear to auscultation bilaterally. Continue current regimen. "
+)
+
+
+def make_clinical_note(size_kb=20):
+    """Build a synthetic clinical note of roughly the given size, mostly prose with PHI mixed in."""
+    block = SAMPLE_PROSE * 6 + SAMPLE_NOTE
+    return (block * (size_kb * 1024 // len(block) + 1))[:size_kb * 1024]
+
+
+def _best_time(func, number, repeat):
+    """Best wall-clock time of a single call, in seconds."""
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def bench_phi_scanner(size_kb=20, number=5, repeat=5):
+    """Compare pattern detection throughput of the per-pattern loop and the prefiltered scanner."""
+    from phi_detector import PHIDetector
+
+    text = make_clinical_note(size_kb)
+    megabytes = len(text.encode('utf-8')) / (1024 * 1024)
+    legacy = PHIDetector(use_scanner=False)
+    scanner = PHIDetector(use_scanner=True)
+
+    if legacy._find_pattern_matches(text) != scanner._find_pattern_matches(text):
+        raise AssertionError("Scanner findings differ from the per-pattern loop")
+
+    results = {}
+    for label, detector in (('per-pattern loop', legacy), ('scanner', scanner)):
+        seconds = _best_time(lambda: detector._find_pattern_matches(text), number, repeat)
+        results[label] = megabytes / seconds
+        print(f"{label:<20} {seconds * 1000:8.2f} ms  {results[label]:8.2f} MB/s")
+    return results
+
+
+def make_column_sample(rows=1000):
+    """Build a sample of short free-text values like those drawn from a notes column."""
+    sentences = [sentence.strip() + '.' for sentence in (SAMPLE_NOTE + SAMPLE_PROSE).split('. ') if sentence.strip()]
+    return [' '.join(sentences[(i + j) % len(sentences)] for j in range(3)) for i in range(rows)]
+
+
+def bench_phi_batch(rows=1000, number=3, repeat=3):
+    """Compare per-value detect_phi calls with one detect_phi_batch call over a column sample."""
+    import pandas as pd
+    from phi_detector import PHIDetector
+
+    values = make_column_sample(rows)
+    series = pd.Series(values, dtype=object)
+    detector = PHIDetector()
+
+    per_value = _best_time(lambda: [detector.detect_phi(value) for value in values], number, repeat)
+    batch = _best_time(lambda: detector.detect_phi_batch(series), number, repeat)
+    print(f"{'per-value detect_phi':<20} {per_value * 1000:8.2f} ms  {rows / per_value:10.0f} rows/s")
+    print(f"{'detect_phi_batch':<20} {batch * 1000:8.2f} ms  {rows / batch:10.0f} rows/s")
+    return {'per-value detect_phi': rows / per_value, 'detect_phi_batch': rows / batch}
+
+
+SAMPLE_COMMENTS = [
+    "Pt tolerated procedure well, no complications.",
+    "Follow up in two weeks with primary care.",
+    "Left voicemail, call back at 555-123-4567.",
+    "Medication reconciled; no changes to current regimen.",
+    "Discharged home in stable condition.",
+    "Referred to cardiology for further evaluation.",
+    "Labs drawn, results pending.",
+    "Patient requests copy of records sent to jane.doe@example.com.",
+]
+
+
+def bench_phi_prefilter(rows=5000, number=3, repeat=3):
+    """Compare per-value detection on a short free-text column with and without the prefilter."""
+    from phi_detector import PHIDetector
+
+    values = [SAMPLE_COMMENTS[i % len(SAMPLE_COMMENTS)] for i in range(rows)]
+    without_prefilter = PHIDetector(use_prefilter=False)
+    with_prefilter = PHIDetector(use_prefilter=True)
+
+    results = {}
+    for label, detector in (('no prefilter', without_prefilter), ('prefilter', with_prefilter)):
+        seconds = _best_time(lambda: [detector._find_pattern_matches(value) for value in values], number, repeat)
+        results[label] = rows / seconds
+        print(f"{label:<20} {seconds * 1000:8.2f} ms  {results[label]:10.0f} rows/s")
+
+    stats = with_prefilter.get_prefilter_stats()
+    print(f"prefilter skipped {stats['patterns_skipped']} of {stats['patterns_run'] + stats['patterns_skipped']} "
+          f"pattern runs ({stats['skip_rate']:.0%})")
+    return results
+
+
+def bench_phi_cache(rows=5000, distinct=200, number=3, repeat=3):
+    """Compare column analysis of a column with many repeated values with and without the result cache."""
+    from phi_detector import PHIDetector
+
+    values = make_column_sample(distinct)
+    values = [values[i % distinct] for i in range(rows)]
+    uncached = PHIDetector()
+    cached = PHIDetector(cache_size=10000)
+
+    results = {}
+    for label, detector in (('no cache', uncached), ('cache', cached)):
+        seconds = _best_time(lambda: detector.analyze_database_column('notes', values), number, repeat)
+        results[label] = rows / seconds
+        print(f"{label:<20} {seconds * 1000:8.2f} ms  {results[label]:10.0f} rows/s")
+
+    stats = cached.get_cache_stats()
+    print(f"cache hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries, {stats['memory_bytes'] / 1024:.0f} KiB")
+    return results
+
+
+def bench_ai_batch(rows=100, latency=0.02, concurrency=8):
+    """Compare serial per-text AI analysis with packed, concurrent analysis against a stub backend."""
+    import time
+    from ai_backends import StubBackend
+    from ai_service import AIPhiDetector
+
+    texts = make_column_sample(rows)
+    results = {}
+    setups = (
+        ('serial per-text', dict(max_concurrency=1, max_document_chars=0), 'analyze_medical_text'),
+        ('concurrent', dict(max_concurrency=concurrency, max_document_chars=0), 'analyze_medical_texts'),
+        ('packed concurrent', dict(max_concurrency=concurrency), 'analyze_medical_texts'),
+    )
+    for label, options, method in setups:
+        backend = StubBackend(latency=latency)
+        detector = AIPhiDetector(backend=backend, **options)
+        started = time.perf_counter()
+        if method == 'analyze_medical_text':
+            for text in texts:
+                detector.analyze_medical_text(text)
+        else:
+            detector.analyze_medical_texts(texts)
+        seconds = time.perf_counter() - started
+        detector.close()
+        results[label] = rows / seconds
+        print(f"{label:<20} {seconds * 1000:8.2f} ms  {results[label]:10.0f} rows/s  "
+              f"{sum(backend.calls.values())} calls")
+    return results
+
+
+def make_structured_table(rows=10000, seed=0):
+    """Build columns of a wide, mostly structured EHR table (identifiers, contact details, codes)."""
+    import random
+
+    rnd = random.Random(seed)
+    first_names = ['John', 'Mary', 'Alice', 'Robert', 'Maria', 'James', 'Linda', 'David']
+    last_names = ['Smith', 'Walker', 'Nguyen', 'Johnson', 'Brown', 'Garcia', 'Miller']
+    return {
+        'ssn': [f"{rnd.randint(100, 999)}-{rnd.randint(10, 99)}-{rnd.randint(1000, 9999)}" for _ in range(rows)],
+        'phone': [f"({rnd.randint(200, 999)}) {rnd.randint(200, 999)}-{rnd.randint(1000, 9999)}" for _ in range(rows)],
+        'zip': [str(rnd.randint(10000, 99999)) for _ in range(rows)],
+        'patient_name': [f"{rnd.choice(first_names)} {rnd.choice(last_names)}" for _ in range(rows)],
+        'birth_date': [f"{rnd.randint(1, 12):02d}/{rnd.randint(1, 28):02d}/{rnd.randint(1930, 2020)}" for _ in range(rows)],
+        'email': [f"{rnd.choice(first_names).lower()}{rnd.randint(1, 999)}@example.com" for _ in range(rows)],
+        'status_code': [rnd.choice(['A', 'I', 'P']) + str(rnd.randint(10, 99)) for _ in range(rows)],
+    }
+
+
+def bench_column_profile(rows=10000, number=1, repeat=3):
+    """Compare column analysis of a structured table with and without shape profiling."""
+    from phi_detector import PHIDetector
+
+    table = make_structured_table(rows)
+    detector = PHIDetector()
+
+    results = {}
+    for label, use_profile in (('row-by-row scan', False), ('shape profile', True)):
+        seconds = _best_time(
+            lambda: [detector.analyze_database_column(name, values, use_profile=use_profile)
+                     for name, values in table.items()],
+            number, repeat
+        )
+        results[label] = len(table) * rows / seconds
+        print(f"{label:<20} {seconds * 1000:8.2f} ms  {results[label]:10.0f} values/s")
+    return results
+
+
+class BenchmarkRule:
+    """Stand-in for a DeidentRule row: the config is stored as JSON text."""
+
+    def __init__(self, name, rule_type, config):
+        self.name = name
+        self.rule_type = rule_type
+        self.config = json.dumps(config)
+
+    def get_config(self):
+        return json.loads(self.config)
+
+
+def make_rules(count=50):
+    """Build rules with table and column patterns like those of a real rule set."""
+    columns = ['ssn', 'phone', 'email', 'zip', 'dob', 'birth_date', 'first_name', 'last_name', 'address', 'mrn']
+    return [
+        BenchmarkRule(f"rule {i}", 'hash', {
+            'tables': [f"^(patient|person|encounter)s?_?{i % 7}", r'.*_hist$'],
+            'columns': [f"^{columns[i % len(columns)]}", f".*{columns[(i + 3) % len(columns)]}.*"]
+        })
+        for i in range(count)
+    ]
+
+
+def bench_rule_plan(tables=300, columns=80, rules=50, number=1, repeat=3):
+    """Compare rule matching per (table, column, rule) with compiling a RulePlan index."""
+    from rule_engine import RuleEngine
+    from rule_plan import RulePlan
+
+    rule_set = make_rules(rules)
+    names = ['ssn', 'phone', 'email', 'zip', 'dob', 'first_name', 'last_name', 'address', 'mrn', 'notes']
+    table_columns = {
+        f"{'patient' if t % 3 == 0 else 'lab'}_{t}": [f"{names[c % len(names)]}_{c}" for c in range(columns)]
+        for t in range(tables)
+    }
+    engine = RuleEngine()
+
+    def match_each():
+        return {
+            (table_name, column_name): [rule.name for rule in rule_set
+                                        if engine.column_matches_rule(table_name, column_name, rule)]
+            for table_name, column_names in table_columns.items()
+            for column_name in column_names
+        }
+
+    def compile_plan():
+        plan = RulePlan.compile(rule_set, table_columns)
+        return {key: [rule.name for rule in plan.rules_for(*key)]
+                for key in ((table_name, column_name)
+                            for table_name, column_names in table_columns.items()
+                            for column_name in column_names)}
+
+    if match_each() != compile_plan():
+        raise AssertionError("Rule plan differs from per-column rule matching")
+
+    results = {}
+    for label, func in (('match per column', match_each), ('compiled plan', compile_plan)):
+        seconds = _best_time(func, number, repeat)
+        results[label] = seconds
+        print(f"{label:<20} {seconds * 1000:8.2f} ms")
+    return results
+
+
+def bench_rule_factorize(rows=1000000, distinct=5000, number=1, repeat=3):
+    """Compare row-by-row transformers with transforming each distinct value once."""
+    import numpy as np
+    import pandas as pd
+    from rule_engine import RuleEngine
+
+    rng = np.random.default_rng(0)
+    zipcodes = pd.Series(rng.integers(10000, 99999, distinct).astype(str))
+    column = zipcodes.iloc[rng.integers(0, distinct, rows)].reset_index(drop=True)
+    engine = RuleEngine()
+
+    results = {}
+    for rule in (BenchmarkRule('zip', 'zipcode_truncate', {}), BenchmarkRule('hash', 'hash', {})):
+        if not engine.apply_rule(column, rule, factorize=False).equals(engine.apply_rule(column, rule)):
+            raise AssertionError(f"Factorized {rule.rule_type} differs from the row-by-row transform")
+        for label, factorize in (('row by row', False), ('factorized', True)):
+            seconds = _best_time(lambda: engine.apply_rule(column, rule, factorize=factorize), number, repeat)
+            results[f"{rule.rule_type} {label}"] = rows / seconds
+            print(f"{rule.rule_type + ' ' + label:<30} {seconds * 1000:8.2f} ms  {rows / seconds:12.0f} rows/s")
+    return results
+
+
+def bench_rule_dates(rows=20000, number=1, repeat=1):
+    """Compare row-by-row date offset and generalization with the vectorized date engine."""
+    import numpy as np
+    import pandas as pd
+    from rule_engine import RuleEngine
+
+    rng = np.random.default_rng(0)
+    dates = pd.Timestamp('1940-01-01') + pd.to_timedelta(rng.integers(0, 30000, rows), unit='D')
+    column = pd.Series(dates.strftime('%m/%d/%Y'), dtype=object)
+    column[rng.random(rows) < 0.05] = None
+    engine = RuleEngine()
+
+    if not engine._transform_date_generalization(column, {'level': 'month'}).equals(
+            engine._generalize_dates_by_row(column, 'month')):
+        raise AssertionError("Vectorized date generalization differs from the row-by-row transform")
+
+    cases = (
+        ('offset row by row', lambda: engine._offset_dates_by_row(column, -30, 30, 42)),
+        ('offset vectorized', lambda: engine._transform_date_offset(column, {})),
+        ('month row by row', lambda: engine._generalize_dates_by_row(column, 'month')),
+        ('month vectorized', lambda: engine._transform_date_generalization(column, {'level': 'month'})),
+    )
+    results = {}
+    for label, func in cases:
+        seconds = _best_time(func, number, repeat)
+        results[label] = rows / seconds
+        print(f"{label:<20} {seconds * 1000:10.2f} ms  {rows / seconds:12.0f} rows/s")
+    return results
+
+
+def bench_rule_random(rows=1000000, number=1, repeat=3):
+    """Compare per-row random surrogates (the old random.randint/choice lambdas) with keyed array draws."""
+    import random
+    import numpy as np
+    import pandas as pd
+    from rule_engine import RuleEngine
+
+    rng = np.random.default_rng(0)
+    integers = pd.Series(rng.integers(0, rows, rows), dtype='Int64')
+    integers[rng.random(rows) < 0.05] = pd.NA
+    strings = pd.Series([f"MRN{value:09d}" for value in rng.integers(0, rows, rows)], dtype=object)
+    chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+    engine = RuleEngine()
+
+    cases = (
+        ('integers per row', lambda: integers.apply(lambda x: random.randint(0, 1000) if pd.notna(x) else x)),
+        ('integers keyed', lambda: engine._transform_random_value(integers, {})),
+        ('strings per row', lambda: strings.apply(lambda x: ''.join(random.choice(chars) for _ in range(8)))),
+        ('strings keyed', lambda: engine._transform_random_value(strings, {})),
+    )
+    results = {}
+    for label, func in cases:
+        seconds = _best_time(func, number, repeat)
+        results[label] = rows / seconds
+        print(f"{label:<20} {seconds * 1000:10.2f} ms  {rows / seconds:12.0f} rows/s")
+    return results
+
+
+def bench_rule_masks(rows=1000000, number=1, repeat=1):
+    """Compare row-by-row phone, email and ZIP masks with the string-accessor ones (rows=10000000 for 10M)."""
+    import numpy as np
+    import pandas as pd
+    from rule_engine import RuleEngine
+
+    rng = np.random.default_rng(0)
+    numbers = rng.integers(0, 10 ** 10, rows)
+    phones = pd.Series([f"({n // 10 ** 7:03d}) {n // 10 ** 4 % 1000:03d}-{n % 10 ** 4:04d}" for n in numbers], dtype=object)
+    emails = pd.Series([f"user{n % 1000003}@example{n % 97}.org" for n in numbers], dtype=object)
+    zips = pd.Series([f"{n % 100000:05d}-{n % 10000:04d}" for n in numbers], dtype=object)
+    for column in (phones, emails, zips):
+        column[rng.random(rows) < 0.05] = None
+    engine = RuleEngine()
+
+    cases = (
+        ('phone', lambda: engine._mask_phones_by_row(phones, 'XXX-XXX-{last4}'),
+         lambda: engine._transform_phone(phones, {})),
+        ('email', lambda: engine._mask_emails_by_row(emails, {}),
+         lambda: engine._transform_email(emails, {})),
+        ('zip', lambda: engine._truncate_zips_by_row(zips),
+         lambda: engine._transform_zipcode(zips, {})),
+    )
+    results = {}
+    for label, by_row, vectorized in cases:
+        if not by_row().equals(vectorized()):
+            raise AssertionError(f"Vectorized {label} mask differs from the row-by-row transform")
+        for mode, func in (('row by row', by_row), ('vectorized', vectorized)):
+            seconds = _best_time(func, number, repeat)
+            results[f"{label} {mode}"] = rows / seconds
+            print(f"{label + ' ' + mode:<20} {seconds * 1000:10.2f} ms  {rows / seconds:12.0f} rows/s")
+    return results
+
+
+def bench_rule_redaction(rows=5000, size_kb=1, number=1, repeat=3):
+    """Compare sequential re.sub text redaction with the single-pass redactor on a notes column."""
+    import re
+    import pandas as pd
+    from phi_detector import PHIDetector
+    from rule_engine import RuleEngine
+
+    note = make_clinical_note(size_kb)
+    notes = pd.Series([f"Visit {i}. {note}" for i in range(rows)], dtype=object)
+    patterns = [pattern for category in ('ssn', 'phone', 'email', 'date', 'zipcode', 'medical_record',
+                                         'provider_id', 'insurance') for pattern in PHIDetector().patterns[category]]
+    engine = RuleEngine()
+
+    def sequential():
+        def redact_text(text):
+            for pattern in patterns:
+                text = re.sub(pattern, '[REDACTED]', text)
+            return text
+        return notes.apply(redact_text)
+
+    cases = (
+        (f'{len(patterns)} patterns re.sub', sequential),
+        (f'{len(patterns)} patterns 1 pass', lambda: engine._transform_text_redaction(notes, {'patterns': patterns})),
+        ('all PHI types', lambda: engine._transform_text_redaction(notes, {'phi_types': 'all'})),
+    )
+    megabytes = notes.str.len().sum() / (1024 * 1024)
+    results = {}
+    for label, func in cases:
+        seconds = _best_time(func, number, repeat)
+        results[label] = megabytes / seconds
+        print(f"{label:<22} {seconds * 1000:10.2f} ms  {results[label]:8.2f} MB/s")
+    return results
+
+
+def bench_bulk_write(rows=200000, batch_sizes=(1000, 10000, 50000), number=1, repeat=3):
+    """Compare pandas to_sql with BulkWriter batch sizes, writing to a temporary SQLite database."""
+    import os
+    import tempfile
+    import numpy as np
+    import pandas as pd
+    from db_connector import DatabaseConnector
+    from bulk_writer import BulkWriter
+
+    rng = np.random.default_rng(0)
+    chunk = pd.DataFrame({
+        'id': np.arange(rows),
+        'name': [f"Patient {i}" for i in range(rows)],
+        'visit_date': pd.Timestamp('2020-01-01') + pd.to_timedelta(rng.integers(0, 3650, rows), unit='D'),
+        'score': rng.random(rows),
+    })
+
+    with tempfile.TemporaryDirectory() as directory:
+        connector = DatabaseConnector('sqlite', None, None, os.path.join(directory, 'bench.db'), None, None)
+        connector.connect()
+
+        cases = [('to_sql', lambda: chunk.to_sql(name='bench', con=connector.engine, if_exists='replace', index=False))]
+        for batch_size in batch_sizes:
+            cases.append((f'bulk batch={batch_size}',
+                          lambda batch_size=batch_size: BulkWriter(connector, batch_size=batch_size).write('bench', chunk)))
+
+        results = {}
+        for label, func in cases:
+            seconds = _best_time(func, number, repeat)
+            results[label] = rows / seconds
+            print(f"{label:<20} {seconds * 1000:10.2f} ms  {rows / seconds:12.0f} rows/s")
+        connector.engine.dispose()
+    return results
+
+
+BENCHMARKS = {
+    'phi_scanner': bench_phi_scanner,
+    'phi_batch': bench_phi_batch,
+    'phi_prefilter': bench_phi_prefilter,
+    'phi_cache': bench_phi_cache,
+    'ai_batch': bench_ai_batch,
+    'column_profile': bench_column_profile,
+    'rule_plan': bench_rule_plan,
+    'rule_factorize': bench_rule_factorize,
+    'rule_dates': bench_rule_dates,
+    'rule_random': bench_rule_random,
+    'rule_masks': bench_rule_masks,
+    'rule_redaction': bench_rule_redaction,
+    'bulk_write': bench_bulk_write,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run de-identification micro-benchmarks")
+    parser.add_argument('names', nargs='*', help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    args = parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(unknown)}")
+
+    for name in args.names or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+import os
+import json
+import socket
+import logging
+import datetime
+import threading
+from typing import List, Dict, Optional, Tuple
+from app import app, db
+from models import ProcessCheckpoint, ProcessLog
+
+logger = logging.getLogger(__name__)
+
+# A running process beats every HEARTBEAT_SECONDS; one that missed HEARTBEAT_MISSES beats stopped with its server
+HEARTBEAT_SECONDS = int(os.environ.get('DEID_HEARTBEAT_SECONDS', 30))
+HEARTBEAT_MISSES = 4
+
+
+def _dump(value) -> Optional[str]:
+    return json.dumps(value, default=str) if value is not None else None
+
+
+def _load(value: Optional[str]):
+    return json.loads(value) if value else None
+
+
+def _pid_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def is_alive(process_log) -> bool:
+    """
+    Whether a 'running' process is still run by its server: its heartbeat is
+    recent, and its owner process is still there if it ran on this host. A
+    process left 'running' by a server that stopped (e.g. was restarted) is not,
+    and can be resumed.
+    """
+    if process_log.status != 'running' or process_log.heartbeat_at is None:
+        return False
+    if process_log.owner_host == socket.gethostname() and process_log.owner_pid:
+        if not _pid_running(process_log.owner_pid):
+            return False
+    silence = datetime.datetime.utcnow() - process_log.heartbeat_at
+    return silence < datetime.timedelta(seconds=HEARTBEAT_SECONDS * HEARTBEAT_MISSES)
+
+
+class Heartbeat:
+    """
+    Marks a ProcessLog as run by this server process (host and pid) for the
+    duration of a with block, and updates its heartbeat every seconds from a
+    background thread meanwhile. Must be entered in the app context.
+    """
+
+    def __init__(self, process_log, seconds: int = HEARTBEAT_SECONDS):
+        self.process_log = process_log
+        self.seconds = seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.process_log.owner_host = socket.gethostname()
+        self.process_log.owner_pid = os.getpid()
+        self.process_log.heartbeat_at = datetime.datetime.utcnow()
+        db.session.commit()
+        self._thread = threading.Thread(target=self._beat, args=(self.process_log.id,),
+                                        name=f"heartbeat-{self.process_log.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _beat(self, process_id: int):
+        while not self._stop.wait(self.seconds):
+            with app.app_context():
+                try:
+                    ProcessLog.query.filter_by(id=process_id).update({'heartbeat_at': datetime.datetime.utcnow()})
+                    db.session.commit()
+                except Exception as e:
+                    logger.warning(f"Could not update the heartbeat of process {process_id}: {str(e)}")
+                    db.session.rollback()
+
+
+class CheckpointStore:
+    """
+    Durable progress of a de-identification run, kept as ProcessCheckpoint rows
+    of its ProcessLog: one per table, or per key range of a partitioned table,
+    with its status, rows written and the primary key of the last row written.
+    Checkpoints only apply to a run with the same rule plan; those of another
+    plan are discarded. Must be used in the app context.
+    """
+
+    def __init__(self, process_id: int, rule_plan_hash: str):
+        self.process_id = process_id
+        self.rule_plan_hash = rule_plan_hash
+        self.units = {}
+        checkpoints = ProcessCheckpoint.query.filter_by(process_id=process_id).all()
+        if any(checkpoint.rule_plan_hash != rule_plan_hash for checkpoint in checkpoints):
+            logger.warning(f"Rules of process {process_id} changed since its checkpoints, starting over")
+            for checkpoint in checkpoints:
+                db.session.delete(checkpoint)
+            db.session.commit()
+            checkpoints = []
+        for checkpoint in checkpoints:
+            self.units.setdefault(checkpoint.table_name, {})[checkpoint.partition] = checkpoint
+
+    def register(self, table_name: str, partitions: Optional[List[tuple]] = None):
+        """Add pending checkpoints for a table, or for each of its (where, params) partitions."""
+        units = self.units[table_name] = {}
+        for index, (where, params) in (enumerate(partitions) if partitions else [(None, (None, None))]):
+            units[index] = ProcessCheckpoint(
+                process_id=self.process_id,
+                table_name=table_name,
+                partition=index,
+                partition_where=where,
+                partition_params=_dump(params),
+                rule_plan_hash=self.rule_plan_hash
+            )
+            db.session.add(units[index])
+        db.session.commit()
+
+    def reset(self, table_name: str):
+        """Forget the checkpoints of a table, so it is processed from scratch."""
+        for checkpoint in self.units.pop(table_name, {}).values():
+            db.session.delete(checkpoint)
+        db.session.commit()
+
+    def record(self, table_name: str, partition: Optional[int], last_key, rows: int, completed: bool):
+        """Record a chunk written (rows, and the key of its last row), or the table or partition completed."""
+        checkpoint = self.units.get(table_name, {}).get(partition)
+        if checkpoint is None:
+            return
+        checkpoint.status = 'completed' if completed else 'running'
+        if rows:
+            checkpoint.rows_written += rows
+            checkpoint.chunks_written += 1
+        if last_key is not None:
+            checkpoint.last_key = _dump(last_key)
+        db.session.commit()
+
+    def plan(self, deidentifier, tables: List[str],
+             partitions: Dict[str, List[tuple]]) -> Tuple[List[str], Dict[str, List[tuple]], Dict[str, Dict]]:
+        """
+        Work left for a run of tables, from the checkpoints: the tables to
+        process, their partitions and, for tables to continue, {table: {partition
+        index (None for a whole table): {'after': last key}}} with only the units
+        not completed. Completed tables are left out. Tables without checkpoints,
+        with nothing written yet or without a checkpoint_key to resume on are
+        processed from scratch. New partitions apply only to those tables; the
+        others keep the ranges they were checkpointed with.
+        """
+        todo = []
+        partitions = dict(partitions)
+        resume = {}
+        for table_name in tables:
+            units = self.units.get(table_name)
+            if units and all(checkpoint.status == 'completed' for checkpoint in units.values()):
+                logger.info(f"Skipping table {table_name}: completed before")
+                partitions.pop(table_name, None)
+                continue
+
+            todo.append(table_name)
+            written = units and sum(checkpoint.rows_written or 0 for checkpoint in units.values())
+            if written and deidentifier.checkpoint_key(table_name) is not None:
+                stored = sorted((index, checkpoint) for index, checkpoint in units.items() if index is not None)
+                if stored:
+                    partitions[table_name] = [(checkpoint.partition_where, _load(checkpoint.partition_params))
+                                              for _, checkpoint in stored]
+                else:
+                    partitions.pop(table_name, None)
+                resume[table_name] = {
+                    index: {'after': _load(checkpoint.last_key)}
+                    for index, checkpoint in units.items() if checkpoint.status != 'completed'
+                }
+                logger.info(f"Resuming table {table_name} after {written} rows")
+                continue
+
+            if units:
+                logger.info(f"Restarting table {table_name}")
+                self.reset(table_name)
+            self.register(table_name, partitions.get(table_name))
+        return todo, partitions, resume
+
+    def rows_written(self) -> int:
+        """Rows written in all the attempts of the run."""
+        return sum(checkpoint.rows_written or 0 for units in self.units.values() for checkpoint in units.values())
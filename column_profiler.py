@@ -0,0 +1,70 @@
+import string
+import logging
+from typing import Dict, Any
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Digits map to 0; everything else is kept, letters included, since detection
+# patterns are anchored on keywords ('Pt', 'NPI') that a shape must not merge
+SHAPE_TABLE = str.maketrans(string.digits, '0' * 10)
+
+# A column is profiled as structured when 95% of its values have at most this many
+# words and characters, and its values share few enough shapes
+MAX_STRUCTURED_WORDS = 4
+MAX_STRUCTURED_LENGTH = 64
+MAX_SHAPE_RATIO = 0.5
+
+
+def shape_signatures(values: pd.Series) -> pd.Series:
+    """Shape signature of each value, e.g. '123-45-6789' -> '000-00-0000', 'MRN 12345' -> 'MRN 00000'."""
+    return values.str.translate(SHAPE_TABLE)
+
+
+def profile_column(values: pd.Series, top: int = 5) -> Dict[str, Any]:
+    """
+    Profile a column sample by the shapes of its values.
+
+    Returns 'kind' ('structured' or 'free_text'), a summary of the dominant
+    shapes, and the shape histogram as 'shape_counts' (a Series, most common
+    first) with the first value of each shape in 'representatives'.
+    """
+    values = values.astype(str)
+    total = len(values)
+    shapes = shape_signatures(values)
+    shape_counts = shapes.value_counts()
+
+    if total:
+        length_p95 = float(values.str.len().quantile(0.95))
+        words_p95 = float(values.map(lambda value: len(value.split())).quantile(0.95))
+        shape_ratio = len(shape_counts) / total
+    else:
+        length_p95 = words_p95 = shape_ratio = 0.0
+
+    structured = (
+        total > 0
+        and words_p95 <= MAX_STRUCTURED_WORDS
+        and length_p95 <= MAX_STRUCTURED_LENGTH
+        and shape_ratio <= MAX_SHAPE_RATIO
+    )
+
+    representatives = pd.Series(values.to_numpy(), index=shapes.to_numpy())
+    representatives = representatives[~representatives.index.duplicated()].reindex(shape_counts.index)
+
+    return {
+        'kind': 'structured' if structured else 'free_text',
+        'distinct_shapes': len(shape_counts),
+        'dominant_shapes': [
+            {'shape': shape, 'share': count / total}
+            for shape, count in shape_counts.head(top).items()
+        ],
+        'length_p95': length_p95,
+        'words_p95': words_p95,
+        'shape_counts': shape_counts,
+        'representatives': representatives
+    }
+
+
+def profile_summary(profile: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-serializable part of a profile (without the shape histogram)."""
+    return {key: value for key, value in profile.items() if key not in ('shape_counts', 'representatives')}
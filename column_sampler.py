@@ -0,0 +1,149 @@
+import math
+import random
+import logging
+from statistics import NormalDist
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+def wilson_interval(successes: float, n: int, z: float) -> Tuple[float, float]:
+    """Wilson score interval for a proportion of successes out of n."""
+    if n <= 0:
+        return 0.0, 1.0
+    p = min(1.0, successes / n)
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+class Reservoir:
+    """Uniform random sample of at most `size` distinct items from a stream (Algorithm R)."""
+
+    def __init__(self, size: int, rng: random.Random):
+        self.size = size
+        self.rng = rng
+        self.items = []
+        self.seen = 0
+
+    def add(self, item):
+        if item in self.items:
+            return
+        self.seen += 1
+        if len(self.items) < self.size:
+            self.items.append(item)
+        else:
+            slot = self.rng.randrange(self.seen)
+            if slot < self.size:
+                self.items[slot] = item
+
+
+class ColumnStats:
+    """
+    Running PHI statistics for one column, fed with findings frames batch by
+    batch. Memory is constant per PHI type: counters plus reservoirs of
+    examples and contexts.
+    """
+
+    def __init__(self, examples: int = 3, seed: int = 0):
+        self.examples = examples
+        self.rng = random.Random(seed)
+        self.total_rows = 0
+        self.types = {}
+
+    def add(self, findings: pd.DataFrame, rows: int):
+        """
+        Add a batch of `rows` values and its findings frame, which needs 'row'
+        and 'weight' (the number of values a finding stands for) besides the
+        detect_phi_batch columns.
+        """
+        self.total_rows += rows
+        if findings.empty:
+            return
+
+        rows_with_type = findings.drop_duplicates(['row', 'type']).groupby('type', sort=False)['weight'].sum()
+        for phi_type, group in findings.groupby('type', sort=False):
+            stats = self.types.get(phi_type)
+            if stats is None:
+                stats = self.types[phi_type] = {
+                    'findings': 0,
+                    'rows': 0,
+                    'confidence_sum': 0.0,
+                    'example_values': Reservoir(self.examples, self.rng),
+                    'contexts': Reservoir(self.examples, self.rng)
+                }
+            weights = group['weight']
+            stats['findings'] += int(weights.sum())
+            stats['rows'] += int(rows_with_type[phi_type])
+            stats['confidence_sum'] += float((group['confidence'] * weights).sum())
+            for value in group['value']:
+                stats['example_values'].add(value)
+            for context in group['context'].dropna():
+                if context != '':
+                    stats['contexts'].add(context)
+
+    def max_half_width(self, z: float) -> float:
+        """Widest confidence interval half-width over the seen PHI types and an unseen one."""
+        counts = [stats['rows'] for stats in self.types.values()] + [0]
+        widths = []
+        for count in counts:
+            low, high = wilson_interval(count, self.total_rows, z)
+            widths.append((high - low) / 2)
+        return max(widths)
+
+    def phi_types(self, z: float) -> List[Dict[str, Any]]:
+        """Per-type statistics in the format of PHIDetector.analyze_database_column."""
+        results = []
+        for phi_type, stats in self.types.items():
+            low, high = wilson_interval(stats['rows'], self.total_rows, z)
+            results.append({
+                'type': phi_type,
+                'frequency': stats['findings'] / self.total_rows,
+                'avg_confidence': stats['confidence_sum'] / stats['findings'],
+                'example_values': list(stats['example_values'].items),
+                'contexts': list(stats['contexts'].items),
+                'row_share': stats['rows'] / self.total_rows,
+                'confidence_interval': [low, high]
+            })
+        return results
+
+
+def growing_batches(chunks: Iterable[Iterable[Any]], first_batch: int = 40, max_rows: int = 1000) -> Iterator[pd.Series]:
+    """
+    Re-cut chunks of values (e.g. the DataFrame column chunks of a streamed
+    query) into batches of first_batch, 2 * first_batch, ... values, up to
+    max_rows values in total. Stops pulling chunks once max_rows is reached.
+    """
+    size = first_batch
+    remaining = max_rows
+    buffer = []
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while remaining > 0 and len(buffer) >= min(size, remaining):
+            take = min(size, remaining)
+            yield pd.Series(buffer[:take], dtype=object)
+            del buffer[:take]
+            remaining -= take
+            size *= 2
+        if remaining <= 0:
+            return
+    if buffer and remaining > 0:
+        yield pd.Series(buffer[:remaining], dtype=object)
+
+
+def z_score(confidence: float) -> float:
+    """Two-sided normal quantile for a confidence level, e.g. 1.96 for 0.95."""
+    return NormalDist().inv_cdf((1 + confidence) / 2)
+
+
+def rows_to_detect(share: float, confidence: float) -> int:
+    """
+    Rows to read to see, with the given confidence, at least one row of a type
+    found in `share` of the rows: ln(1 / (1 - confidence)) / share, about 3 / share
+    at 95% (the rule of three).
+    """
+    if share <= 0:
+        return 0
+    return math.ceil(math.log(1 / (1 - confidence)) / share)
@@ -1,8 +1,11 @@
 import os
+import random
+import numbers
 import pandas as pd
 import logging
 from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.types import Integer
 import pyodbc
 import psycopg2
 from mysql import connector
@@ -31,6 +34,18 @@ class DatabaseConnector:
         self.connection_string = None
         self._create_connection_string()
 
+    def get_connection_params(self):
+        """Constructor arguments of this connector, e.g. to open the same database in another process."""
+        return dict(
+            db_type=self.db_type,
+            host=self.host,
+            port=self.port,
+            database=self.database,
+            username=self.username,
+            password=self.password,
+            **self.kwargs
+        )
+
     def _create_connection_string(self):
         """Create the appropriate connection string based on database type."""
         if self.db_type == 'mysql':
@@ -138,6 +153,418 @@ class DatabaseConnector:
             logger.error(f"Query execution error: {str(e)}")
             return pd.DataFrame()
 
+    def iter_query(self, query, params=None, chunksize=1000):
+        """
+        Execute a SQL query and yield the results as pandas DataFrames of up to
+        chunksize rows (all rows in one DataFrame if chunksize is 0 or None).
+        Rows are streamed from the server where the driver supports it, so a
+        caller that stops early does not fetch the rest.
+
+        Unlike execute_query, errors are logged and raised: a stream that ends
+        without an error has returned every row.
+        """
+        try:
+            with self.engine.connect() as conn:
+                if self.db_type == 'mysql':
+                    yield from self._iter_unbuffered(conn, query, params, chunksize)
+                    return
+                result = conn.execution_options(stream_results=True).execute(text(query), params or {})
+                if not result.returns_rows:
+                    return
+                columns = list(result.keys())
+                while True:
+                    rows = result.fetchmany(chunksize) if chunksize else result.fetchall()
+                    if not rows:
+                        break
+                    yield pd.DataFrame(rows, columns=columns)
+                    if not chunksize:
+                        break
+        except SQLAlchemyError as e:
+            logger.error(f"Query execution error: {str(e)}")
+            raise
+
+    def _iter_unbuffered(self, conn, query, params, chunksize):
+        """
+        Stream a MySQL query through an unbuffered mysql-connector cursor. SQLAlchemy
+        opens mysql-connector connections with buffered cursors, which read the whole
+        result into memory whatever stream_results says.
+        """
+        compiled = text(query).bindparams(**(params or {})).compile(dialect=self.engine.dialect)
+        statement = str(compiled)
+        cursor = conn.connection.dbapi_connection.cursor(buffered=False)
+        exhausted = False
+        try:
+            if compiled.params:
+                cursor.execute(statement, compiled.params)
+            else:
+                # Percent signs are only doubled for parameter interpolation
+                cursor.execute(statement.replace('%%', '%'))
+            if cursor.description is None:
+                exhausted = True
+                return
+            columns = list(cursor.column_names)
+            while True:
+                rows = cursor.fetchmany(chunksize) if chunksize else cursor.fetchall()
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=columns)
+                if not chunksize:
+                    break
+            exhausted = True
+        finally:
+            if exhausted:
+                cursor.close()
+            else:
+                # An unbuffered cursor cannot be released before its result is read
+                # to the end, so drop the connection instead
+                conn.invalidate()
+
+    # Sampled blocks are uneven, so sample more than needed and cut the result to size
+    SAMPLE_OVERSAMPLING = 3
+    # PK/rowid-range sampling reads this many contiguous ranges from random start points
+    SAMPLE_RANGES = 10
+    # Random number per row, to shuffle a sample on the server
+    RANDOM_FUNCTIONS = {
+        'sqlite': 'RANDOM()',
+        'postgresql': 'RANDOM()',
+        'mysql': 'RAND()',
+        'sqlserver': 'NEWID()',
+        'oracle': 'DBMS_RANDOM.VALUE'
+    }
+
+    def quote_identifier(self, name):
+        """Quote a table or column name for this database, where needed."""
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def estimate_row_count(self, table_name):
+        """
+        Estimated number of rows in a table from the database statistics, without
+        scanning it. Returns None if no estimate is available.
+        """
+        queries = {
+            'postgresql': ("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)", {'table': table_name}),
+            'mysql': ("SELECT table_rows FROM information_schema.tables "
+                      "WHERE table_schema = DATABASE() AND table_name = :table", {'table': table_name}),
+            'sqlserver': ("SELECT SUM(row_count) FROM sys.dm_db_partition_stats "
+                          "WHERE object_id = OBJECT_ID(:table) AND index_id IN (0, 1)", {'table': table_name}),
+            'oracle': ("SELECT num_rows FROM user_tables WHERE table_name = UPPER(:table)", {'table': table_name}),
+            'sqlite': (f"SELECT MAX(rowid) - MIN(rowid) + 1 FROM {self.quote_identifier(table_name)}", None),
+        }
+        if self.db_type not in queries:
+            return None
+        query, params = queries[self.db_type]
+        try:
+            with self.engine.connect() as conn:
+                value = conn.execute(text(query), params or {}).scalar()
+            # Postgres reports -1 for tables that were never analyzed
+            return int(value) if value is not None and value >= 0 else None
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not estimate row count for table {table_name}: {str(e)}")
+            return None
+
+    def table_fingerprint(self, table_name):
+        """
+        Cheap fingerprint of a table's contents, to tell whether it changed since
+        it was last analyzed, without scanning it: the largest integer primary key
+        (or rowid), read from the index, and the database's counters of changes to
+        the table where it keeps them (see modification_stats). Tables without an
+        integer key fall back to the change counters, then to the estimated row
+        count. Returns (fingerprint, estimated row count); the fingerprint is None
+        if it cannot be read.
+
+        The largest key and the row count only move with inserts (and deletes of
+        the last rows): updates, and deletes balanced by inserts, are missed where
+        the database keeps no change counters (SQLite), or until it refreshes its
+        statistics. Rescan with fingerprints=None after such changes.
+        """
+        table = self.quote_identifier(table_name)
+        key = 'rowid' if self.db_type == 'sqlite' else self._integer_primary_key(table_name)
+        stats = self.modification_stats(table_name)
+        row_count = self.estimate_row_count(table_name)
+        parts = [f"mod:{stats}"] if stats is not None else []
+        if key:
+            try:
+                with self.engine.connect() as conn:
+                    max_key = conn.execute(text(f"SELECT MAX({key}) FROM {table}")).scalar()
+            except SQLAlchemyError as e:
+                logger.warning(f"Could not fingerprint table {table_name}: {str(e)}")
+                return None, None
+            parts.insert(0, f"max:{max_key}")
+        elif stats is None:
+            if row_count is None:
+                return None, None
+            parts.append(f"estimate:{row_count}")
+        return '/'.join(parts), row_count
+
+    def modification_stats(self, table_name):
+        """
+        The database's own record of changes to a table, as a string that changes
+        with inserts, updates and deletes, or None where none is kept:
+
+        - postgresql: inserted, updated and deleted row counters (pg_stat_user_tables)
+        - sqlserver: time of the last write to any index of the table
+        - mysql: the table's update_time
+        - oracle: inserts, updates and deletes since the last statistics (user_tab_modifications)
+
+        The counters are reset by a server restart or a statistics reset, which
+        only costs a rescan.
+        """
+        queries = {
+            'postgresql': ("SELECT n_tup_ins || ':' || n_tup_upd || ':' || n_tup_del FROM pg_stat_user_tables "
+                           "WHERE relid = to_regclass(:table)"),
+            'sqlserver': ("SELECT MAX(last_user_update) FROM sys.dm_db_index_usage_stats "
+                          "WHERE database_id = DB_ID() AND object_id = OBJECT_ID(:table)"),
+            'mysql': ("SELECT update_time FROM information_schema.tables "
+                      "WHERE table_schema = DATABASE() AND table_name = :table"),
+            'oracle': ("SELECT inserts || ':' || updates || ':' || deletes || ':' || truncated "
+                       "FROM user_tab_modifications WHERE table_name = UPPER(:table) AND partition_name IS NULL"),
+        }
+        if self.db_type not in queries:
+            return None
+        try:
+            with self.engine.connect() as conn:
+                value = conn.execute(text(queries[self.db_type]), {'table': table_name}).scalar()
+            return str(value) if value is not None else None
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not read modification stats of table {table_name}: {str(e)}")
+            return None
+
+    def build_sample_query(self, table_name, columns, rows=1000):
+        """
+        Build a query returning a sample of about `rows` rows of the given columns,
+        using the cheapest sampling method of the database:
+
+        - postgresql: TABLESAMPLE SYSTEM (block sampling)
+        - sqlserver: TABLESAMPLE SYSTEM ... PERCENT
+        - oracle: SAMPLE BLOCK
+        - sqlite, mysql: contiguous rowid / integer primary key ranges from random starts
+
+        Small tables, and tables without statistics or a usable key, are read
+        from the start instead. Returns (query, params).
+        """
+        table = self.quote_identifier(table_name)
+        column_list = ', '.join(self.quote_identifier(column) for column in columns)
+        total = self.estimate_row_count(table_name)
+
+        if total is not None and total > rows * self.SAMPLE_OVERSAMPLING:
+            percent = min(100.0, 100.0 * rows * self.SAMPLE_OVERSAMPLING / total)
+            if self.db_type == 'postgresql':
+                return f"SELECT {column_list} FROM {table} TABLESAMPLE SYSTEM ({percent:.6f}) LIMIT {rows}", None
+            if self.db_type == 'sqlserver':
+                return f"SELECT TOP ({rows}) {column_list} FROM {table} TABLESAMPLE SYSTEM ({percent:.6f} PERCENT)", None
+            if self.db_type == 'oracle':
+                # Oracle accepts sample percentages in [0.000001, 100)
+                percent = max(0.000001, min(99.999999, percent))
+                return f"SELECT {column_list} FROM {table} SAMPLE BLOCK ({percent:.6f}) WHERE ROWNUM <= {rows}", None
+            if self.db_type in ('sqlite', 'mysql'):
+                key = 'rowid' if self.db_type == 'sqlite' else self._integer_primary_key(table_name)
+                if key:
+                    query = self._build_range_sample_query(table_name, key, column_list, rows)
+                    if query:
+                        return query
+
+        return self._build_limit_query(f"SELECT {column_list} FROM {table}", rows), None
+
+    def sample_table(self, table_name, columns, rows=1000):
+        """
+        Fetch a sample of about `rows` rows of the given columns in one query (see
+        build_sample_query). Sampled blocks and key ranges come back in storage
+        order, so the rows are shuffled before they are returned.
+        """
+        query, params = self.build_sample_query(table_name, columns, rows)
+        logger.debug(f"Sampling {table_name}: {query}")
+        df = self.execute_query(query, params)
+        return df.sample(frac=1, random_state=0).reset_index(drop=True) if not df.empty else df
+
+    def iter_sample(self, table_name, columns, rows=1000, chunksize=100):
+        """
+        Stream a sample of about `rows` rows of the given columns (see
+        build_sample_query) in chunks of chunksize rows. The sample is shuffled
+        on the server, so a caller that has seen enough after the first chunks
+        stops without fetching the rest.
+        """
+        query, params = self.build_sample_query(table_name, columns, rows)
+        query = f"SELECT * FROM ({query}) sampled ORDER BY {self.RANDOM_FUNCTIONS.get(self.db_type, 'RANDOM()')}"
+        logger.debug(f"Sampling {table_name}: {query}")
+        return self.iter_query(query, params, chunksize)
+
+    def _build_limit_query(self, query, rows):
+        """Limit a SELECT to its first `rows` rows in this database's syntax."""
+        if self.db_type == 'sqlserver':
+            return query.replace('SELECT ', f'SELECT TOP ({rows}) ', 1)
+        if self.db_type == 'oracle':
+            return f"{query} FETCH FIRST {rows} ROWS ONLY"
+        return f"{query} LIMIT {rows}"
+
+    def _integer_primary_key(self, table_name):
+        """Name of the table's single-column integer primary key, or None."""
+        try:
+            inspector = inspect(self.engine)
+            pk_columns = inspector.get_pk_constraint(table_name).get('constrained_columns', [])
+            if len(pk_columns) != 1:
+                return None
+            for column in inspector.get_columns(table_name):
+                if column['name'] == pk_columns[0] and isinstance(column['type'], Integer):
+                    return self.quote_identifier(column['name'])
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not inspect primary key of table {table_name}: {str(e)}")
+        return None
+
+    def _build_range_sample_query(self, table_name, key, column_list, rows):
+        """
+        Sample SAMPLE_RANGES contiguous key ranges starting at random points between
+        the smallest and largest key, as one UNION ALL query of index range scans.
+        The starts are drawn at least a range width apart, and each range stops
+        before the next start, so no row is sampled twice.
+        """
+        table = self.quote_identifier(table_name)
+        try:
+            with self.engine.connect() as conn:
+                low, high = conn.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).one()
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not read key range of table {table_name}: {str(e)}")
+            return None
+        if low is None:
+            return None
+
+        ranges = min(self.SAMPLE_RANGES, rows)
+        per_range = -(-rows // ranges)
+        # Room left for the starts once every range but the last takes its width
+        spread = int(high) - int(low) - (ranges - 1) * per_range
+        if spread < 0:
+            return None
+        starts = [start + i * per_range
+                  for i, start in enumerate(sorted(random.randint(int(low), int(low) + spread) for _ in range(ranges)))]
+        parts = [
+            f"SELECT * FROM (SELECT {column_list} FROM {table} WHERE {key} >= :start{i}"
+            f"{f' AND {key} < :start{i + 1}' if i + 1 < ranges else ''} "
+            f"ORDER BY {key} LIMIT {per_range}) AS range{i}"
+            for i in range(ranges)
+        ]
+        return ' UNION ALL '.join(parts), {f'start{i}': start for i, start in enumerate(starts)}
+
+    # Primary key values sampled per partition to pick the boundaries of non-integer keys
+    PARTITION_SAMPLE_ROWS = 100
+
+    def get_partitions(self, table_name, partitions):
+        """
+        Split a table into up to `partitions` disjoint parts that can be read
+        concurrently. Returns a list of (where, params) pairs, to be used as
+        SELECT * FROM table WHERE <where>, that together cover every row; the
+        first and last parts are open-ended, so rows added meanwhile are not
+        missed. Returns [] if the table cannot be split.
+
+        Tables with a primary key are split into keyset ranges of its first
+        column: equal-width ranges between MIN and MAX for integer keys, and
+        ranges between sampled quantiles for other keys. Tables without one
+        are split on the physical row locator of the database:
+
+        - sqlite: rowid ranges
+        - postgresql: ctid ranges of whole blocks
+        - oracle: ROWID ranges of whole extents, as DBMS_PARALLEL_EXECUTE makes them
+
+        Each part is a range scan, so the parts together read the table once.
+        SQL Server and MySQL tables without a primary key are not split: their
+        row locators (%%physloc%%) cannot be range scanned, and hash buckets of
+        them would make every part scan the whole table.
+        """
+        if partitions < 2:
+            return []
+        pk_columns = self.get_primary_keys(table_name)
+        try:
+            if pk_columns:
+                return self._key_partitions(table_name, pk_columns[0], partitions)
+            if self.db_type == 'sqlite':
+                return self._key_partitions(table_name, 'rowid', partitions)
+            if self.db_type == 'postgresql':
+                return self._ctid_partitions(table_name, partitions)
+            if self.db_type == 'oracle':
+                return self._rowid_partitions(table_name, partitions)
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not partition table {table_name}: {str(e)}")
+            return []
+        logger.info(f"Table {table_name} has no primary key or row locator to partition on")
+        return []
+
+    def _key_partitions(self, table_name, column_name, partitions):
+        """Keyset ranges of a column, with boundaries between MIN and MAX (integers) or sampled quantiles."""
+        table = self.quote_identifier(table_name)
+        key = column_name if column_name == 'rowid' else self.quote_identifier(column_name)
+        with self.engine.connect() as conn:
+            low, high = conn.execute(text(f"SELECT MIN({key}), MAX({key}) FROM {table}")).one()
+        if low is None:
+            return []
+
+        if isinstance(low, numbers.Integral) and isinstance(high, numbers.Integral):
+            width = (int(high) - int(low) + 1) / partitions
+            bounds = sorted({int(low) + int(width * i) for i in range(1, partitions)} - {int(low)})
+        else:
+            # Ordered by the database, so that the boundaries follow its collation
+            query, params = self.build_sample_query(table_name, [column_name], partitions * self.PARTITION_SAMPLE_ROWS)
+            sample = self.execute_query(f"SELECT * FROM ({query}) partition_sample ORDER BY {key}", params)
+            if sample.empty:
+                return []
+            values = sample.iloc[:, 0].dropna().tolist()
+            bounds = []
+            for i in range(1, partitions):
+                value = values[len(values) * i // partitions]
+                if value != low and (not bounds or value != bounds[-1]):
+                    bounds.append(value)
+        if not bounds:
+            return []
+
+        # Nulls are only possible in SQLite primary keys
+        return self._range_partitions(key, bounds, nulls=True)
+
+    def _ctid_partitions(self, table_name, partitions):
+        """Ranges of whole heap blocks, read with TID range scans."""
+        with self.engine.connect() as conn:
+            blocks = conn.execute(text("SELECT pg_relation_size(to_regclass(:table)) / "
+                                       "current_setting('block_size')::bigint"), {'table': table_name}).scalar()
+        if not blocks or blocks < partitions:
+            return []
+        bounds = [f"({blocks * i // partitions},0)" for i in range(1, partitions)]
+        return self._range_partitions('ctid', bounds, placeholder='CAST(:{} AS tid)')
+
+    def _rowid_partitions(self, table_name, partitions):
+        """
+        ROWID ranges of whole extents of an Oracle table with about the same
+        number of blocks each, read with ROWID range scans. Partitioned tables
+        (several segments) are not split.
+        """
+        with self.engine.connect() as conn:
+            extents = conn.execute(text(
+                "SELECT ROWIDTOCHAR(DBMS_ROWID.ROWID_CREATE(1, o.data_object_id, e.relative_fno, e.block_id, 0)), "
+                "e.blocks FROM user_extents e JOIN user_objects o "
+                "ON o.object_name = e.segment_name AND o.object_type = 'TABLE' "
+                "WHERE e.segment_name = UPPER(:table) AND e.segment_type = 'TABLE' "
+                "ORDER BY e.relative_fno, e.block_id"
+            ), {'table': table_name}).all()
+        total = sum(blocks for _, blocks in extents)
+        if len(extents) < partitions:
+            return []
+
+        # A range starts at the first extent past each 1/partitions of the blocks
+        bounds = []
+        seen = 0
+        for start, blocks in extents:
+            if seen >= total * (len(bounds) + 1) / partitions and len(bounds) < partitions - 1:
+                bounds.append(start)
+            seen += blocks
+        if not bounds:
+            return []
+        return self._range_partitions('ROWID', bounds, placeholder='CHARTOROWID(:{})')
+
+    def _range_partitions(self, key, bounds, placeholder=':{}', nulls=False):
+        """(where, params) of the ranges below, between and above the ascending bounds; nulls go to the first."""
+        low, high = placeholder.format('low'), placeholder.format('high')
+        first = f"({key} < {high} OR {key} IS NULL)" if nulls else f"{key} < {high}"
+        ranges = [(first, {'high': bounds[0]})]
+        ranges += [(f"{key} >= {low} AND {key} < {high}", {'low': bounds[i], 'high': bounds[i + 1]})
+                   for i in range(len(bounds) - 1)]
+        ranges.append((f"{key} >= {low}", {'low': bounds[-1]}))
+        return ranges
+
     def update_data(self, table_name, data_df, primary_key):
         """Update data in the database table from a pandas DataFrame."""
         try:
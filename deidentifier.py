@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 import logging
@@ -7,39 +8,107 @@ import datetime
 import hashlib
 import uuid
 from db_connector import DatabaseConnector
-from rule_engine import RuleEngine
+from rule_engine import RuleEngine, value_kind
+from rule_plan import RulePlan
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched, transformed and written at a time by process_table; 0 loads whole tables
+DEFAULT_CHUNK_SIZE = int(os.environ.get('DEID_CHUNK_SIZE', 50000))
+
 class Deidentifier:
     """
     Main class for the de-identification process. Connects to the source database,
     retrieves data, applies de-identification rules, and stores the de-identified
     data in the target location.
     """
-    def __init__(self, db_connection, rules=None):
-        """Initialize with database connection and rules."""
+    def __init__(self, db_connection, rules=None, chunk_size=DEFAULT_CHUNK_SIZE, writer=None, checkpoint=None):
+        """
+        Initialize with database connection and rules. Tables are streamed in chunks
+        of chunk_size rows (whole tables if 0 or None), and each de-identified chunk
+        is passed to writer(table_name, chunk_df) if one is given. After each chunk is
+        written, and when a table is done, checkpoint(table_name, last_key, rows,
+        completed) is called if given (see process_table).
+        """
         self.db_connection = db_connection
         self.rules = rules or []
+        self.chunk_size = chunk_size
+        self.writer = writer
+        self.checkpoint = checkpoint
         self.rule_engine = RuleEngine()
+        self.rule_plan = RulePlan(self.rules)
         self.master_mapping = {}
         self.mappings = {}
-        self.stats = {
-            'total_records': 0,
-            'modified_records': 0,
-            'tables_processed': 0,
-            'fields_modified': {}
-        }
+        self.reset_statistics()
     
     def load_rules(self, rules):
         """Load de-identification rules."""
         self.rules = rules
         self.rule_engine.load_rules(rules)
+        self.rule_plan = RulePlan(rules)
         logger.info(f"Loaded {len(rules)} de-identification rules")
+
+    def compile_rule_plan(self, tables=None):
+        """
+        Compile the loaded rules into a RulePlan indexed by the reflected columns
+        of the given tables (all tables if None). Tables left out are indexed
+        lazily when they are processed.
+        """
+        if tables is None:
+            tables = self.db_connection.get_tables()
+        reflected = {table_name: self.db_connection.get_columns(table_name) for table_name in tables}
+        table_columns = {table_name: [col['name'] for col in columns] for table_name, columns in reflected.items()}
+        self.rule_plan = RulePlan.compile(self.rules, table_columns, self._value_kinds(reflected))
+        self.stats['rule_plan_seconds'] = self.rule_plan.compile_seconds
+        return self.rule_plan
     
-    def process_table(self, table_name, primary_key=None):
-        """Process a single table for de-identification."""
-        logger.info(f"Processing table: {table_name}")
+    def has_stateful_rules(self, table_name):
+        """Whether a rule on any column of a table depends on the rows before (e.g. patient_id numbering)."""
+        columns = self.rule_plan.columns.get(table_name)
+        if columns is None:
+            columns = [col['name'] for col in self.db_connection.get_columns(table_name)]
+        return any(rule.rule_type in self.rule_engine.stateful for column in columns
+                   for rule in self.rule_plan.rules_for(table_name, column))
+
+    def checkpoint_key(self, table_name):
+        """
+        The column a table can be resumed on: its single-column primary key, if
+        no rule transforms it, so the destination keeps the source values. None
+        if the table can only be restarted, as is a table with stateful rules,
+        whose state is not checkpointed.
+        """
+        pk_columns = self.db_connection.get_primary_keys(table_name)
+        if len(pk_columns) != 1 or self.rule_plan.rules_for(table_name, pk_columns[0]):
+            return None
+        if self.has_stateful_rules(table_name):
+            return None
+        return pk_columns[0]
+
+    def process_table(self, table_name, primary_key=None, chunk_size=None, partition=None, resume_after=None):
+        """
+        Process a single table for de-identification. Rows are streamed with a
+        server-side cursor in chunks of chunk_size (the de-identifier's chunk size
+        by default); each chunk is transformed, written and released before the
+        next one is fetched, so memory stays flat whatever the table size.
+
+        partition is a (where, params) pair from DatabaseConnector.get_partitions
+        to process only that part of the table. Partitions are not counted in
+        tables_processed; whoever splits the table counts it.
+
+        With a checkpoint callback, tables with a checkpoint_key are read in key
+        order, and each written chunk is reported with the key of its last row;
+        resume_after skips the rows up to that key, to continue from a checkpoint.
+        """
+        where, params = partition if partition else (None, None)
+        conditions = [f"({where})"] if where else []
+        params = dict(params or {})
+        order_key = self.checkpoint_key(table_name) if self.checkpoint is not None else None
+        if order_key is not None:
+            quoted_key = self.db_connection.quote_identifier(order_key)
+            if resume_after is not None:
+                conditions.append(f"{quoted_key} > :resume_after")
+                params['resume_after'] = resume_after
+        logger.info(f"Processing table: {table_name}" + (f" where {where}" if where else ""))
         
         # Get the primary key if not provided
         if not primary_key:
@@ -50,21 +119,77 @@ class Deidentifier:
                 logger.warning(f"No primary key found for table {table_name}, using index as key")
                 primary_key = None
         
-        # Get table columns
-        columns = self.db_connection.get_columns(table_name)
-        column_names = [col['name'] for col in columns]
+        # Get table columns, reflected already if the rule plan was compiled for this table
+        column_names = self.rule_plan.columns.get(table_name)
+        if column_names is None:
+            columns = self.db_connection.get_columns(table_name)
+            column_names = [col['name'] for col in columns]
+            self.rule_plan.value_kinds.update(self._value_kinds({table_name: columns}))
+        # Random values are drawn by the reflected column types, whatever the dtype of a chunk
+        for column_name in column_names:
+            kind = self.rule_plan.value_kinds.get((table_name, column_name))
+            if kind is not None:
+                self.rule_engine.value_kinds[(table_name, column_name)] = kind
         
-        # Fetch data from the table
+        # Fetch data from the table, a chunk at a time
         query = f"SELECT * FROM {table_name}"
-        df = self.db_connection.execute_query(query)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        if order_key is not None:
+            query += f" ORDER BY {quoted_key}"
+        # Read errors are raised (not an empty result), so a table is never taken as done early
+        chunks = self.db_connection.iter_query(query, params=params, chunksize=chunk_size or self.chunk_size)
         
-        if df.empty:
-            logger.warning(f"No data found in table {table_name}")
+        rows = 0
+        modified = False
+        for df in chunks:
+            if df.empty:
+                continue
+            rows += len(df)
+            if self._process_chunk(df, table_name, column_names):
+                modified = True
+            if self.writer is not None:
+                self.writer(table_name, df)
+            if self.checkpoint is not None:
+                last_key = df[order_key].iloc[-1] if order_key is not None else None
+                self.checkpoint(table_name, last_key.item() if hasattr(last_key, 'item') else last_key,
+                                len(df), False)
+        
+        # Only reached once the cursor is exhausted
+        if self.checkpoint is not None:
+            self.checkpoint(table_name, None, 0, True)
+        if rows == 0:
+            if not where:
+                logger.warning(f"No data found in table {table_name}")
             return False
         
-        # Update statistics
+        if not where:
+            self.stats['tables_processed'] += 1
+        if modified:
+            # Store the modified data back to the database
+            # For demo purposes, we're not actually writing back to the original database
+            # Instead, pass a writer to write to a new table or export to a file
+            logger.info(f"Processed and de-identified {rows} records in table {table_name}")
+            return True
+        
+        logger.info(f"No modifications needed for table {table_name}")
+        return False
+
+    @staticmethod
+    def _value_kinds(reflected):
+        """random_value draw kinds of the numeric columns of {table: get_columns() result}."""
+        kinds = {}
+        for table_name, columns in reflected.items():
+            for col in columns:
+                kind = value_kind(col['type'])
+                if kind is not None:
+                    kinds[(table_name, col['name'])] = kind
+        return kinds
+
+    def _process_chunk(self, df, table_name, column_names):
+        """Apply the rules to one chunk of a table in place and merge its statistics."""
         self.stats['total_records'] += len(df)
-        self.stats['tables_processed'] += 1
+        self.stats['chunks_processed'] += 1
         
         # Process each column based on rules
         modified = False
@@ -80,32 +205,24 @@ class Deidentifier:
                 # Update column statistics
                 if column not in self.stats['fields_modified']:
                     self.stats['fields_modified'][column] = 0
-                self.stats['fields_modified'][column] += df[column].notna().sum()
+                self.stats['fields_modified'][column] += int(df[column].notna().sum())
         
         if modified:
             # Update the modified records count
             self.stats['modified_records'] += len(df)
-            
-            # Store the modified data back to the database
-            # For demo purposes, we're not actually writing back to the original database
-            # Instead, you could write to a new table or export to a file
-            logger.info(f"Processed and de-identified {len(df)} records in table {table_name}")
-            return True
-        
-        logger.info(f"No modifications needed for table {table_name}")
-        return False
+        return modified
     
     def _apply_rules_to_column(self, df, table_name, column_name):
         """Apply de-identification rules to a specific column."""
         modified = False
         
-        for rule in self.rules:
-            # Check if the rule applies to this column
-            if self.rule_engine.column_matches_rule(table_name, column_name, rule):
-                # Apply the rule transformation
-                df[column_name] = self.rule_engine.apply_rule(df[column_name], rule)
-                modified = True
-                logger.debug(f"Applied rule '{rule.name}' to {table_name}.{column_name}")
+        # Rules that apply to this column, from the compiled rule plan
+        for rule in self.rule_plan.rules_for(table_name, column_name):
+            # Apply the rule transformation
+            df[column_name] = self.rule_engine.apply_rule(df[column_name], rule,
+                                                          table_name=table_name, column_name=column_name)
+            modified = True
+            logger.debug(f"Applied rule '{rule.name}' to {table_name}.{column_name}")
         
         return modified
     
@@ -176,6 +293,25 @@ class Deidentifier:
     def get_statistics(self):
         """Get statistics about the de-identification process."""
         return self.stats
+
+    def reset_statistics(self):
+        """Start counting from zero, and return the statistics counted so far."""
+        stats = getattr(self, 'stats', None)
+        self.stats = {
+            'total_records': 0,
+            'modified_records': 0,
+            'tables_processed': 0,
+            'chunks_processed': 0,
+            'fields_modified': {}
+        }
+        return stats
+
+    def merge_statistics(self, stats):
+        """Add the counts of another de-identifier's statistics (e.g. of a worker process) to these."""
+        for key in ('total_records', 'modified_records', 'tables_processed', 'chunks_processed'):
+            self.stats[key] += stats.get(key, 0)
+        for column, count in stats.get('fields_modified', {}).items():
+            self.stats['fields_modified'][column] = self.stats['fields_modified'].get(column, 0) + int(count)
     
     def apply_master_mapping(self, table_name, id_field):
         """Apply the master patient mapping to a table."""
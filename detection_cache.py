@@ -0,0 +1,106 @@
+import sys
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Rough per-entry overhead of the key, the OrderedDict slot and the findings list
+ENTRY_OVERHEAD = 200
+
+
+class DetectionCache:
+    """
+    Bounded LRU cache of PHI detection results keyed by a hash of the text.
+
+    Entries are evicted least recently used first once either max_entries or
+    max_bytes (an estimate of the memory held by the cached findings) is
+    exceeded. Safe to share between threads.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(text: str, version: str) -> bytes:
+        """Cache key for a text under a detector configuration version."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(version.encode('utf-8'))
+        digest.update(b'\x00')
+        digest.update(text.encode('utf-8', 'surrogatepass'))
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[List[Dict[str, Any]]]:
+        """Cached findings for the key, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: bytes, findings: List[Dict[str, Any]]):
+        """Store findings for the key, evicting old entries to stay within the limits."""
+        size = self._estimate_size(findings)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.memory_bytes -= previous[1]
+            self._entries[key] = (findings, size)
+            self.memory_bytes += size
+
+            while self._entries and (len(self._entries) > self.max_entries or self.memory_bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.memory_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters, hit rate and current size of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_bytes': self.memory_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+    def _estimate_size(self, findings: List[Dict[str, Any]]) -> int:
+        """Approximate memory held by a findings list, counting dicts and their string values."""
+        size = ENTRY_OVERHEAD + sys.getsizeof(findings)
+        for finding in findings:
+            size += sys.getsizeof(finding)
+            for value in finding.values():
+                if isinstance(value, str):
+                    size += sys.getsizeof(value)
+        return size
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,158 @@
+import os
+import hashlib
+import logging
+import secrets
+import numpy as np
+import pandas as pd
+from pandas.util import hash_array
+
+logger = logging.getLogger(__name__)
+
+# Secret mixed into every key, so surrogates cannot be recomputed from the rule configs alone.
+# Without DEID_RANDOM_KEY, a secret is generated on first use and kept in DEID_RANDOM_KEY_PATH.
+DEFAULT_KEY_PATH = os.environ.get(
+    'DEID_RANDOM_KEY_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'random_key')
+)
+
+
+def load_random_key(path: str = DEFAULT_KEY_PATH) -> str:
+    """
+    The secret key of the keyed randomness: DEID_RANDOM_KEY if set, else the
+    per-install secret stored at path, generated there on first use. Raises
+    OSError if there is no key and none can be stored, rather than run with a
+    key anyone could recompute the surrogates from.
+    """
+    key = os.environ.get('DEID_RANDOM_KEY')
+    if key:
+        return key
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(secrets.token_hex(32))
+    try:
+        # Linking fails if another process stored its key first; every process then uses that one
+        os.link(temp_path, path)
+        logger.warning(f"DEID_RANDOM_KEY is not set, generated a secret key in {path}")
+    except FileExistsError:
+        pass
+    finally:
+        os.remove(temp_path)
+    with open(path) as f:
+        return f.read().strip()
+
+
+class KeyedRandom:
+    """
+    Deterministic randomness for de-identification transforms.
+
+    Every draw is a keyed SipHash of the value it is drawn for, under a key
+    derived from the key parts (e.g. a secret, the rule type and its seed) and
+    a counter that numbers independent draws for the same value. A value
+    therefore gets the same draw regardless of row order, chunking, process or
+    PYTHONHASHSEED, which makes chunked and parallel runs reproducible.
+    """
+
+    def __init__(self, *key_parts):
+        self.key = '\x00'.join(str(part) for part in key_parts)
+
+    def _hash_key(self, counter: int) -> str:
+        # SipHash takes a 16 byte key: the full digest, as the 16 characters that encode to it in latin-1
+        return hashlib.blake2b(f"{self.key}\x00{counter}".encode('utf-8'), digest_size=16).digest().decode('latin-1')
+
+    def _numbers(self, values: pd.Series):
+        """
+        Numbers as int64 bytes to hash, integral floats as the equal integer, so a
+        column hashes alike whether a chunk reads it as int64 or, with a NULL, as
+        float64. Nulls are None. Returns None for values that are not numbers.
+        """
+        if values.dtype == object:
+            inferred = pd.api.types.infer_dtype(values, skipna=True)
+            try:
+                if inferred == 'integer':
+                    values = values.astype('Int64')
+                elif inferred in ('floating', 'mixed-integer-float'):
+                    values = values.astype(np.float64)
+                else:
+                    return None
+            except (OverflowError, TypeError, ValueError):
+                return None
+        if pd.api.types.is_integer_dtype(values.dtype):
+            numbers = values.to_numpy(dtype=np.int64, na_value=0)
+        elif pd.api.types.is_float_dtype(values.dtype):
+            floats = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            integral = (floats == np.trunc(floats)) & (np.abs(floats) < 2.0 ** 63)
+            numbers = floats.view(np.int64).copy()
+            numbers[integral] = floats[integral].astype(np.int64)
+        else:
+            return None
+        numbers = numbers.view('S8').astype(object)
+        if values.hasnans:
+            numbers[values.isna().to_numpy()] = None
+        return numbers
+
+    def _strings(self, values):
+        """Codes into the distinct values to hash, and those values as strings or bytes."""
+        values = values if isinstance(values, pd.Series) else pd.Series(list(values), dtype=object)
+        # Numbers (nullable ones too) hash as their 8 bytes, without a string per value
+        numbers = self._numbers(values)
+        if numbers is not None:
+            return None, numbers
+        if values.dtype == object and pd.api.types.infer_dtype(values, skipna=False) == 'string':
+            # Already strings: hashing them directly is cheaper than finding the distinct ones
+            return None, self._encoded(values.to_numpy())
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        return codes, self._encoded(np.asarray([str(value) for value in uniques], dtype=object))
+
+    @staticmethod
+    def _encoded(strings: np.ndarray) -> np.ndarray:
+        """
+        Strings as hashed under the latin-1 encoding of the key: ASCII ones as they
+        are, any others as UTF-8 bytes (lone surrogates passed through), so a
+        string hashes alike whatever else its chunk holds.
+        """
+        if ''.join(strings).isascii():
+            return strings
+        return np.asarray([value.encode('utf-8', 'surrogatepass') for value in strings], dtype=object)
+
+    def _hash_strings(self, codes, strings, counter: int) -> np.ndarray:
+        # pandas ignores the key when hashing numbers, so hash strings or bytes
+        hashed = hash_array(strings, encoding='latin-1', hash_key=self._hash_key(counter), categorize=False)
+        return hashed if codes is None else hashed[codes]
+
+    def hash(self, values, counter: int = 0) -> np.ndarray:
+        """A uint64 per value. Equal numbers get equal hashes whatever their dtype, as do other values with equal string forms."""
+        codes, strings = self._strings(values)
+        return self._hash_strings(codes, strings, counter)
+
+    def integers(self, values, low: int, high: int, counter: int = 0) -> np.ndarray:
+        """An integer in [low, high] (both inclusive) per value."""
+        span = np.uint64(high - low + 1)
+        return (self.hash(values, counter) % span).astype(np.int64) + low
+
+    def uniform(self, values, low: float = 0.0, high: float = 1.0, counter: int = 0) -> np.ndarray:
+        """A float in [low, high) per value."""
+        unit = (self.hash(values, counter) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+        return low + unit * (high - low)
+
+    def digits(self, values, base: int, count: int) -> np.ndarray:
+        """count integers in [0, base) per value, as a (len(values), count) array."""
+        codes, strings = self._strings(values)
+        # Each hash yields as many base digits as fit in 64 bits, counters number the hashes
+        per_hash = max(1, int(64 // np.log2(base)))
+        digits = None
+        for start in range(0, count, per_hash):
+            hashed = self._hash_strings(codes, strings, counter=start // per_hash)
+            if digits is None:
+                digits = np.empty((len(hashed), count), dtype=np.int64)
+            for column in range(start, min(start + per_hash, count)):
+                hashed, digit = np.divmod(hashed, np.uint64(base))
+                digits[:, column] = digit
+        return digits if digits is not None else np.empty((len(values), 0), dtype=np.int64)
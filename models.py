@@ -114,6 +114,9 @@ class ProcessLog(db.Model):
     records_processed = db.Column(db.Integer, default=0)
     records_modified = db.Column(db.Integer, default=0)
     log_data = db.Column(db.Text, nullable=True)  # JSON log data
+    owner_host = db.Column(db.String(255), nullable=True)  # Host of the server process running it
+    owner_pid = db.Column(db.Integer, nullable=True)  # Id of the server process running it
+    heartbeat_at = db.Column(db.DateTime, nullable=True)  # Last sign of life of that process
     
     # Relationships
     source_connection = db.relationship('DBConnection', foreign_keys=[source_connection_id])
@@ -128,4 +131,120 @@ class ProcessLog(db.Model):
         return {}
     
     def set_log_data(self, data):
-        self.log_data = json.dumps(data)
\ No newline at end of file
+        self.log_data = json.dumps(data)
+
+
+class ProcessCheckpoint(db.Model):
+    """Progress of one table, or one key range of a table, in a de-identification run, to resume it from"""
+    id = db.Column(db.Integer, primary_key=True)
+    process_id = db.Column(db.Integer, db.ForeignKey('process_log.id'), nullable=False, index=True)
+    table_name = db.Column(db.String(255), nullable=False)
+    partition = db.Column(db.Integer, nullable=True)  # Index of the key range, None for a whole table
+    partition_where = db.Column(db.Text, nullable=True)  # WHERE condition of the key range
+    partition_params = db.Column(db.Text, nullable=True)  # JSON parameters of the condition
+    status = db.Column(db.String(20), default="pending")  # pending, running, completed
+    last_key = db.Column(db.Text, nullable=True)  # JSON primary key value of the last row written
+    rows_written = db.Column(db.Integer, default=0)
+    chunks_written = db.Column(db.Integer, default=0)
+    rule_plan_hash = db.Column(db.String(64), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Relationship
+    process = db.relationship('ProcessLog', backref=db.backref('checkpoints', lazy=True))
+
+    def __repr__(self):
+        return f"<ProcessCheckpoint {self.table_name}[{self.partition}] - {self.status}>"
+
+class PHIScanJob(db.Model):
+    """Database-wide PHI discovery run over all tables of a connection"""
+    id = db.Column(db.Integer, primary_key=True)
+    connection_id = db.Column(db.Integer, db.ForeignKey('db_connection.id'), nullable=False)
+    detection_mode = db.Column(db.String(20), default="pattern")  # pattern, ai
+    status = db.Column(db.String(20), default="pending")  # pending, running, completed, failed
+    tables_total = db.Column(db.Integer, default=0)
+    tables_done = db.Column(db.Integer, default=0)
+    tables_failed = db.Column(db.Integer, default=0)
+    phi_tables = db.Column(db.Integer, default=0)  # Tables with at least one PHI column
+    start_time = db.Column(db.DateTime, default=datetime.utcnow)
+    end_time = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+
+    # Relationship
+    connection = db.relationship('DBConnection', backref=db.backref('phi_scan_jobs', lazy=True))
+
+    def __repr__(self):
+        return f"<PHIScanJob {self.id} - {self.status} ({self.tables_done}/{self.tables_total})>"
+
+    def get_progress(self):
+        return {
+            'job_id': self.id,
+            'connection_id': self.connection_id,
+            'detection_mode': self.detection_mode,
+            'status': self.status,
+            'tables_total': self.tables_total,
+            'tables_done': self.tables_done,
+            'tables_failed': self.tables_failed,
+            'phi_tables': self.phi_tables,
+            'percent': round(100.0 * self.tables_done / self.tables_total, 1) if self.tables_total else 0.0,
+            'start_time': self.start_time.isoformat() if self.start_time else None,
+            'end_time': self.end_time.isoformat() if self.end_time else None,
+            'error': self.error
+        }
+
+
+class PHITableScan(db.Model):
+    """PHI analysis result of one table in a discovery run"""
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('phi_scan_job.id'), nullable=False, index=True)
+    table_name = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # completed, failed
+    phi_columns = db.Column(db.Integer, default=0)
+    duration = db.Column(db.Float, nullable=True)  # Seconds spent in the worker
+    analysis = db.Column(db.Text, nullable=True)  # JSON output of PHIService.analyze_database_columns
+    error = db.Column(db.Text, nullable=True)
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationship
+    job = db.relationship('PHIScanJob', backref=db.backref('table_scans', lazy=True))
+
+    def __repr__(self):
+        return f"<PHITableScan {self.table_name} - {self.status}>"
+
+    def get_analysis(self):
+        if self.analysis:
+            return json.loads(self.analysis)
+        return {}
+
+    def set_analysis(self, data):
+        self.analysis = json.dumps(data, default=str)
+
+
+class PHIColumnCatalog(db.Model):
+    """Latest PHI analysis of a database column, used to skip unchanged columns and to build plans"""
+    __table_args__ = (db.UniqueConstraint('connection_id', 'table_name', 'column_name'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    connection_id = db.Column(db.Integer, db.ForeignKey('db_connection.id'), nullable=False)
+    table_name = db.Column(db.String(255), nullable=False)
+    column_name = db.Column(db.String(255), nullable=False)
+    column_type = db.Column(db.String(100), nullable=True)
+    detection_mode = db.Column(db.String(20), default="pattern")  # pattern, ai
+    phi_types = db.Column(db.Text, nullable=True)  # JSON list of PHI types with frequencies
+    sample_size = db.Column(db.Integer, default=0)  # Rows analyzed
+    row_count = db.Column(db.Integer, nullable=True)  # Table rows at scan time (may be an estimate)
+    fingerprint = db.Column(db.String(64), nullable=True)  # See PHIService.column_fingerprint
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    # Relationship
+    connection = db.relationship('DBConnection', backref=db.backref('phi_catalog', lazy=True))
+
+    def __repr__(self):
+        return f"<PHIColumnCatalog {self.table_name}.{self.column_name}>"
+
+    def get_phi_types(self):
+        if self.phi_types:
+            return json.loads(self.phi_types)
+        return []
+
+    def set_phi_types(self, data):
+        self.phi_types = json.dumps(data, default=str)
@@ -0,0 +1,394 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from queue import Queue, Empty
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import List, Dict, Any, Iterator, Optional, Callable
+from db_connector import DatabaseConnector
+from deidentifier import Deidentifier, DEFAULT_CHUNK_SIZE
+from bulk_writer import BulkWriter
+from rule_plan import RulePlan
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('DEID_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Tables estimated to hold more rows than this are split into key ranges processed concurrently; 0 turns it off
+DEFAULT_PARTITION_ROWS = int(os.environ.get('DEID_PARTITION_ROWS', 1000000))
+
+# Seconds between reads of the checkpoints reported by the workers
+CHECKPOINT_POLL_SECONDS = 1.0
+
+# Per-process state of the de-identification workers, set up once by _init_worker
+_worker_deidentifier = None
+_worker_writer = None
+_worker_error = None
+_worker_checkpoints = None
+
+# Runs with a single worker use the globals above in this process, one run at a time
+_in_process_lock = threading.Lock()
+
+
+def _init_worker(connection_params: Dict[str, Any], rule_plan: RulePlan, chunk_size: int,
+                 destination_params: Optional[Dict[str, Any]] = None, checkpoints=None):
+    """
+    Open source (and destination) database engines of its own in a worker
+    process. Checkpoints are put on the checkpoints queue, if given.
+    """
+    global _worker_deidentifier, _worker_writer, _worker_error, _worker_checkpoints
+    _worker_checkpoints = checkpoints
+    connector = DatabaseConnector(**connection_params)
+    if not connector.connect():
+        _worker_error = 'Could not connect to database'
+        return
+
+    writer = None
+    if destination_params:
+        destination = DatabaseConnector(**destination_params)
+        if not destination.connect():
+            _worker_error = 'Could not connect to destination database'
+            return
+        writer = BulkWriter(destination)
+
+    deidentifier = Deidentifier(connector, chunk_size=chunk_size, writer=writer)
+    deidentifier.load_rules(rule_plan.rules)
+    # Keep the columns reflected by the parent, so tables are not reflected again
+    deidentifier.rule_plan = rule_plan
+    _worker_deidentifier = deidentifier
+    _worker_writer = writer
+
+
+class _InProcessExecutor:
+    """
+    Stands in for a pool of one worker process: runs the worker initializer
+    in this process, then each task as it is submitted. Saves spawning a
+    process (and importing the app into it) for one table. The worker
+    globals are restored and its engines disposed on exit.
+    """
+
+    def __init__(self, initializer, initargs):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.saved = None
+
+    def __enter__(self):
+        global _worker_deidentifier, _worker_writer, _worker_error, _worker_checkpoints
+        _in_process_lock.acquire()
+        self.saved = (_worker_deidentifier, _worker_writer, _worker_error, _worker_checkpoints)
+        _worker_deidentifier = _worker_writer = _worker_error = None
+        try:
+            self.initializer(*self.initargs)
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _worker_deidentifier, _worker_writer, _worker_error, _worker_checkpoints
+        try:
+            if _worker_deidentifier is not None:
+                _worker_deidentifier.db_connection.disconnect()
+            if _worker_writer is not None:
+                _worker_writer.connector.disconnect()
+        finally:
+            _worker_deidentifier, _worker_writer, _worker_error, _worker_checkpoints = self.saved
+            _in_process_lock.release()
+        return False
+
+
+def _process_table(table_name: str, partition: Optional[tuple] = None, append: bool = False,
+                   resume: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    De-identify one table, or one (index, where, params) partition of it, in a
+    worker process. With append, the destination table already exists and the
+    rows are appended to it. With resume ({'after': last key}), the table or
+    partition continues after its last checkpoint: the destination rows it may
+    have written past it are deleted first, so no row is written twice. Never
+    raises, so one table cannot fail the run.
+    """
+    start = time.perf_counter()
+    index = partition[0] if partition else None
+    result = {'table_name': table_name, 'partition': index}
+    if _worker_deidentifier is None:
+        result.update(status='failed', error=_worker_error or 'Worker not initialized')
+    else:
+        # Count this table on its own, so the parent can merge it
+        _worker_deidentifier.reset_statistics()
+        if _worker_checkpoints is not None:
+            _worker_deidentifier.checkpoint = lambda table, last_key, rows, completed: _worker_checkpoints.put(
+                (table, index, last_key, rows, completed))
+        if append and _worker_writer is not None:
+            _worker_writer.created.add(table_name)
+        try:
+            resume_after = resume['after'] if resume else None
+            if resume and _worker_writer is not None:
+                _delete_unchecked_rows(table_name, partition, resume_after)
+            modified = _worker_deidentifier.process_table(table_name, partition=partition[1:] if partition else None,
+                                                          resume_after=resume_after)
+            result.update(status='completed', modified=modified, stats=_worker_deidentifier.get_statistics())
+            if _worker_writer is not None and table_name in _worker_writer.stats:
+                # Taken out, so the next partition of the table in this worker is counted on its own
+                result['write'] = _worker_writer.stats.pop(table_name)
+        except Exception as e:
+            result.update(status='failed', error=str(e))
+
+    result['duration'] = time.perf_counter() - start
+    return result
+
+
+def _delete_unchecked_rows(table_name: str, partition: Optional[tuple], resume_after):
+    """Delete the destination rows of a table or partition after its checkpoint (all of them if it has none)."""
+    conditions = [f"({partition[1]})"] if partition else []
+    params = dict(partition[2] or {}) if partition else {}
+    if resume_after is not None:
+        key = _worker_writer.connector.quote_identifier(_worker_deidentifier.checkpoint_key(table_name))
+        conditions.append(f"{key} > :resume_after")
+        params['resume_after'] = resume_after
+    if conditions:
+        _worker_writer.delete_rows(table_name, ' AND '.join(conditions), params)
+    else:
+        # A whole table without a checkpointed chunk is written from scratch
+        _worker_writer.created.discard(table_name)
+
+
+def plan_partitions(deidentifier: Deidentifier, tables: List[str], max_workers: int = DEFAULT_WORKERS,
+                    partition_rows: int = DEFAULT_PARTITION_ROWS) -> Dict[str, List[tuple]]:
+    """
+    Partitions ({table: [(where, params)]}, from DatabaseConnector.get_partitions)
+    of the tables estimated to hold more than partition_rows rows, split into
+    one partition per partition_rows rows and at most max_workers partitions.
+    Tables with stateful rules (patient_id) are never split.
+    """
+    partitions = {}
+    if max_workers < 2 or not partition_rows:
+        return partitions
+    connector = deidentifier.db_connection
+    for table_name in tables:
+        total = connector.estimate_row_count(table_name)
+        if total is None or total <= partition_rows:
+            continue
+        if deidentifier.has_stateful_rules(table_name):
+            logger.info(f"Not partitioning table {table_name}: it has stateful rules")
+            continue
+        table_partitions = connector.get_partitions(table_name, min(max_workers, -(-total // partition_rows)))
+        if table_partitions:
+            partitions[table_name] = table_partitions
+            logger.info(f"Partitioned table {table_name} (~{total} rows) into {len(table_partitions)} parts")
+    return partitions
+
+
+def _pool_size(tables: List[str], partitions: Dict[str, List[tuple]], max_workers: int,
+               resume: Optional[Dict[str, Dict]] = None) -> int:
+    """Worker processes for the tasks of a run: no more than there are tables and partitions to process."""
+    resume = resume or {}
+    tasks = sum(len(resume[table_name]) if table_name in resume else max(1, len(partitions.get(table_name, [])))
+                for table_name in tables)
+    return max(1, min(max_workers, tasks))
+
+
+def process_tables(connection_params: Dict[str, Any], rule_plan: RulePlan, tables: List[str],
+                   max_workers: int = DEFAULT_WORKERS, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                   destination_params: Optional[Dict[str, Any]] = None,
+                   partitions: Optional[Dict[str, List[tuple]]] = None, resume: Optional[Dict[str, Dict]] = None,
+                   on_checkpoint: Optional[Callable] = None) -> Iterator[Dict[str, Any]]:
+    """
+    De-identify tables in a pool of max_workers processes, each with its own
+    database engine and a copy of the compiled rule plan. If destination_params
+    are given, each worker bulk writes its tables to that database. Tables in
+    partitions ({table: [(where, params)]}) are processed a partition per task.
+    When there is work for one worker only, it runs in this process instead.
+    Yields one result per table or partition as soon as it is done (not in
+    table order): 'table_name', 'partition' (its index, or None), 'status'
+    ('completed' or 'failed'), 'duration' and either 'stats' (the Deidentifier
+    statistics of the task, plus 'write' with its BulkWriter statistics) or
+    'error'.
+
+    When writing, the first partition of a table that has rows creates the
+    destination table, and only then are the others appended concurrently.
+
+    Tables in resume ({table: {partition index, or None: {'after': last key}}},
+    from CheckpointStore.plan) continue from their checkpoints: only the
+    partitions listed are processed, appending to the destination table. If
+    on_checkpoint is given, on_checkpoint(table_name, partition index,
+    last_key, rows, completed) is called in this process for every chunk the
+    workers write and every table or partition they complete.
+    """
+    partitions = partitions or {}
+    resume = resume or {}
+    if not tables:
+        return
+    if _pool_size(tables, partitions, max_workers, resume) == 1:
+        # A single worker runs in this process: nothing to spawn or share
+        context = manager = None
+        checkpoints = Queue() if on_checkpoint is not None else None
+    else:
+        # Spawned workers do not inherit the locks and connections of a threaded parent
+        context = multiprocessing.get_context('spawn')
+        manager = context.Manager() if on_checkpoint is not None else None
+        checkpoints = manager.Queue() if manager is not None else None
+
+    def report_checkpoints():
+        while checkpoints is not None:
+            try:
+                event = checkpoints.get_nowait()
+            except Empty:
+                break
+            on_checkpoint(*event)
+
+    try:
+        yield from _run_pool(context, connection_params, rule_plan, tables, max_workers, chunk_size,
+                             destination_params, partitions, resume, checkpoints, report_checkpoints)
+    finally:
+        if manager is not None:
+            manager.shutdown()
+
+
+def _run_pool(context, connection_params, rule_plan, tables, max_workers, chunk_size, destination_params,
+              partitions, resume, checkpoints, report_checkpoints) -> Iterator[Dict[str, Any]]:
+    """
+    Submit the tables and partitions of process_tables to a pool and yield
+    their results. Without a multiprocessing context, they run in this process.
+    """
+    initargs = (connection_params, rule_plan, chunk_size, destination_params, checkpoints)
+    if context is None:
+        pool = _InProcessExecutor(_init_worker, initargs)
+    else:
+        pool = ProcessPoolExecutor(max_workers=_pool_size(tables, partitions, max_workers, resume),
+                                   mp_context=context, initializer=_init_worker, initargs=initargs)
+    with pool as executor:
+        futures = {}
+        # Partitions of each table waiting for the destination table to be created
+        waiting = {}
+
+        def submit(table_name, partition=None, append=False, table_resume=None):
+            future = executor.submit(_process_table, table_name, partition, append, table_resume)
+            futures[future] = (table_name, partition[0] if partition else None)
+
+        for table_name in tables:
+            table_partitions = [(i, where, params) for i, (where, params) in enumerate(partitions.get(table_name, []))]
+            if table_name in resume:
+                # Continued from checkpoints: the destination table exists
+                for partition in table_partitions or [None]:
+                    index = partition[0] if partition else None
+                    if index in resume[table_name]:
+                        submit(table_name, partition, append=True, table_resume=resume[table_name][index])
+            elif not table_partitions:
+                submit(table_name)
+            elif destination_params:
+                submit(table_name, table_partitions[0])
+                waiting[table_name] = table_partitions[1:]
+            else:
+                for partition in table_partitions:
+                    submit(table_name, partition)
+
+        while futures:
+            done, _ = wait(futures, timeout=CHECKPOINT_POLL_SECONDS if checkpoints is not None else None,
+                           return_when=FIRST_COMPLETED)
+            # Workers report checkpoints before they return, so these are recorded before their results
+            report_checkpoints()
+            for future in done:
+                table_name, index = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # The worker process itself died
+                    result = {'table_name': table_name, 'partition': index, 'status': 'failed',
+                              'duration': None, 'error': str(e)}
+
+                rest = waiting.pop(table_name, None)
+                if rest is not None:
+                    if result['status'] != 'completed':
+                        for partition in rest:
+                            yield {'table_name': table_name, 'partition': partition[0], 'status': 'failed',
+                                   'duration': None, 'error': f"Partition {index} failed"}
+                    elif result['stats']['total_records'] == 0 and rest:
+                        # Nothing written yet, so the next partition creates the table
+                        submit(table_name, rest[0])
+                        waiting[table_name] = rest[1:]
+                    else:
+                        for partition in rest:
+                            submit(table_name, partition, append=True)
+                yield result
+
+
+def run_parallel(deidentifier: Deidentifier, tables: List[str], max_workers: int = DEFAULT_WORKERS,
+                 destination_params: Optional[Dict[str, Any]] = None,
+                 partition_rows: int = DEFAULT_PARTITION_ROWS, checkpoints=None) -> Dict[str, Any]:
+    """
+    Process tables with process_tables, using the connection, rule plan and
+    chunk size of deidentifier, and merge the statistics of the workers into
+    its statistics. Tables of more than partition_rows rows are split with
+    plan_partitions (0 turns this off). Failed tables are logged and listed
+    under 'failed_tables' with their errors; the other tables are processed
+    regardless. Returns the merged statistics.
+
+    With a CheckpointStore, progress is checkpointed as chunks are written,
+    and a run with checkpoints continues from them: completed tables and
+    partitions are skipped (counted in 'skipped_tables'), and the others
+    resume after their last checkpoint where possible.
+    """
+    start = time.perf_counter()
+    connection_params = deidentifier.db_connection.get_connection_params()
+    partitions = plan_partitions(deidentifier, tables, max_workers, partition_rows)
+    resume = {}
+    skipped_tables = 0
+    if checkpoints is not None:
+        todo, partitions, resume = checkpoints.plan(deidentifier, tables, partitions)
+        skipped_tables = len(tables) - len(todo)
+        tables = todo
+    write_tables = {}
+    failed_tables = {}
+    partition_rows_done = {}
+    for result in process_tables(connection_params, deidentifier.rule_plan, tables, max_workers=max_workers,
+                                 chunk_size=deidentifier.chunk_size, destination_params=destination_params,
+                                 partitions=partitions, resume=resume,
+                                 on_checkpoint=checkpoints.record if checkpoints is not None else None):
+        table_name = result['table_name']
+        if result['status'] == 'completed':
+            deidentifier.merge_statistics(result['stats'])
+            if result['partition'] is not None:
+                partition_rows_done.setdefault(table_name, []).append(result['stats']['total_records'])
+            if 'write' in result:
+                write = write_tables.setdefault(table_name, {'rows': 0, 'batches': 0, 'seconds': 0.0,
+                                                             'method': result['write']['method']})
+                for key in ('rows', 'batches', 'seconds'):
+                    write[key] += result['write'][key]
+                write['rows_per_second'] = write['rows'] / write['seconds'] if write['seconds'] else 0.0
+        else:
+            error = result['error'] if result['partition'] is None else f"Partition {result['partition']}: {result['error']}"
+            failed_tables.setdefault(table_name, error)
+            logger.warning(f"De-identification of table {table_name} failed: {error}")
+
+    # Partitions are not counted as tables by the workers
+    for table_name, rows in partition_rows_done.items():
+        if table_name not in failed_tables and sum(rows):
+            deidentifier.stats['tables_processed'] += 1
+
+    stats = deidentifier.get_statistics()
+    stats['workers'] = _pool_size(tables, partitions, max_workers, resume)
+    stats['skipped_tables'] = skipped_tables
+    stats['partitioned_tables'] = {table_name: len(parts) for table_name, parts in partitions.items()}
+    stats['elapsed_seconds'] = time.perf_counter() - start
+    stats['failed_tables'] = failed_tables
+    if destination_params:
+        rows = sum(table['rows'] for table in write_tables.values())
+        seconds = sum(table['seconds'] for table in write_tables.values())
+        stats['write'] = {
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_second': rows / seconds if seconds else 0.0,
+            'tables': write_tables
+        }
+    logger.info(f"De-identified {len(tables) - len(failed_tables)}/{len(tables)} tables with "
+                f"{stats['workers']} workers in {stats['elapsed_seconds']:.1f}s")
+    return stats
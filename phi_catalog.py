@@ -0,0 +1,97 @@
+import logging
+import datetime
+from typing import List, Dict, Any
+from app import db
+from models import PHIColumnCatalog
+
+logger = logging.getLogger(__name__)
+
+
+def get_fingerprints(connection_id: int, table_name: str = None) -> Dict[str, Dict[str, str]]:
+    """Catalog fingerprints of a connection's columns as {table: {column: fingerprint}}."""
+    query = PHIColumnCatalog.query.filter_by(connection_id=connection_id)
+    if table_name:
+        query = query.filter_by(table_name=table_name)
+    fingerprints = {}
+    for entry in query.all():
+        fingerprints.setdefault(entry.table_name, {})[entry.column_name] = entry.fingerprint
+    return fingerprints
+
+
+# PHI type statistics kept in the catalog and scan results; example values and contexts are raw PHI
+STORED_PHI_TYPE_KEYS = ('type', 'frequency', 'avg_confidence', 'row_share', 'confidence_interval')
+
+
+def stored_phi_types(phi_types: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """PHI type statistics without their example values and contexts, to be stored."""
+    return [{key: phi_type[key] for key in STORED_PHI_TYPE_KEYS if key in phi_type} for phi_type in phi_types]
+
+
+def stored_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """A PHIService.analyze_database_columns result with the PHI types of its columns as stored_phi_types."""
+    columns = []
+    for column in analysis.get('columns', []):
+        column_analysis = dict(column['analysis'], phi_types=stored_phi_types(column['analysis']['phi_types']))
+        columns.append(dict(column, analysis=column_analysis))
+    return dict(analysis, columns=columns)
+
+
+def save_analysis(connection_id: int, analysis: Dict[str, Any], detection_mode: str = 'pattern') -> int:
+    """
+    Record the columns analyzed by PHIService.analyze_database_columns in the
+    catalog, replacing their previous entries. Columns without PHI are recorded
+    too, with no PHI types. Example values and contexts are not stored. The caller commits. Returns the number of columns saved.
+    """
+    table_name = analysis['table_name']
+    phi_columns = {column['name']: stored_phi_types(column['analysis']['phi_types']) for column in analysis['columns']}
+    existing = {
+        entry.column_name: entry
+        for entry in PHIColumnCatalog.query.filter_by(connection_id=connection_id, table_name=table_name).all()
+    }
+
+    now = datetime.datetime.utcnow()
+    for column in analysis.get('scanned_columns', []):
+        entry = existing.get(column['name'])
+        if entry is None:
+            entry = PHIColumnCatalog(connection_id=connection_id, table_name=table_name, column_name=column['name'])
+            db.session.add(entry)
+        entry.column_type = column['type']
+        entry.detection_mode = detection_mode
+        entry.set_phi_types(phi_columns.get(column['name'], []))
+        entry.sample_size = column['sample_size']
+        entry.row_count = analysis.get('row_count')
+        entry.fingerprint = column['fingerprint']
+        entry.scanned_at = now
+    return len(analysis.get('scanned_columns', []))
+
+
+def get_table_analysis(connection_id: int, table_name: str, columns: List[str] = None) -> Dict[str, Any]:
+    """
+    Catalog entries of a table in the format of PHIService.analyze_database_columns,
+    i.e. the PHI columns with their 'analysis', as input for suggest_deidentification_plan.
+    """
+    query = PHIColumnCatalog.query.filter_by(connection_id=connection_id, table_name=table_name)
+    results = {
+        'table_name': table_name,
+        'columns': []
+    }
+    for entry in query.order_by(PHIColumnCatalog.id).all():
+        if columns and entry.column_name not in columns:
+            continue
+        phi_types = entry.get_phi_types()
+        if not phi_types:
+            continue
+        results['columns'].append({
+            'name': entry.column_name,
+            'type': entry.column_type,
+            'analysis': {
+                'column_name': entry.column_name,
+                'total_rows': entry.sample_size,
+                'table_rows': entry.row_count,
+                'phi_detected': True,
+                'phi_types': phi_types,
+                'detection_mode': entry.detection_mode,
+                'scanned_at': entry.scanned_at.isoformat() if entry.scanned_at else None
+            }
+        })
+    return results
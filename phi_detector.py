@@ -1,8 +1,17 @@
+import os
 import re
+import hashlib
 import logging
-from typing import List, Dict, Any, Tuple
+import threading
+from typing import List, Dict, Any, Tuple, Union, Iterable
 import json
-from ai_service import AIPhiDetector
+import numpy as np
+import pandas as pd
+from phi_scanner import PatternScanner
+from span_resolver import SpanIndex, resolve_overlaps
+from detection_cache import DetectionCache
+from column_profiler import profile_column, profile_summary
+from column_sampler import ColumnStats, growing_batches, rows_to_detect, wilson_interval, z_score
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +21,9 @@ class PHIDetector:
     Similar to Presidio but focused on healthcare data.
     """
 
-    def __init__(self):
+    def __init__(self, use_scanner: bool = True, use_prefilter: bool = True,
+                 cache_size: int = 0, cache_max_bytes: int = 64 * 1024 * 1024, use_ai: bool = True,
+                 ai_backend=None):
         # Initialize patterns for different types of PHI
         self.patterns = {
             'patient_id': [
@@ -85,51 +96,298 @@ class PHIDetector:
         for name, pattern in self.name_patterns.items():
             self.compiled_patterns[name] = [re.compile(pattern)]
 
-        try:
-            self.ai_detector = AIPhiDetector()
-            self.ai_enabled = True
-        except Exception as e:
-            logger.warning(f"AI detection disabled: {str(e)}")
-            self.ai_enabled = False
+        # Scanner over all compiled patterns (same findings as the per-pattern loop), with a
+        # prefilter that skips patterns a text cannot match and batched passes over many texts
+        self.scanner = PatternScanner(self.compiled_patterns, use_prefilter=use_prefilter) if use_scanner else None
+
+        # Optional LRU cache of detection results for repeated values; entries are
+        # keyed by the text and a version of the pattern configuration
+        self.config_version = hashlib.sha256(
+            json.dumps([self.patterns, self.name_patterns], sort_keys=True).encode('utf-8')
+        ).hexdigest()[:16]
+        self.cache = DetectionCache(cache_size, cache_max_bytes) if cache_size > 0 else None
+
+        # The AI client is only created the first time AI detection is needed; ai_backend
+        # (see ai_backends) replaces the Google API, e.g. with a StubBackend for offline runs
+        self.use_ai = use_ai
+        self.ai_backend = ai_backend
+        self.ai_detector = None
+        self._ai_init_failed = False
+        self._ai_lock = threading.Lock()
+
+    @property
+    def ai_enabled(self) -> bool:
+        """Whether AI detection is available, creating the AI client on first use."""
+        if self.use_ai and self.ai_detector is None and not self._ai_init_failed:
+            self._init_ai_detector()
+        return self.use_ai and self.ai_detector is not None
+
+    def _init_ai_detector(self):
+        """Create the AI client once, even when several threads ask for it at the same time."""
+        with self._ai_lock:
+            if self.ai_detector is not None or self._ai_init_failed:
+                return
+            try:
+                from ai_service import AIPhiDetector
+                self.ai_detector = AIPhiDetector(backend=self.ai_backend)
+            except Exception as e:
+                logger.warning(f"AI detection disabled: {str(e)}")
+                self._ai_init_failed = True
 
-    def detect_phi(self, text: str) -> List[Dict[str, Any]]:
+    def detect_phi(self, text: str, merge_overlaps: bool = True) -> List[Dict[str, Any]]:
         """
         Detect PHI in the given text using both pattern matching and AI detection.
+        Overlapping findings are merged into non-overlapping spans unless
+        merge_overlaps is False.
         """
         if not text or not isinstance(text, str):
             return []
 
+        if self.cache is not None:
+            key = self._cache_key(text, merge_overlaps)
+            findings = self.cache.get(key)
+            if findings is None:
+                findings = self._detect_phi(text, merge_overlaps)
+                self.cache.put(key, findings)
+            return [dict(finding) for finding in findings]
+
+        return self._detect_phi(text, merge_overlaps)
+
+    def _detect_phi(self, text: str, merge_overlaps: bool) -> List[Dict[str, Any]]:
+        """Uncached detect_phi."""
         # Get pattern-based findings
         findings = []
-        for phi_type, patterns in self.compiled_patterns.items():
-            for pattern in patterns:
-                matches = pattern.finditer(text)
-                for match in matches:
-                    context = self._get_context(text, match.start(), match.end())
-                    findings.append({
-                        'type': phi_type,
-                        'value': match.group(0),
-                        'start': match.start(),
-                        'end': match.end(),
-                        'context': context,
-                        'confidence': self._calculate_confidence(phi_type, match.group(0), context),
-                        'source': 'pattern'
-                    })
+        for phi_type, start, end in self._find_pattern_matches(text):
+            value = text[start:end]
+            context = self._get_context(text, start, end)
+            findings.append({
+                'type': phi_type,
+                'value': value,
+                'start': start,
+                'end': end,
+                'context': context,
+                'confidence': self._calculate_confidence(phi_type, value, context),
+                'source': 'pattern'
+            })
 
         # Add AI-based findings if available
-        if self.ai_enabled and len(text.split()) > 5:  # Only use AI for longer text
-            try:
-                ai_findings = self.ai_detector.analyze_medical_text(text)
-                for finding in ai_findings['findings']:
-                    # Avoid duplicates
-                    if not any(self._is_overlapping(finding, f) for f in findings):
-                        finding['source'] = 'ai'
-                        findings.append(finding)
-            except Exception as e:
-                logger.error(f"Error in AI PHI detection: {str(e)}")
+        findings.extend(self._find_ai_findings(text, findings))
 
+        if merge_overlaps:
+            return resolve_overlaps(findings, text, self._get_context)
         return sorted(findings, key=lambda x: x['start'])
 
+    def detect_phi_batch(self, series: pd.Series, merge_overlaps: bool = True) -> pd.DataFrame:
+        """
+        Detect PHI in every value of a Series at once.
+
+        Returns a findings frame with one row per finding: 'row' (the index label
+        of the value), 'type', 'value', 'start', 'end', 'context', 'confidence'
+        and 'source'. Per value, findings are the same and in the same order as
+        detect_phi returns them with the same merge_overlaps setting.
+        """
+        columns = ['row', 'type', 'value', 'start', 'end', 'context', 'confidence', 'source']
+        texts = series[series.map(lambda value: isinstance(value, str) and value != '').astype(bool)]
+        values = texts.tolist()
+
+        if self.cache is not None:
+            frame = self._detect_phi_frame_cached(values, merge_overlaps)
+        else:
+            frame = self._detect_phi_frame(values, merge_overlaps)
+
+        frame['row'] = texts.index[frame['position'].to_numpy(dtype='int64')]
+        return frame.reindex(columns=columns).reset_index(drop=True)
+
+    def _detect_phi_frame(self, values: List[str], merge_overlaps: bool) -> pd.DataFrame:
+        """Findings frame for the values, with a 'position' column instead of 'row'."""
+        # Pattern matches for the whole column in one scan over the joined values
+        if self.scanner is not None:
+            matches = self.scanner.scan_batch(values)
+        else:
+            matches = [
+                (position, phi_type, start, end)
+                for position, text in enumerate(values)
+                for phi_type, start, end in self._find_pattern_matches(text)
+            ]
+
+        frame = pd.DataFrame(matches, columns=['position', 'type', 'start', 'end'])
+        frame['value'] = [values[p][s:e] for p, s, e in zip(frame['position'], frame['start'], frame['end'])]
+        frame['context'] = [
+            self._get_context(values[p], s, e) for p, s, e in zip(frame['position'], frame['start'], frame['end'])
+        ]
+        frame['confidence'] = [
+            self._calculate_confidence(t, v, c) for t, v, c in zip(frame['type'], frame['value'], frame['context'])
+        ]
+        frame['source'] = 'pattern'
+
+        if self.ai_enabled:
+            ai_rows = []
+            pattern_findings = {position: group.to_dict('records') for position, group in frame.groupby('position')}
+            # One concurrent, packed AI request batch for the whole column
+            positions = [position for position, text in enumerate(values) if self._wants_ai(text)]
+            ai_results = self._analyze_ai_texts([values[position] for position in positions])
+            for position, ai_result in zip(positions, ai_results):
+                for finding in self._new_ai_findings(ai_result, pattern_findings.get(position, [])):
+                    ai_rows.append(dict(finding, position=position))
+            if ai_rows:
+                frame = pd.concat([frame, pd.DataFrame(ai_rows)], ignore_index=True)
+
+        frame = frame.sort_values(['position', 'start'], kind='stable')
+        if merge_overlaps:
+            frame = self._merge_overlapping_rows(frame, values)
+        return frame
+
+    def _detect_phi_frame_cached(self, values: List[str], merge_overlaps: bool) -> pd.DataFrame:
+        """
+        _detect_phi_frame through the result cache: each distinct value is looked
+        up once and only the misses are scanned.
+        """
+        keys = [self._cache_key(text, merge_overlaps) for text in values]
+        results = {}
+        misses = {}
+        for key, text in zip(keys, values):
+            if key in results or key in misses:
+                continue
+            findings = self.cache.get(key)
+            if findings is None:
+                misses[key] = text
+            else:
+                results[key] = findings
+
+        if misses:
+            frame = self._detect_phi_frame(list(misses.values()), merge_overlaps)
+            by_position = {
+                position: [self._frame_record(record) for record in group.to_dict('records')]
+                for position, group in frame.groupby('position')
+            }
+            for position, key in enumerate(misses):
+                results[key] = by_position.get(position, [])
+                self.cache.put(key, results[key])
+
+        rows = [dict(finding, position=position) for position, key in enumerate(keys) for finding in results[key]]
+        if not rows:
+            return pd.DataFrame(columns=['position', 'type', 'start', 'end'])
+        return pd.DataFrame(rows)
+
+    def _frame_record(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn a findings frame row back into a detect_phi finding."""
+        # Columns a finding does not have (e.g. 'context' of AI findings) are NaN in the frame
+        return {
+            key: value for key, value in record.items()
+            if key != 'position' and not (isinstance(value, float) and value != value)
+        }
+
+    def _find_ai_findings(self, text: str, findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """AI-based findings for the text that do not overlap the given findings."""
+        if not self.ai_enabled or not self._wants_ai(text):
+            return []
+        return self._new_ai_findings(self._analyze_ai_texts([text])[0], findings)
+
+    def _wants_ai(self, text: str) -> bool:
+        """Only use AI for longer text."""
+        return len(text.split()) > 5
+
+    def _analyze_ai_texts(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """AI analysis results for the texts, empty ones if the AI service fails."""
+        try:
+            return self.ai_detector.analyze_medical_texts(texts)
+        except Exception as e:
+            logger.error(f"Error in AI PHI detection: {str(e)}")
+            return [{'findings': []} for _ in texts]
+
+    def _new_ai_findings(self, ai_result: Dict[str, Any], findings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """AI findings from an analysis result that do not overlap the given or earlier AI findings."""
+        new_findings = []
+        spans = SpanIndex((f['start'], f['end']) for f in findings)
+        for finding in ai_result['findings']:
+            # Avoid duplicates
+            if not spans.overlaps(finding['start'], finding['end']):
+                finding['source'] = 'ai'
+                new_findings.append(finding)
+                spans.add(finding['start'], finding['end'])
+        return new_findings
+
+    def _merge_overlapping_rows(self, frame: pd.DataFrame, values: List[str]) -> pd.DataFrame:
+        """
+        Frame version of span_resolver.resolve_overlaps. Expects the frame sorted
+        by position and start; each run of overlapping findings within a value is
+        collapsed into its highest-priority row, widened to the run's union.
+        """
+        if frame.empty:
+            return frame
+
+        # A finding starts a new run unless it begins before the furthest end seen so far in its
+        # value. Positions are sorted, so a running max of position * scale + end never carries
+        # an end over from an earlier value.
+        positions = frame['position'].to_numpy(dtype='int64')
+        starts = frame['start'].to_numpy(dtype='int64')
+        scale = int(frame['end'].max()) + 1
+        furthest = np.maximum.accumulate(positions * scale + frame['end'].to_numpy(dtype='int64'))
+        new_run = np.ones(len(frame), dtype=bool)
+        new_run[1:] = (positions[1:] != positions[:-1]) | (starts[1:] >= furthest[:-1] - positions[1:] * scale)
+        if new_run.all():
+            return frame
+
+        frame = frame.reset_index(drop=True)
+        frame['run'] = new_run.cumsum()
+
+        runs = frame.groupby('run')
+        run_start = runs['start'].transform('min')
+        run_end = runs['end'].transform('max')
+
+        # Same ranking as span_resolver.finding_priority; the stable sort keeps the first of equals
+        frame['length'] = frame['end'] - frame['start']
+        frame['is_pattern'] = frame['source'] == 'pattern'
+        best = frame.sort_values(
+            ['run', 'confidence', 'length', 'is_pattern'],
+            ascending=[True, False, False, False],
+            kind='stable'
+        ).drop_duplicates('run')
+
+        widened = (run_start[best.index] != best['start']) | (run_end[best.index] != best['end'])
+        best = best.drop(columns=['run', 'length', 'is_pattern'])
+        if widened.any():
+            best = best.copy()
+            for i in best.index[widened]:
+                position, start, end = best.at[i, 'position'], run_start[i], run_end[i]
+                best.at[i, 'start'], best.at[i, 'end'] = start, end
+                best.at[i, 'value'] = values[position][start:end]
+                if isinstance(best.at[i, 'context'], str):
+                    best.at[i, 'context'] = self._get_context(values[position], start, end)
+        return best.sort_index()
+
+    def _find_pattern_matches(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        Find all pattern matches as (phi_type, start, end), ordered by category,
+        then pattern, then position.
+        """
+        if self.scanner is not None:
+            return self.scanner.scan(text)
+
+        matches = []
+        for phi_type, patterns in self.compiled_patterns.items():
+            for pattern in patterns:
+                for match in pattern.finditer(text):
+                    matches.append((phi_type, match.start(), match.end()))
+        return matches
+
+    def _cache_key(self, text: str, merge_overlaps: bool) -> bytes:
+        """Result cache key for the text under the current detector configuration."""
+        version = f"{self.config_version}:{int(self.ai_enabled)}:{int(merge_overlaps)}"
+        return self.cache.make_key(text, version)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Result cache hit/miss counters and size, or an empty dict if caching is off."""
+        if self.cache is None:
+            return {}
+        return self.cache.get_stats()
+
+    def get_prefilter_stats(self) -> Dict[str, Any]:
+        """Pattern prefilter hit/skip counters, or an empty dict if the prefilter is off."""
+        if self.scanner is None or self.scanner.prefilter is None:
+            return {}
+        return self.scanner.prefilter.get_stats()
+
     def _get_context(self, text: str, start: int, end: int, window: int = 50) -> str:
         """Get surrounding context for a match."""
         text_start = max(0, start - window)
@@ -298,55 +556,106 @@ class PHIDetector:
 
         return suggestions
 
-    def analyze_database_column(self, column_name: str, sample_data: List[str]) -> Dict[str, Any]:
+    def analyze_database_column(self, column_name: str, sample_data: Union[List[str], pd.Series],
+                                use_profile: bool = True) -> Dict[str, Any]:
         """
         Analyze a database column for PHI content.
         Returns statistics about detected PHI with column-specific context.
-        """
-        total_rows = len(sample_data)
-        phi_stats = {}
 
-        for text in sample_data:
-            if not text or not isinstance(text, str):
-                continue
-
-            findings = self.detect_phi(text)
-            for finding in findings:
-                phi_type = finding['type']
-                if phi_type not in phi_stats:
-                    phi_stats[phi_type] = {
-                        'count': 0,
-                        'confidence_sum': 0,
-                        'examples': [],
-                        'contexts': set()
-                    }
-
-                phi_stats[phi_type]['count'] += 1
-                phi_stats[phi_type]['confidence_sum'] += finding['confidence']
-                if len(phi_stats[phi_type]['examples']) < 3:  # Keep up to 3 examples
-                    phi_stats[phi_type]['examples'].append(finding['value'])
-                if finding.get('context'):
-                    phi_stats[phi_type]['contexts'].add(finding['context'])
-
-        # Calculate statistics and format results
+        Structured columns (short values sharing a few shapes, see column_profiler)
+        are classified from their shapes: the first value of each shape is scanned
+        and its findings count for every value of that shape, which differs from
+        it only in its digits. Only free-text
+        columns, or all columns if use_profile is False, are scanned row by row.
+        """
+        if not isinstance(sample_data, pd.Series):
+            sample_data = pd.Series(list(sample_data), dtype=object)
+
+        stats = ColumnStats()
+        findings, profile = self._column_findings(sample_data, use_profile)
+        stats.add(findings, len(sample_data))
+        return self._column_results(column_name, stats, z_score(0.95), profile)
+
+    def analyze_database_column_adaptive(self, column_name: str, chunks: Iterable[Iterable[Any]],
+                                         confidence: float = 0.95, margin: float = 0.05,
+                                         min_rows: int = 40, max_rows: int = 1000, first_batch: int = 40,
+                                         use_profile: bool = True, min_share: float = 0.01) -> Dict[str, Any]:
+        """
+        Analyze a column from a stream of values (chunks, e.g. from a streamed
+        query) in growing batches, stopping once the confidence interval of the
+        share of rows with each PHI type, and with an unseen type, is within
+        +/- margin. Rare PHI is not ruled out by the margin alone: ambiguous
+        columns (see _is_ambiguous) read at least rows_to_detect(min_share,
+        confidence) rows (the rule of three, 300 rows for 1% at 95%), so a PHI
+        type in min_share of the rows is seen with that confidence. None reads
+        more than max_rows values.
+
+        Returns the analyze_database_column result, with 'row_share' and
+        'confidence_interval' per PHI type, plus 'stopped_early'.
+        """
+        z = z_score(confidence)
+        floor_rows = rows_to_detect(min_share, confidence)
+        stats = ColumnStats()
+        profile = None
+        stopped_early = False
+
+        for batch in growing_batches(chunks, first_batch, max_rows):
+            findings, profile = self._column_findings(batch, use_profile)
+            stats.add(findings, len(batch))
+            if stats.total_rows >= min_rows and stats.max_half_width(z) <= margin:
+                if stats.total_rows >= floor_rows or not self._is_ambiguous(column_name, stats, z, profile):
+                    stopped_early = stats.total_rows < max_rows
+                    break
+
+        logger.debug(f"Sampled {stats.total_rows} rows of column {column_name}")
+        return self._column_results(column_name, stats, z, profile, stopped_early)
+
+    def _is_ambiguous(self, column_name: str, stats: ColumnStats, z: float, profile: Dict[str, Any] = None) -> bool:
+        """
+        Whether rare PHI could still change the verdict on a column: it is not
+        PHI in most of its rows, and it is free text or its name suggests PHI.
+        A structured column of another name, or one with a PHI type in most rows,
+        is settled by the margin alone.
+        """
+        if any(wilson_interval(type_stats['rows'], stats.total_rows, z)[0] >= 0.5
+               for type_stats in stats.types.values()):
+            return False
+        if profile is not None and profile['kind'] == 'structured':
+            return self._analyze_column_characteristics(column_name)['likely_phi']
+        return True
+
+    def _column_findings(self, sample_data: pd.Series, use_profile: bool):
+        """
+        Findings frame for a column sample, with a 'weight' column (the number of
+        values a finding stands for), and the column profile if one was made.
+        """
+        profile = None
+        if use_profile:
+            texts = sample_data[sample_data.map(lambda value: isinstance(value, str) and value != '').astype(bool)]
+            profile = profile_column(texts)
+
+        if profile is not None and profile['kind'] == 'structured':
+            findings = self.detect_phi_batch(pd.Series(profile['representatives'].to_numpy(), dtype=object))
+            findings['weight'] = profile['shape_counts'].to_numpy()[findings['row'].to_numpy(dtype='int64')]
+        else:
+            findings = self.detect_phi_batch(sample_data)
+            findings['weight'] = 1
+        return findings, profile
+
+    def _column_results(self, column_name: str, stats: ColumnStats, z: float,
+                        profile: Dict[str, Any] = None, stopped_early: bool = False) -> Dict[str, Any]:
+        """Format column statistics as an analyze_database_column result."""
         results = {
             'column_name': column_name,
-            'total_rows': total_rows,
-            'phi_detected': len(phi_stats) > 0,
-            'phi_types': []
+            'total_rows': stats.total_rows,
+            'phi_detected': bool(stats.types),
+            'phi_types': stats.phi_types(z) if stats.total_rows else [],
+            'stopped_early': stopped_early
         }
 
-        for phi_type, stats in phi_stats.items():
-            results['phi_types'].append({
-                'type': phi_type,
-                'frequency': stats['count'] / total_rows,
-                'avg_confidence': stats['confidence_sum'] / stats['count'] if stats['count'] > 0 else 0,
-                'example_values': stats['examples'],
-                'contexts': list(stats['contexts'])[:3]  # Limit to 3 contexts
-            })
-
         # Add column-specific analysis
         results['column_analysis'] = self._analyze_column_characteristics(column_name)
+        results['column_profile'] = profile_summary(profile) if profile is not None else None
 
         return results
 
@@ -376,7 +685,32 @@ class PHIDetector:
                 ])
 
         return characteristics
-    
-    def _is_overlapping(self, finding1: Dict[str, Any], finding2: Dict[str, Any]) -> bool:
-        """Check if two findings overlap in the text."""
-        return not (finding1['end'] <= finding2['start'] or finding2['end'] <= finding1['start'])
\ No newline at end of file
+
+
+# Process-wide detectors shared by all requests and threads, one per detection mode
+DETECTION_MODES = ('pattern', 'ai')
+# Result cache entries of each shared detector (0 turns the cache off), shared with TextRedactor
+SHARED_CACHE_SIZE = int(os.environ.get('DEID_DETECTION_CACHE_SIZE', 10000))
+_shared_detectors = {}
+_shared_detectors_lock = threading.Lock()
+
+
+def get_shared_detector(detection_mode: str = 'pattern') -> PHIDetector:
+    """
+    Get the process-wide PHIDetector for a detection mode: 'pattern' for
+    regex-based detection only, 'ai' to add AI detection. Detectors are
+    created on first use, with a result cache of SHARED_CACHE_SIZE entries,
+    and are safe to share between threads.
+    """
+    if detection_mode not in DETECTION_MODES:
+        raise ValueError(f"Unknown detection mode: {detection_mode}")
+
+    detector = _shared_detectors.get(detection_mode)
+    if detector is None:
+        with _shared_detectors_lock:
+            detector = _shared_detectors.get(detection_mode)
+            if detector is None:
+                detector = PHIDetector(use_ai=detection_mode == 'ai', cache_size=SHARED_CACHE_SIZE)
+                _shared_detectors[detection_mode] = detector
+                logger.info(f"Created shared PHI detector for '{detection_mode}' detection")
+    return detector
@@ -0,0 +1,197 @@
+import os
+import time
+import logging
+import argparse
+import datetime
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterator, Optional
+from db_connector import DatabaseConnector
+from phi_service import PHIService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = int(os.environ.get('PHI_DISCOVERY_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Per-process state of the discovery workers, set up once by _init_worker
+_worker_connector = None
+_worker_service = None
+
+
+def _init_worker(connection_params: Dict[str, Any]):
+    """Open a database engine of its own in a worker process."""
+    global _worker_connector, _worker_service
+    connector = DatabaseConnector(**connection_params)
+    if connector.connect():
+        _worker_connector = connector
+    _worker_service = PHIService()
+
+
+def _scan_table(table_name: str, detection_mode: str, max_rows: int, margin: float,
+                fingerprints: Dict[str, str] = None) -> Dict[str, Any]:
+    """Analyze one table in a worker process. Never raises, so one table cannot fail the run."""
+    start = time.perf_counter()
+    if _worker_connector is None:
+        analysis = {'error': 'Could not connect to database'}
+    else:
+        try:
+            analysis = _worker_service.analyze_database_columns(
+                connection=_worker_connector,
+                table_name=table_name,
+                detection_mode=detection_mode,
+                max_rows=max_rows,
+                margin=margin,
+                fingerprints=fingerprints
+            )
+        except Exception as e:
+            analysis = {'error': str(e)}
+
+    result = {
+        'table_name': table_name,
+        'duration': time.perf_counter() - start
+    }
+    if 'error' in analysis:
+        result.update(status='failed', error=analysis['error'])
+    else:
+        result.update(status='completed', analysis=analysis)
+    return result
+
+
+def discover_tables(connection_params: Dict[str, Any], tables: List[str], detection_mode: str = 'pattern',
+                    max_workers: int = DEFAULT_WORKERS, max_rows: int = 1000, margin: float = 0.05,
+                    fingerprints: Dict[str, Dict[str, str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Analyze tables for PHI in a pool of max_workers processes, each with its own
+    database engine. Yields one result per table as soon as it is done (not in
+    table order): 'table_name', 'status' ('completed' or 'failed'), 'duration'
+    and either 'analysis' (the output of PHIService.analyze_database_columns)
+    or 'error'. Columns whose fingerprint in fingerprints ({table: {column:
+    fingerprint}}) is unchanged are skipped.
+    """
+    fingerprints = fingerprints or {}
+    if not tables:
+        return
+    # Spawned workers do not inherit the locks and connections of a threaded parent
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(tables))), mp_context=context,
+                             initializer=_init_worker, initargs=(connection_params,)) as executor:
+        futures = {
+            executor.submit(_scan_table, table_name, detection_mode, max_rows, margin,
+                            fingerprints.get(table_name)): table_name
+            for table_name in tables
+        }
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                # The worker process itself died
+                yield {'table_name': futures[future], 'status': 'failed', 'duration': None, 'error': str(e)}
+
+
+def run_discovery_job(job_id: int, tables: Optional[List[str]] = None, max_workers: int = DEFAULT_WORKERS,
+                      max_rows: int = 1000, margin: float = 0.05):
+    """
+    Run a PHIScanJob: enumerate the tables of its connection (unless given),
+    analyze them with discover_tables and store each table's result, its
+    columns in the PHI catalog and the job progress as results come in. Columns
+    unchanged since their last catalog scan are skipped.
+    """
+    # Imported here so worker processes, which import this module, do not create the app
+    from app import app, db
+    from models import PHIScanJob, PHITableScan
+    from phi_catalog import get_fingerprints, save_analysis, get_table_analysis, stored_analysis
+
+    with app.app_context():
+        job = PHIScanJob.query.get(job_id)
+        if job is None:
+            logger.error(f"PHI scan job {job_id} not found")
+            return
+
+        try:
+            connector = DatabaseConnector.get_db_connection_from_model(job.connection)
+            if not connector.connect():
+                raise Exception("Could not connect to database")
+            if tables is None:
+                tables = connector.get_tables()
+            connection_params = connector.get_connection_params()
+            connector.disconnect()
+
+            job.status = 'running'
+            job.tables_total = len(tables)
+            db.session.commit()
+            logger.info(f"PHI scan job {job_id}: analyzing {len(tables)} tables with {max_workers} workers")
+
+            fingerprints = get_fingerprints(job.connection_id)
+            for result in discover_tables(connection_params, tables, job.detection_mode,
+                                          max_workers=max_workers, max_rows=max_rows, margin=margin,
+                                          fingerprints=fingerprints):
+                table_scan = PHITableScan(
+                    job_id=job.id,
+                    table_name=result['table_name'],
+                    status=result['status'],
+                    duration=result['duration'],
+                    error=result.get('error')
+                )
+                if result['status'] == 'completed':
+                    table_scan.set_analysis(stored_analysis(result['analysis']))
+                    save_analysis(job.connection_id, result['analysis'], job.detection_mode)
+                    # Count skipped columns too, from their catalog entries
+                    table_scan.phi_columns = len(get_table_analysis(job.connection_id, result['table_name'])['columns'])
+                    if table_scan.phi_columns:
+                        job.phi_tables += 1
+                else:
+                    job.tables_failed += 1
+                    logger.warning(f"PHI scan job {job_id}: table {result['table_name']} failed: {result['error']}")
+                job.tables_done += 1
+                db.session.add(table_scan)
+                db.session.commit()
+
+            job.status = 'completed'
+        except Exception as e:
+            logger.error(f"Error in PHI scan job {job_id}: {str(e)}")
+            db.session.rollback()
+            job.status = 'failed'
+            job.error = str(e)
+
+        job.end_time = datetime.datetime.utcnow()
+        db.session.commit()
+        logger.info(f"PHI scan job {job_id} {job.status}: {job.tables_done}/{job.tables_total} tables, "
+                    f"{job.phi_tables} with PHI, {job.tables_failed} failed")
+
+
+def start_discovery_job(job_id: int, **kwargs) -> threading.Thread:
+    """Run a PHIScanJob in a background thread of this process."""
+    thread = threading.Thread(target=run_discovery_job, args=(job_id,), kwargs=kwargs,
+                              name=f"phi-scan-{job_id}", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze all tables of database connections for PHI")
+    parser.add_argument('connection_ids', type=int, nargs='+', help="DBConnection ids to scan, one after another")
+    parser.add_argument('--mode', choices=['pattern', 'ai'], default='pattern', help="Detection mode")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="Worker processes per connection")
+    parser.add_argument('--max-rows', type=int, default=1000, help="Most rows sampled per table")
+    parser.add_argument('--tables', nargs='*', help="Only these tables")
+    args = parser.parse_args()
+
+    from app import app, db
+    from models import DBConnection, PHIScanJob
+
+    for connection_id in args.connection_ids:
+        with app.app_context():
+            if DBConnection.query.get(connection_id) is None:
+                parser.error(f"No database connection with id {connection_id}")
+            job = PHIScanJob(connection_id=connection_id, detection_mode=args.mode)
+            db.session.add(job)
+            db.session.commit()
+            job_id = job.id
+        run_discovery_job(job_id, tables=args.tables, max_workers=args.workers, max_rows=args.max_rows)
+        with app.app_context():
+            print(PHIScanJob.query.get(job_id).get_progress())
+
+
+if __name__ == "__main__":
+    main()
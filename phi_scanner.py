@@ -0,0 +1,424 @@
+import re
+import bisect
+import logging
+import threading
+from collections import Counter
+import numpy as np
+from typing import List, Dict, Tuple, Set, Optional, Any
+
+try:
+    # The regex parser of the re module, private since Python 3.11
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    try:
+        import sre_parse
+        import sre_constants
+    except ImportError:
+        # Without a parser no requirements are derived: nothing is prefiltered or batched
+        sre_parse = sre_constants = None
+
+logger = logging.getLogger(__name__)
+
+ASCII_CHARS = [chr(i) for i in range(128)]
+
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: lambda ch: ch.isdecimal(),
+    sre_constants.CATEGORY_NOT_DIGIT: lambda ch: not ch.isdecimal(),
+    sre_constants.CATEGORY_SPACE: lambda ch: ch.isspace(),
+    sre_constants.CATEGORY_NOT_SPACE: lambda ch: not ch.isspace(),
+    sre_constants.CATEGORY_WORD: lambda ch: ch.isalnum() or ch == '_',
+    sre_constants.CATEGORY_NOT_WORD: lambda ch: not (ch.isalnum() or ch == '_'),
+} if sre_constants is not None else {}
+
+# Joins texts for batch scanning; row-safe patterns can neither consume it nor
+# treat it as a word character
+ROW_SEPARATOR = '\x00'
+
+# Keyword sets larger than this are not worth checking one by one
+MAX_PREFILTER_KEYWORDS = 64
+
+_DECIMAL = re.compile(r'\d')
+
+
+class PatternPrefilter:
+    """
+    Cheap per-text check of which patterns can possibly match.
+
+    For every pattern, requirements that any match must satisfy are derived
+    from the parsed regex: one of the literal keywords it starts with (e.g.
+    "MRN", "Insurance ID"), a minimum number of digits, and literal characters
+    such as "@". Patterns whose requirements a text does not meet are skipped;
+    the checks are necessary conditions only, so skipping never changes the
+    findings. Hit/skip counters show how much scanning work is saved.
+    """
+
+    def __init__(self, entries: List[Tuple[str, re.Pattern]]):
+        self.entries = entries
+        self.requirements = {}
+        for index, (phi_type, pattern) in enumerate(entries):
+            try:
+                parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+            except Exception:
+                # Unparseable (or no parser): the pattern is always run
+                continue
+            self.requirements[index] = self._derive_requirement(list(parsed), parsed.state.flags)
+
+        all_indexes = set(range(len(entries)))
+
+        # keyword -> patterns it satisfies; ignorecase keywords are stored lowercased
+        self.keywords = {}
+        self.ignorecase_keywords = {}
+        keyword_patterns = set()
+        for index, requirement in self.requirements.items():
+            if not requirement['keywords']:
+                continue
+            keyword_patterns.add(index)
+            target = self.ignorecase_keywords if requirement['ignorecase'] else self.keywords
+            for keyword in requirement['keywords']:
+                keyword = keyword.lower() if requirement['ignorecase'] else keyword
+                target.setdefault(keyword, set()).add(index)
+        self.no_keyword_patterns = all_indexes - keyword_patterns
+        # Unicode case folding can match ignorecase keywords spelled with non-ASCII characters
+        self.ignorecase_patterns = set().union(set(), *self.ignorecase_keywords.values())
+
+        # Patterns whose digit requirement is met, for each distinct minimum digit count
+        self.digit_thresholds = sorted({r['min_digits'] for r in self.requirements.values()} | {0})
+        self.digit_patterns = [
+            all_indexes - {i for i, r in self.requirements.items() if r['min_digits'] > threshold}
+            for threshold in self.digit_thresholds
+        ]
+
+        # required character -> patterns that need it
+        self.required_chars = {}
+        for index, requirement in self.requirements.items():
+            for ch in requirement['chars']:
+                self.required_chars.setdefault(ch, set()).add(index)
+
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def active_patterns(self, text: str) -> Set[int]:
+        """Indexes of the patterns that can possibly match somewhere in the text."""
+        ascii_text = text.isascii()
+
+        keyword_ok = set(self.no_keyword_patterns)
+        for keyword, indexes in self.keywords.items():
+            if keyword in text:
+                keyword_ok |= indexes
+        if ascii_text:
+            lower_text = text.lower()
+            for keyword, indexes in self.ignorecase_keywords.items():
+                if keyword in lower_text:
+                    keyword_ok |= indexes
+        else:
+            keyword_ok |= self.ignorecase_patterns
+
+        digit_count = self._count_digits(text, ascii_text)
+        active = keyword_ok & self.digit_patterns[bisect.bisect_right(self.digit_thresholds, digit_count) - 1]
+
+        for ch, indexes in self.required_chars.items():
+            if ch not in text:
+                active -= indexes
+
+        self._record(text, active)
+        return active
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit/skip counters since the last reset."""
+        with self._lock:
+            stats = dict(self.stats)
+            skip_counts = Counter(self._skip_counts)
+        stats['skipped_by_type'] = {}
+        for index, count in skip_counts.items():
+            phi_type = self.entries[index][0]
+            stats['skipped_by_type'][phi_type] = stats['skipped_by_type'].get(phi_type, 0) + count
+        checked = stats['patterns_run'] + stats['patterns_skipped']
+        stats['skip_rate'] = stats['patterns_skipped'] / checked if checked else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {
+                'texts_checked': 0,
+                'patterns_run': 0,
+                'patterns_skipped': 0,
+                'chars_skipped': 0  # text length times patterns skipped
+            }
+            self._skip_counts = Counter()
+
+    def _record(self, text: str, active: Set[int]):
+        skipped = len(self.entries) - len(active)
+        with self._lock:
+            self.stats['texts_checked'] += 1
+            self.stats['patterns_run'] += len(active)
+            self.stats['patterns_skipped'] += skipped
+            self.stats['chars_skipped'] += len(text) * skipped
+            if skipped:
+                self._skip_counts.update(i for i in range(len(self.entries)) if i not in active)
+
+    def _count_digits(self, text: str, ascii_text: bool) -> int:
+        if ascii_text:
+            return sum(map(text.count, '0123456789'))
+        return len(_DECIMAL.findall(text))
+
+    def _derive_requirement(self, items, flags: int) -> Dict[str, Any]:
+        """Necessary conditions for a match: keywords, minimum digits and required characters."""
+        prefixes, _, ignorecase = self._literal_prefixes(items, flags)
+        if not prefixes or len(prefixes) > MAX_PREFILTER_KEYWORDS or min(len(p) for p in prefixes) < 2:
+            prefixes = set()
+        return {
+            'keywords': sorted(prefixes),
+            'ignorecase': ignorecase,
+            'min_digits': self._min_digits(items),
+            'chars': self._required_chars(items, flags)
+        }
+
+    def _literal_prefixes(self, items, flags: int) -> Tuple[Set[str], bool, bool]:
+        """
+        Literal strings one of which every match of the sequence starts with.
+        Returns (prefixes, complete, ignorecase), where complete means the
+        whole sequence is literal and ignorecase that a cased letter in the
+        prefixes is matched case-insensitively.
+        """
+        prefixes = {''}
+        ignorecase = False
+        for op, av in items:
+            if op is sre_constants.AT:
+                continue
+            if op is sre_constants.LITERAL:
+                ch = chr(av)
+                if av >= 128:
+                    return prefixes, False, ignorecase
+                ignorecase = ignorecase or bool(flags & re.IGNORECASE and ch.lower() != ch.upper())
+                prefixes = {prefix + ch for prefix in prefixes}
+                continue
+            if op is sre_constants.SUBPATTERN:
+                _, add_flags, del_flags, sub = av
+                sub_prefixes, complete, sub_ignorecase = self._literal_prefixes(sub, (flags | add_flags) & ~del_flags)
+            elif op is sre_constants.BRANCH:
+                results = [self._literal_prefixes(alternative, flags) for alternative in av[1]]
+                sub_prefixes = set().union(*(result[0] for result in results))
+                complete = all(result[1] for result in results)
+                sub_ignorecase = any(result[2] for result in results)
+            else:
+                return prefixes, False, ignorecase
+
+            prefixes = {prefix + sub for prefix in prefixes for sub in sub_prefixes}
+            ignorecase = ignorecase or sub_ignorecase
+            if not complete or len(prefixes) > MAX_PREFILTER_KEYWORDS:
+                return prefixes, False, ignorecase
+        return prefixes, True, ignorecase
+
+    def _min_digits(self, items) -> int:
+        """Minimum number of decimal digits in any match of the sequence."""
+        total = 0
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                total += 1 if 48 <= av <= 57 else 0
+            elif op is sre_constants.IN:
+                total += 1 if self._is_digit_class(av) else 0
+            elif op is sre_constants.BRANCH:
+                total += min(self._min_digits(alternative) for alternative in av[1])
+            elif op is sre_constants.SUBPATTERN:
+                total += self._min_digits(av[3])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                total += av[0] * self._min_digits(av[2])
+        return total
+
+    def _is_digit_class(self, items) -> bool:
+        for op, av in items:
+            if op is sre_constants.LITERAL and 48 <= av <= 57:
+                continue
+            if op is sre_constants.RANGE and 48 <= av[0] and av[1] <= 57:
+                continue
+            if op is sre_constants.CATEGORY and av is sre_constants.CATEGORY_DIGIT:
+                continue
+            return False
+        return bool(items)
+
+    def _required_chars(self, items, flags: int) -> Set[str]:
+        """Characters that appear literally in every match of the sequence."""
+        required = set()
+        for op, av in items:
+            if op is sre_constants.LITERAL:
+                ch = chr(av)
+                # Cased letters may match other characters under IGNORECASE
+                if not (flags & re.IGNORECASE and ch.lower() != ch.upper()):
+                    required.add(ch)
+            elif op is sre_constants.BRANCH:
+                required |= set.intersection(*(self._required_chars(alternative, flags) for alternative in av[1]))
+            elif op is sre_constants.SUBPATTERN:
+                _, add_flags, del_flags, sub = av
+                required |= self._required_chars(sub, (flags | add_flags) & ~del_flags)
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] > 0:
+                required |= self._required_chars(av[2], flags)
+        return required
+
+
+class PatternScanner:
+    """
+    Scanner over a set of categorized regex patterns that runs, for each text,
+    only the patterns the prefilter leaves active, and scans many texts with
+    one finditer pass per pattern over the texts joined by ROW_SEPARATOR.
+    Findings are identical to running every pattern's ``finditer`` on every
+    text in turn.
+
+    Patterns that could match across the separator (e.g. anchored ones) are
+    run text by text.
+    """
+
+    def __init__(self, compiled_patterns: Dict[str, List[re.Pattern]], use_prefilter: bool = True):
+        self.entries = [
+            (phi_type, pattern)
+            for phi_type, patterns in compiled_patterns.items()
+            for pattern in patterns
+        ]
+        self.prefilter = PatternPrefilter(self.entries) if use_prefilter else None
+
+        # Patterns that can run over many texts joined by ROW_SEPARATOR without
+        # a match crossing or depending on a text boundary
+        self.batch_indexes = [i for i, (_, pattern) in enumerate(self.entries) if self._is_row_safe(pattern)]
+        self.per_row = [i for i in range(len(self.entries)) if i not in self.batch_indexes]
+
+    def scan(self, text: str) -> List[Tuple[str, int, int]]:
+        """
+        Scan the text and return ``(phi_type, start, end)`` tuples in the same
+        order as iterating each pattern's ``finditer`` in turn.
+        """
+        active = self.prefilter.active_patterns(text) if self.prefilter else None
+        return [
+            (phi_type, match.start(), match.end())
+            for index, (phi_type, pattern) in enumerate(self.entries)
+            if active is None or index in active
+            for match in pattern.finditer(text)
+        ]
+
+    def scan_batch(self, texts: List[str]) -> List[Tuple[int, str, int, int]]:
+        """
+        Scan many texts with as few passes as possible.
+
+        Texts are grouped by the patterns the prefilter leaves active for them,
+        and each group is scanned with one pass per pattern over its texts
+        joined by ROW_SEPARATOR. Returns ``(text_position, phi_type, start, end)``
+        tuples with offsets relative to each text, ordered by category and
+        pattern, so that a stable sort on ``(text_position, start)`` gives the
+        same per-text order as ``scan``.
+        """
+        groups = {}
+        for position, text in enumerate(texts):
+            active = frozenset(self.prefilter.active_patterns(text)) if self.prefilter else None
+            groups.setdefault(active, []).append(position)
+
+        matches = [[] for _ in self.entries]
+        for active, positions in groups.items():
+            self._scan_rows(texts, positions, active, matches)
+
+        return [
+            (position, self.entries[index][0], start, end)
+            for index in range(len(self.entries))
+            for position, start, end in matches[index]
+        ]
+
+    def _scan_rows(self, texts: List[str], positions: List[int], active: Optional[Set[int]],
+                   matches: List[List[Tuple[int, int, int]]]):
+        """Scan the texts at the given positions, appending (position, start, end) per pattern index."""
+        rows = [texts[position] for position in positions]
+        batch_indexes = [i for i in self.batch_indexes if active is None or i in active]
+        if batch_indexes:
+            offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+            np.cumsum([len(row) + len(ROW_SEPARATOR) for row in rows], out=offsets[1:])
+            joined = ROW_SEPARATOR.join(rows)
+            row_positions = np.asarray(positions, dtype=np.int64)
+
+        for index in batch_indexes:
+            spans = np.array([match.span() for match in self.entries[index][1].finditer(joined)], dtype=np.int64)
+            if not len(spans):
+                continue
+            row = np.searchsorted(offsets, spans[:, 0], side='right') - 1
+            matches[index].extend(zip(
+                row_positions[row].tolist(),
+                (spans[:, 0] - offsets[row]).tolist(),
+                (spans[:, 1] - offsets[row]).tolist()
+            ))
+
+        for index in self.per_row:
+            if active is not None and index not in active:
+                continue
+            pattern = self.entries[index][1]
+            for position, row in zip(positions, rows):
+                matches[index].extend((position, m.start(), m.end()) for m in pattern.finditer(row))
+
+    def _is_row_safe(self, pattern: re.Pattern) -> bool:
+        """
+        Whether the pattern gives the same matches on a text embedded between
+        ROW_SEPARATOR characters as on the text alone: it must not be able to
+        consume the separator or use anchors other than word boundaries.
+        """
+        try:
+            parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+        except Exception:
+            return False
+        return not self._can_cross_row(list(parsed), parsed.state.flags)
+
+    def _can_cross_row(self, items, flags: int) -> bool:
+        for op, av in items:
+            if op is sre_constants.AT:
+                if av not in (sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY):
+                    return True
+            elif op is sre_constants.LITERAL:
+                if ROW_SEPARATOR in self._literal_chars(av, flags):
+                    return True
+            elif op is sre_constants.IN:
+                if ROW_SEPARATOR in self._class_chars(av, flags):
+                    return True
+            elif op is sre_constants.BRANCH:
+                if any(self._can_cross_row(alternative, flags) for alternative in av[1]):
+                    return True
+            elif op is sre_constants.SUBPATTERN:
+                _, add_flags, del_flags, sub = av
+                if self._can_cross_row(sub, (flags | add_flags) & ~del_flags):
+                    return True
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+                if self._can_cross_row(av[2], flags):
+                    return True
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                if self._can_cross_row(av[1], flags):
+                    return True
+            else:
+                return True
+        return False
+
+    def _literal_chars(self, code: int, flags: int) -> Set[str]:
+        if code >= 128:
+            # Some non-ASCII characters case-fold to ASCII ones (e.g. KELVIN SIGN)
+            return set(ASCII_CHARS) if flags & re.IGNORECASE else set()
+        return self._fold({chr(code)}, flags)
+
+    def _class_chars(self, items, flags: int) -> Set[str]:
+        chars = set()
+        negate = False
+        for op, av in items:
+            if op is sre_constants.NEGATE:
+                negate = True
+            elif op is sre_constants.LITERAL:
+                chars |= self._literal_chars(av, flags)
+            elif op is sre_constants.RANGE:
+                low, high = av
+                if high >= 128 and flags & re.IGNORECASE:
+                    return set(ASCII_CHARS)
+                chars |= self._fold({ch for ch in ASCII_CHARS if low <= ord(ch) <= high}, flags)
+            elif op is sre_constants.CATEGORY and av in _CATEGORIES:
+                chars |= {ch for ch in ASCII_CHARS if _CATEGORIES[av](ch)}
+            else:
+                return set(ASCII_CHARS)
+        if negate:
+            if flags & re.IGNORECASE:
+                return set(ASCII_CHARS)
+            return set(ASCII_CHARS) - chars
+        return chars
+
+    def _fold(self, chars: Set[str], flags: int) -> Set[str]:
+        if flags & re.IGNORECASE:
+            return chars | {ch.swapcase() for ch in chars}
+        return chars
@@ -1,25 +1,47 @@
 from typing import List, Dict, Any
+import hashlib
 import logging
-from phi_detector import PHIDetector
+import itertools
+from phi_detector import get_shared_detector
 from db_connector import DatabaseConnector
 
 logger = logging.getLogger(__name__)
 
-class PHIService:
-    """Service class to handle PHI detection and database operations"""
-
-    def __init__(self):
-        self.detector = PHIDetector()
+# Rows fetched at a time from a table sample; columns stop fetching once their estimates are tight
+SAMPLE_CHUNK_ROWS = 100
 
-    def analyze_database_columns(self, connection: DatabaseConnector, table_name: str, selected_columns: List[str] = None, detection_mode: str = 'pattern') -> Dict[str, Any]:
+class PHIService:
+    """
+    Service class to handle PHI detection and database operations.
+    Holds no per-request state, so one instance can serve all requests.
+    """
+
+    @property
+    def detector(self):
+        """Shared pattern-only detector, used where AI detection is not needed."""
+        return get_shared_detector('pattern')
+
+    def analyze_database_columns(self, connection: DatabaseConnector, table_name: str, selected_columns: List[str] = None,
+                                 detection_mode: str = 'pattern', max_rows: int = 1000, margin: float = 0.05,
+                                 fingerprints: Dict[str, str] = None) -> Dict[str, Any]:
         """
         Analyze columns in a database table for PHI content.
 
+        Besides the PHI columns in 'columns', the result lists every analyzed
+        column with its fingerprint and sample size in 'scanned_columns', the
+        columns left out because they did not change in 'skipped_columns', and
+        the table's 'row_count'.
+
         Args:
             connection: Database connection
             table_name: Name of the table to analyze
             selected_columns: List of column names to analyze (if None, analyze all text columns)
             detection_mode: 'pattern' for regex-based or 'ai' for AI-powered detection
+            max_rows: Most rows sampled from the table
+            margin: Sampling of a column stops once the 95% confidence interval of
+                each PHI type's row share is within +/- margin
+            fingerprints: Column fingerprints from the last scan (see column_fingerprint);
+                columns whose fingerprint is unchanged are skipped
         """
         try:
             # Get column information
@@ -27,41 +49,76 @@ class PHIService:
 
             results = {
                 'table_name': table_name,
-                'columns': []
+                'columns': [],
+                'scanned_columns': [],
+                'skipped_columns': [],
+                'row_count': None
             }
 
             # Filter columns if specific ones are selected
             if selected_columns:
                 columns = [col for col in columns if col['name'] in selected_columns]
 
+            # Shared detector for the requested mode; the AI client is only created for 'ai'
+            detector = get_shared_detector(detection_mode)
+
             # Analyze text-based columns
             text_types = ['varchar', 'text', 'char', 'string']
-            for column in columns:
-                col_type = column['type'].lower()
-                if any(text_type in col_type for text_type in text_types):
-                    # Sample data from the column
-                    query = f"SELECT DISTINCT {column['name']} FROM {table_name} LIMIT 1000"
-                    df = connection.execute_query(query)
-
-                    if not df.empty:
-                        sample_data = df[column['name']].dropna().astype(str).tolist()
-
-                        # Get detector configuration based on mode
-                        detector_config = {'ai_enabled': detection_mode == 'ai'}
-
-                        # Analyze the column with column name context
-                        analysis = self.detector.analyze_database_column(
-                            column_name=column['name'], 
-                            sample_data=sample_data
-                        )
-
-                        # Only include if PHI is detected
-                        if analysis['phi_types']:
-                            results['columns'].append({
-                                'name': column['name'],
-                                'type': column['type'],
-                                'analysis': analysis
-                            })
+            text_columns = [
+                column for column in columns
+                if any(text_type in column['type'].lower() for text_type in text_types)
+            ]
+            if not text_columns:
+                return results
+
+            # Skip the columns that were analyzed with the same detector since the table last changed
+            table_fingerprint, results['row_count'] = connection.table_fingerprint(table_name)
+            column_fingerprints = {
+                column['name']: self.column_fingerprint(table_fingerprint, column['type'], detection_mode, detector.config_version)
+                for column in text_columns
+            }
+            if fingerprints:
+                results['skipped_columns'] = [
+                    column['name'] for column in text_columns
+                    if column_fingerprints[column['name']] is not None
+                    and fingerprints.get(column['name']) == column_fingerprints[column['name']]
+                ]
+                text_columns = [column for column in text_columns if column['name'] not in results['skipped_columns']]
+                if not text_columns:
+                    return results
+
+            # One database-native sampled query for all text columns of the table, streamed:
+            # its chunks are fetched as the column that needs the most rows asks for them
+            sample = connection.iter_sample(table_name, [column['name'] for column in text_columns],
+                                            rows=max_rows, chunksize=SAMPLE_CHUNK_ROWS)
+            column_samples = itertools.tee(sample, len(text_columns))
+            try:
+                for column, chunks in zip(text_columns, column_samples):
+                    # Analyze the column with column name context; adaptive sampling stops
+                    # as soon as the PHI estimates are tight enough
+                    analysis = detector.analyze_database_column_adaptive(
+                        column_name=column['name'],
+                        chunks=(chunk[column['name']].dropna().astype(str).tolist() for chunk in chunks),
+                        margin=margin,
+                        max_rows=max_rows
+                    )
+                    results['scanned_columns'].append({
+                        'name': column['name'],
+                        'type': column['type'],
+                        'fingerprint': column_fingerprints[column['name']],
+                        'sample_size': analysis['total_rows']
+                    })
+
+                    # Only include if PHI is detected
+                    if analysis['phi_types']:
+                        results['columns'].append({
+                            'name': column['name'],
+                            'type': column['type'],
+                            'analysis': analysis
+                        })
+            finally:
+                # Stop the query if no column needed the whole sample
+                sample.close()
 
             return results
 
@@ -69,6 +126,17 @@ class PHIService:
             logger.error(f"Error analyzing table {table_name}: {str(e)}")
             return {'error': str(e)}
 
+    @staticmethod
+    def column_fingerprint(table_fingerprint: str, column_type: str, detection_mode: str, detector_version: str) -> str:
+        """
+        Fingerprint of a column analysis: changes when the table data, the column
+        type or the detector changes. None if the table has no fingerprint.
+        """
+        if table_fingerprint is None:
+            return None
+        key = f"{table_fingerprint}|{column_type}|{detection_mode}|{detector_version}"
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
     def suggest_deidentification_plan(self, analysis_results: Dict[str, Any]) -> Dict[str, Any]:
         """
         Create a de-identification plan based on analysis results.
@@ -97,7 +165,7 @@ class PHIService:
                     # Get suggestions for this type of PHI with column context
                     suggestions = self.detector.suggest_deidentification([{
                         'type': phi_type['type'],
-                        'value': phi_type['example_values'][0] if phi_type['example_values'] else '',
+                        'value': phi_type['example_values'][0] if phi_type.get('example_values') else '',
                         'confidence': phi_type['avg_confidence']
                     }], column_name=column['name'])
 
@@ -11,16 +11,24 @@ from sqlalchemy import text, exc, func
 from app import app, db
 from models import (
     DBConnection, DeidentRule, MappingTable, ProcessLog, 
-    PatientMaster, EncounterMaster, PHIAttributeMaster, SavedQuery
+    PatientMaster, EncounterMaster, PHIAttributeMaster, SavedQuery,
+    PHIScanJob, PHITableScan
 )
 from db_connector import DatabaseConnector
 from deidentifier import Deidentifier
+from parallel_deidentifier import run_parallel, DEFAULT_WORKERS as DEFAULT_DEID_WORKERS
+from checkpoint import CheckpointStore, Heartbeat, is_alive
 from rule_engine import RuleEngine
 from utils import generate_report, save_to_temp
 from phi_service import PHIService
+from phi_discovery import start_discovery_job, DEFAULT_WORKERS
+from phi_catalog import get_fingerprints, save_analysis, get_table_analysis
 
 logger = logging.getLogger(__name__)
 
+# PHI detectors are shared process-wide, so one service instance serves all requests
+phi_service = PHIService()
+
 @app.route('/')
 def index():
     """Home page - shows dashboard with stats and links."""
@@ -402,72 +410,133 @@ def process():
     connections = DBConnection.query.all()
     rules = DeidentRule.query.all()
     mappings = MappingTable.query.all()
-    return render_template('process.html', connections=connections, rules=rules, mappings=mappings)
+    return render_template('process.html', connections=connections, rules=rules, mappings=mappings,
+                           default_workers=DEFAULT_DEID_WORKERS)
 
 @app.route('/process/execute', methods=['POST'])
 def execute_process():
     """Execute the de-identification process."""
     # Get process parameters
-    connection_id = request.form.get('connection_id')
-    rule_ids = request.form.getlist('rule_ids')
-    mapping_ids = request.form.getlist('mapping_ids')
-    patient_table = request.form.get('patient_table')
-    patient_id_field = request.form.get('patient_id_field')
-    patient_id_format = request.form.get('patient_id_format', 'SW{:07d}')
+    connection_id = request.form.get('source_connection_id') or request.form.get('connection_id')
+    destination_id = request.form.get('destination_connection_id')
+    parameters = {
+        'rule_ids': request.form.getlist('rule_ids'),
+        'mapping_ids': request.form.getlist('mapping_ids'),
+        'patient_table': request.form.get('patient_table'),
+        'patient_id_field': request.form.get('patient_id_field'),
+        'patient_id_format': request.form.get('patient_id_format', 'SW{:07d}'),
+        'workers': request.form.get('workers', DEFAULT_DEID_WORKERS, type=int)
+    }
     process_name = request.form.get('process_name', 'De-identification Process')
     
     # Validate inputs
-    if not connection_id or not rule_ids:
+    if not connection_id or not parameters['rule_ids']:
         flash('Connection and at least one rule must be selected', 'danger')
         return redirect(url_for('process'))
     
-    # Create process log
+    # Create process log, with the parameters needed to resume it
     process_log = ProcessLog(
         process_name=process_name,
-        status='running'
+        source_connection_id=connection_id,
+        destination_connection_id=destination_id or connection_id,
+        status='running',
+        log_data=json.dumps({'parameters': parameters})
     )
     db.session.add(process_log)
     db.session.commit()
     
+    return run_process(process_log, parameters)
+
+@app.route('/process/<int:process_id>/resume', methods=['POST'])
+def resume_process(process_id):
+    """
+    Resume a failed or partly failed de-identification process from its
+    checkpoints, or one left 'running' by a server that stopped.
+    """
+    process_log = ProcessLog.query.get_or_404(process_id)
+    parameters = process_log.get_log_data().get('parameters')
+    if is_alive(process_log) or not parameters:
+        flash('Only finished processes started with saved parameters can be resumed', 'warning')
+        return redirect(url_for('results', process_id=process_id))
+    
+    process_log.status = 'running'
+    process_log.end_time = None
+    db.session.commit()
+    
+    return run_process(process_log, parameters)
+
+def run_process(process_log, parameters):
+    """
+    Run (or resume) the de-identification process of a ProcessLog. Tables are
+    checkpointed as they are written, so a run that stops can be resumed,
+    skipping the tables and key ranges it completed. The process heartbeats
+    while it runs, so a run whose server stopped can be told from a live one.
+    """
+    with Heartbeat(process_log):
+        return _run_process(process_log, parameters)
+
+def _run_process(process_log, parameters):
+    """Run the de-identification process of a ProcessLog; see run_process."""
     try:
         # Get database connection
-        connection = DBConnection.query.get(connection_id)
+        connection = DBConnection.query.get(process_log.source_connection_id)
         db_connector = DatabaseConnector.get_db_connection_from_model(connection)
         
         if not db_connector.connect():
             raise Exception("Could not connect to database")
         
         # Get selected rules
-        selected_rules = DeidentRule.query.filter(DeidentRule.id.in_(rule_ids)).all()
+        selected_rules = DeidentRule.query.filter(DeidentRule.id.in_(parameters['rule_ids'])).all()
+        
+        # Bulk load the de-identified chunks into the destination, if it is a separate database
+        destination_params = None
+        if process_log.destination_connection_id != process_log.source_connection_id:
+            destination = DBConnection.query.get(process_log.destination_connection_id)
+            destination_connector = DatabaseConnector.get_db_connection_from_model(destination)
+            if not destination_connector.connect():
+                raise Exception("Could not connect to destination database")
+            destination_params = destination_connector.get_connection_params()
+            destination_connector.disconnect()
         
         # Initialize the de-identifier
         deidentifier = Deidentifier(db_connector)
         deidentifier.load_rules(selected_rules)
         
         # Create master patient mapping if patient table is specified
+        patient_table = parameters.get('patient_table')
+        patient_id_field = parameters.get('patient_id_field')
         if patient_table and patient_id_field:
             deidentifier.create_master_patient_mapping(
                 patient_table, 
                 patient_id_field, 
-                patient_id_format
+                parameters.get('patient_id_format', 'SW{:07d}')
             )
             
             # Apply master mapping to patient table
             deidentifier.apply_master_mapping(patient_table, patient_id_field)
         
         # Process mapping tables if selected
-        if mapping_ids:
-            selected_mappings = MappingTable.query.filter(MappingTable.id.in_(mapping_ids)).all()
+        if parameters.get('mapping_ids'):
+            selected_mappings = MappingTable.query.filter(MappingTable.id.in_(parameters['mapping_ids'])).all()
             for mapping in selected_mappings:
                 deidentifier.process_mapping_table(mapping)
         
-        # Get tables and process each one
+        # Get tables, compile the rules for their columns once, and process the
+        # tables in worker processes, each with its own connections
         tables = db_connector.get_tables()
-        for table in tables:
-            deidentifier.process_table(table)
+        rule_plan = deidentifier.compile_rule_plan(tables)
+        logger.info(f"Rule plan: {rule_plan.describe()['columns_matched']} columns matched "
+                    f"in {rule_plan.compile_seconds:.3f}s")
+        checkpoints = CheckpointStore(process_log.id, rule_plan.digest())
+        stats = run_parallel(deidentifier, tables, max_workers=max(1, parameters.get('workers') or 1),
+                             destination_params=destination_params, checkpoints=checkpoints)
         
         # Update process log with results
-        stats = deidentifier.get_statistics()
+        if 'write' in stats:
+            logger.info(f"Wrote {stats['write']['rows']} rows at "
+                        f"{stats['write']['rows_per_second']:.0f} rows/s")
+        stats['rows_written_total'] = checkpoints.rows_written()
+        stats['parameters'] = parameters
         process_log.end_time = datetime.datetime.utcnow()
         process_log.status = 'completed'
         process_log.records_processed = stats['total_records']
@@ -483,25 +552,28 @@ def execute_process():
     
     except Exception as e:
         logger.error(f"Error in de-identification process: {str(e)}")
+        db.session.rollback()
         
         # Update process log with error
         process_log.end_time = datetime.datetime.utcnow()
         process_log.status = 'failed'
-        process_log.log_data = json.dumps({"error": str(e)})
+        process_log.log_data = json.dumps({"error": str(e), "parameters": parameters})
         db.session.commit()
         
         flash(f'Error in de-identification process: {str(e)}', 'danger')
-        return redirect(url_for('process'))
+        return redirect(url_for('results', process_id=process_log.id))
 
 @app.route('/results/<int:process_id>')
 def results(process_id):
     """Show results of a completed process."""
     process_log = ProcessLog.query.get_or_404(process_id)
+    # A run its server dropped shows as stopped, so it can be resumed
+    stopped = process_log.status == 'running' and not is_alive(process_log)
     
     # Parse log data
     log_data = process_log.get_log_data()
     
-    return render_template('results.html', process=process_log, log_data=log_data)
+    return render_template('results.html', process=process_log, log_data=log_data, stopped=stopped)
 
 @app.route('/get-tables/<int:conn_id>')
 def get_tables(conn_id):
@@ -1102,6 +1174,7 @@ def analyze_phi():
     table_name = data.get('table_name')
     selected_columns = data.get('columns', [])
     detection_mode = data.get('detection_mode', 'pattern')
+    rescan = data.get('rescan', False)
 
     if not connection_id or not table_name:
         return jsonify({'error': 'Missing connection_id or table_name'})
@@ -1110,38 +1183,117 @@ def analyze_phi():
     connection = DBConnection.query.get_or_404(connection_id)
 
     try:
-        # Initialize services
+        # Initialize database connector
         connector = DatabaseConnector.get_db_connection_from_model(connection)
-        phi_service = PHIService()
+        if not connector.connect():
+            return jsonify({'error': 'Could not connect to database'})
 
-        # Analyze the table
+        # Analyze the table, skipping columns unchanged since they were last cataloged
+        fingerprints = {} if rescan else get_fingerprints(connection.id, table_name).get(table_name, {})
         analysis_results = phi_service.analyze_database_columns(
             connection=connector,
             table_name=table_name,
             selected_columns=selected_columns,
-            detection_mode=detection_mode
+            detection_mode=detection_mode,
+            fingerprints=fingerprints
         )
 
         if 'error' in analysis_results:
             return jsonify({'error': analysis_results['error']})
 
+        save_analysis(connection.id, analysis_results, detection_mode)
+        db.session.commit()
+
+        # Answer from the catalog, which also holds the results of skipped columns
+        analysis = get_table_analysis(connection.id, table_name, selected_columns)
+        analysis['skipped_columns'] = analysis_results['skipped_columns']
+
+        return jsonify({
+            'success': True,
+            'analysis': analysis
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/phi/discover', methods=['POST'])
+def discover_phi():
+    """Start a PHI discovery job over all tables of a database connection."""
+    data = request.json
+    if not data:
+        return jsonify({'error': 'No data provided'})
+
+    connection_id = data.get('connection_id')
+    if not connection_id:
+        return jsonify({'error': 'Missing connection_id'})
+
+    # Make sure the connection exists
+    DBConnection.query.get_or_404(connection_id)
+
+    try:
+        job = PHIScanJob(
+            connection_id=connection_id,
+            detection_mode=data.get('detection_mode', 'pattern')
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        start_discovery_job(
+            job.id,
+            tables=data.get('tables') or None,
+            max_workers=int(data.get('max_workers', DEFAULT_WORKERS)),
+            max_rows=int(data.get('max_rows', 1000))
+        )
+
         return jsonify({
             'success': True,
-            'analysis': analysis_results
+            'job': job.get_progress()
         })
     except Exception as e:
         return jsonify({'error': str(e)})
 
+@app.route('/api/phi/discover/<int:job_id>')
+def discovery_status(job_id):
+    """Progress of a PHI discovery job and the tables analyzed so far."""
+    job = PHIScanJob.query.get_or_404(job_id)
+    table_scans = PHITableScan.query.filter_by(job_id=job_id).order_by(PHITableScan.scanned_at).all()
+
+    tables = []
+    for table_scan in table_scans:
+        entry = {
+            'table_name': table_scan.table_name,
+            'status': table_scan.status,
+            'phi_columns': table_scan.phi_columns,
+            'duration': table_scan.duration,
+            'error': table_scan.error
+        }
+        if request.args.get('details'):
+            entry['analysis'] = table_scan.get_analysis()
+        tables.append(entry)
+
+    return jsonify({
+        'success': True,
+        'job': job.get_progress(),
+        'tables': tables
+    })
+
 @app.route('/api/phi/suggest-plan', methods=['POST'])
 def suggest_deidentification_plan():
-    """Generate a de-identification plan based on PHI analysis."""
+    """Generate a de-identification plan from the PHI catalog of a table."""
     data = request.json
-    if not data or 'analysis' not in data:
-        return jsonify({'error': 'No analysis data provided'})
-    
+    if not data:
+        return jsonify({'error': 'No data provided'})
+
+    connection_id = data.get('connection_id')
+    table_name = data.get('table_name')
+    if not connection_id or not table_name:
+        return jsonify({'error': 'Missing connection_id or table_name'})
+
     try:
-        phi_service = PHIService()
-        plan = phi_service.suggest_deidentification_plan(data['analysis'])
+        analysis = get_table_analysis(int(connection_id), table_name, data.get('columns') or None)
+        if not analysis['columns']:
+            return jsonify({'error': f'No cataloged PHI for table {table_name}; analyze it first'})
+
+        plan = phi_service.suggest_deidentification_plan(analysis)
         
         return jsonify({
             'success': True,
@@ -1168,9 +1320,8 @@ def execute_deidentification():
     connection = DBConnection.query.get_or_404(connection_id)
     
     try:
-        # Initialize services
+        # Initialize database connector
         connector = DatabaseConnector.get_db_connection_from_model(connection)
-        phi_service = PHIService()
         
         # Execute the plan
         results = phi_service.execute_deidentification(connector, plan, target_schema)
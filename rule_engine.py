@@ -1,21 +1,49 @@
 import re
-import random
 import datetime
 import uuid
 import hashlib
 import logging
+from collections import Counter
 import pandas as pd
 import numpy as np
+from pandas.tseries.api import guess_datetime_format
+from keyed_random import KeyedRandom, load_random_key
+from text_redactor import TextRedactor
 
 logger = logging.getLogger(__name__)
 
+# apply_rule transforms each distinct value once unless more than this share of the values are distinct
+FACTORIZE_MAX_DISTINCT_RATIO = 0.9
+
+# Date columns: the format is guessed from this many distinct values and checked on this many
+DATE_FORMAT_GUESSES = 20
+DATE_FORMAT_SAMPLE_SIZE = 50
+
+# Reflected column types (as DatabaseConnector.get_columns names them) that random_value draws
+# integers or floats for; values of other columns draw by the dtype of the first chunk with values
+INTEGER_TYPES = re.compile(r'^(TINY|SMALL|MEDIUM|BIG)?INT(EGER)?\b', re.IGNORECASE)
+FLOAT_TYPES = re.compile(r'^(FLOAT|REAL|DOUBLE|NUMERIC|DECIMAL|NUMBER|MONEY|SMALLMONEY)\b', re.IGNORECASE)
+
+
+def value_kind(type_name):
+    """The random_value draw kind of a reflected column type: 'integer', 'float', or None if not numeric."""
+    type_name = str(type_name).strip()
+    if INTEGER_TYPES.match(type_name):
+        return 'integer'
+    if FLOAT_TYPES.match(type_name):
+        return 'float'
+    return None
+
 class RuleEngine:
     """
     Engine that applies de-identification rules to data.
     Contains all the logic for different types of transformations.
     """
-    def __init__(self):
+    def __init__(self, random_key=None):
         self.rules = []
+        # Secret for the keyed randomness of the random transformers (see keyed_random.py),
+        # loaded when first needed if not given
+        self.random_key = random_key
         self.transformers = {
             'patient_id': self._transform_patient_id,
             'date_offset': self._transform_date_offset,
@@ -28,11 +56,37 @@ class RuleEngine:
             'random_value': self._transform_random_value,
             'zipcode_truncate': self._transform_zipcode
         }
+        # Transformers whose output depends only on the input value, so they can run
+        # once per distinct value (random ones draw per value from keyed randomness).
+        # patient_id numbers the distinct values itself; the date ones are vectorized.
+        self.factorizable = {
+            'phone_mask', 'email_mask', 'text_redaction', 'fixed_value', 'hash', 'zipcode_truncate',
+            'random_value'
+        }
+        # Date transformers parse with a format inferred once per (table, column),
+        # patient_id keeps numbering a column across the chunks of a streamed table,
+        # and random_value draws one kind of value (integer, float or string) per column
+        self.column_aware = {'date_offset', 'date_generalization', 'patient_id', 'random_value'}
+        # Transformers whose output depends on the rows seen before, so a column cannot be
+        # split across processes: patient_id numbers values in order of appearance
+        self.stateful = {'patient_id'}
+        self.date_formats = {}
+        self.patient_ids = {}
+        # random_value draw kind ('integer', 'float' or 'string') per (table, column)
+        self.value_kinds = {}
+        # Text redactors, compiled once per distinct redaction config
+        self.redactors = {}
     
     def load_rules(self, rules):
         """Load rules into the rule engine."""
         self.rules = rules
         logger.info(f"Loaded {len(rules)} rules into the rule engine")
+
+    def keyed_random(self, rule_type, config):
+        """Keyed randomness for a rule: draws depend only on the secret key, the rule type, its seed and the value."""
+        if self.random_key is None:
+            self.random_key = load_random_key()
+        return KeyedRandom(self.random_key, rule_type, config.get('seed', 42))
     
     def column_matches_rule(self, table_name, column_name, rule):
         """Check if a column matches a specific rule based on rule configuration."""
@@ -60,93 +114,306 @@ class RuleEngine:
             
         return False
     
-    def apply_rule(self, data_series, rule):
-        """Apply a rule to a pandas Series (column) of data."""
+    def apply_rule(self, data_series, rule, factorize=True, table_name=None, column_name=None):
+        """
+        Apply a rule to a pandas Series (column) of data. Deterministic transformers
+        run once per distinct value and the results are broadcast back to the rows,
+        unless factorize is False. table_name and column_name identify the column
+        for per-column state such as inferred date formats.
+        """
         rule_type = rule.rule_type
         config = rule.get_config()
         
         if rule_type in self.transformers:
             # Apply the appropriate transformer function
-            return self.transformers[rule_type](data_series, config)
+            transformer = self.transformers[rule_type]
+            kwargs = {}
+            if rule_type in self.column_aware:
+                kwargs['column_key'] = (table_name, column_name) if column_name is not None else None
+            if factorize and rule_type in self.factorizable:
+                return self._apply_factorized(transformer, data_series, config, **kwargs)
+            return transformer(data_series, config, **kwargs)
         else:
             logger.warning(f"Unknown rule type: {rule_type}")
             return data_series
+
+    def _apply_factorized(self, transformer, data_series, config, **kwargs):
+        """Run a deterministic transformer on the distinct values of a Series and scatter the results."""
+        codes, _ = pd.factorize(data_series)
+        distinct = int(codes.max()) + 1 if len(codes) else 0
+        if distinct == 0 or distinct > len(codes) * FACTORIZE_MAX_DISTINCT_RATIO:
+            return transformer(data_series, config, **kwargs)
+
+        # First row of each distinct value; codes are numbered in order of first appearance
+        first_rows = pd.Series(codes).drop_duplicates()
+        first_rows = first_rows[first_rows >= 0].index.to_numpy()
+        transformed = transformer(data_series.iloc[first_rows].reset_index(drop=True), config, **kwargs)
+
+        result = transformed.iloc[np.maximum(codes, 0)]
+        result.index = data_series.index
+        result.name = data_series.name
+        nulls = codes < 0
+        if nulls.any():
+            # Transformers leave nulls as they are
+            result = result.where(~nulls, data_series.to_numpy())
+        return result
     
-    def _transform_patient_id(self, data_series, config):
-        """Transform patient IDs to de-identified values."""
+    def _transform_patient_id(self, data_series, config, column_key=None):
+        """Transform patient IDs to de-identified values, numbered on from earlier chunks of the same column."""
         prefix = config.get('prefix', 'P')
         format_str = config.get('format', '{}{:07d}')
         
         # Create a mapping for unique values
         unique_values = data_series.unique()
-        mapping = {}
+        mapping = {} if column_key is None else self.patient_ids.setdefault(column_key, {})
         
-        for i, val in enumerate(unique_values):
-            if pd.notna(val):
-                mapping[val] = format_str.format(prefix, i + 1)
+        for val in unique_values:
+            if pd.notna(val) and val not in mapping:
+                mapping[val] = format_str.format(prefix, len(mapping) + 1)
         
         # Apply mapping
         return data_series.map(mapping).fillna(data_series)
     
-    def _transform_date_offset(self, data_series, config):
+    def _transform_date_offset(self, data_series, config, column_key=None):
         """Offset dates by a random number of days within a range."""
         min_days = config.get('min_days', -30)
         max_days = config.get('max_days', 30)
         seed = config.get('seed', 42)
-        
-        # Set random seed for reproducibility
-        random.seed(seed)
+
+        parsed = self._parse_dates(data_series, column_key)
+        if parsed is None:
+            return self._offset_dates_by_row(data_series, min_days, max_days, seed)
+
+        # One offset per date, keyed by the parsed date, so equal dates in any format shift alike
+        keyed = self.keyed_random('date_offset', config)
+        days = keyed.integers(parsed, min_days, max_days)
+        shifted = parsed + days.astype('timedelta64[D]')
+        return self._merge_parsed_dates(
+            data_series, parsed, shifted,
+            lambda value, position: value + pd.Timedelta(days=int(keyed.integers([value], min_days, max_days)[0]))
+        )
+
+    def _offset_dates_by_row(self, data_series, min_days, max_days, seed):
+        """Row-by-row date offset, for columns the vectorized path cannot parse (time zones)."""
+        def parse_date(date_val):
+            try:
+                return pd.to_datetime(date_val)
+            except Exception:
+                return pd.NaT
+
+        # One offset per date from keyed randomness, keyed by the parsed date like the vectorized path
+        keyed = self.keyed_random('date_offset', {'seed': seed})
+        parsed = data_series.map(parse_date)
+        valid = parsed.notna().to_numpy()
+        offsets = np.zeros(len(parsed), dtype=np.int64)
+        offsets[valid] = keyed.integers(parsed[valid], min_days, max_days)
         
         # Function to apply random offset to a date
-        def offset_date(date_val):
-            if pd.isna(date_val):
+        def offset_date(date_val, parsed_val, is_valid, days_offset):
+            if not is_valid:
                 return date_val
             
             try:
-                # Convert to datetime if it's a string
+                # Strings are converted to their parsed datetime
                 if isinstance(date_val, str):
-                    date_val = pd.to_datetime(date_val)
+                    date_val = parsed_val
                 
                 # Apply random offset
-                days_offset = random.randint(min_days, max_days)
-                return date_val + pd.Timedelta(days=days_offset)
-            except:
+                return date_val + pd.Timedelta(days=int(days_offset))
+            except Exception:
                 return date_val
         
         # Apply the offset to each value
-        return data_series.apply(offset_date)
+        return pd.Series(
+            [offset_date(*args) for args in zip(data_series, parsed, valid, offsets)],
+            index=data_series.index, name=data_series.name
+        )
     
-    def _transform_date_generalization(self, data_series, config):
+    def _transform_date_generalization(self, data_series, config, column_key=None):
         """Generalize dates by keeping only year, month, or setting to first day of month/year."""
         level = config.get('level', 'month')  # year, month, day
+
+        parsed = self._parse_dates(data_series, column_key)
+        if parsed is None:
+            return self._generalize_dates_by_row(data_series, level)
+
+        if level in ('year', 'month'):
+            # Generalized dates are naive, in the local time of the original
+            if parsed.dt.tz is not None:
+                parsed = parsed.dt.tz_localize(None)
+            generalized = parsed.dt.to_period('Y' if level == 'year' else 'M').dt.to_timestamp()
+        else:
+            generalized = parsed  # No generalization
+        return self._merge_parsed_dates(
+            data_series, parsed, generalized,
+            lambda value, position: self._generalize_date(value, level)
+        )
+
+    def _generalize_dates_by_row(self, data_series, level):
+        """Row-by-row date generalization, for columns the vectorized path cannot parse (time zones)."""
+        return data_series.apply(lambda date_val: self._generalize_date(date_val, level))
+
+    def _generalize_date(self, date_val, level):
+        """Generalize one date value."""
+        if pd.isna(date_val):
+            return date_val
         
-        # Function to generalize a date
-        def generalize_date(date_val):
-            if pd.isna(date_val):
+        try:
+            # Convert to datetime if it's a string
+            parsed = pd.to_datetime(date_val) if isinstance(date_val, str) else date_val
+            if pd.isna(parsed):
+                # Unparseable strings (e.g. '') come back unchanged, as on the vectorized path
                 return date_val
             
-            try:
-                # Convert to datetime if it's a string
-                if isinstance(date_val, str):
-                    date_val = pd.to_datetime(date_val)
-                
-                # Apply generalization based on level
-                if level == 'year':
-                    return datetime.datetime(date_val.year, 1, 1)
-                elif level == 'month':
-                    return datetime.datetime(date_val.year, date_val.month, 1)
-                else:
-                    return date_val  # No generalization
-            except:
-                return date_val
-        
-        # Apply generalization to each value
-        return data_series.apply(generalize_date)
+            # Apply generalization based on level
+            if level == 'year':
+                return datetime.datetime(parsed.year, 1, 1)
+            elif level == 'month':
+                return datetime.datetime(parsed.year, parsed.month, 1)
+            else:
+                return parsed  # No generalization
+        except:
+            return date_val
+
+    def _parse_dates(self, data_series, column_key=None):
+        """
+        Parse a column of dates in one pass. Strings are parsed with a format
+        inferred once per column_key (e.g. (table, column)) and the strings that
+        do not fit it are parsed one distinct value at a time, as pd.to_datetime
+        would parse them alone.
+
+        Returns a datetime64 Series with NaT where a value is null, unparseable
+        or not a string, or None if the column has time zone offsets that cannot
+        be held in one Series.
+        """
+        if pd.api.types.is_datetime64_any_dtype(data_series):
+            return data_series
+
+        parsed = pd.Series(pd.NaT, index=data_series.index, dtype='datetime64[ns]', name=data_series.name)
+        if data_series.dtype != object and not pd.api.types.is_string_dtype(data_series):
+            return parsed
+
+        if pd.api.types.infer_dtype(data_series, skipna=True) == 'string':
+            is_string = data_series.notna().to_numpy()
+        else:
+            is_string = data_series.map(lambda value: isinstance(value, str)).to_numpy(dtype=bool)
+        strings = data_series[is_string]
+        if strings.empty:
+            return parsed
+
+        # Date columns repeat heavily, so parse each distinct string once
+        codes, uniques = pd.factorize(strings)
+        uniques = pd.Series(uniques, dtype=object)
+
+        if column_key is not None and column_key in self.date_formats:
+            date_format = self.date_formats[column_key]
+        else:
+            date_format = self._infer_date_format(uniques)
+            if column_key is not None:
+                self.date_formats[column_key] = date_format
+
+        if date_format:
+            parsed_uniques = pd.to_datetime(uniques, format=date_format, errors='coerce')
+        else:
+            parsed_uniques = pd.Series(pd.NaT, index=range(len(uniques)), dtype='datetime64[ns]')
+        parsed_strings = pd.Series(parsed_uniques.to_numpy()[codes], index=strings.index)
+
+        # Strings that do not fit the format
+        unparsed = parsed_strings.isna().to_numpy()
+        if unparsed.any():
+            fallback = {}
+            for value in pd.unique(strings[unparsed]):
+                timestamp = self._parse_date_value(value)
+                if timestamp is not None and timestamp.tzinfo is not None:
+                    return None
+                fallback[value] = timestamp
+            parsed_strings = parsed_strings.copy()
+            parsed_strings[unparsed] = pd.to_datetime(strings[unparsed].map(fallback))
+
+        parsed[is_string] = parsed_strings.to_numpy()
+        return parsed
+
+    def _infer_date_format(self, strings):
+        """
+        Format of the distinct date strings of a column, guessed from a sample and
+        accepted only if it parses the sample exactly as pd.to_datetime parses each
+        value alone. None if no format fits.
+        """
+        sample = strings.head(DATE_FORMAT_SAMPLE_SIZE)
+        guesses = Counter(guess_datetime_format(value) for value in sample.head(DATE_FORMAT_GUESSES))
+        for date_format, _ in guesses.most_common():
+            # Offsets are left to the per-value parser
+            if date_format is None or '%z' in date_format or '%Z' in date_format:
+                continue
+            parsed = pd.to_datetime(sample, format=date_format, errors='coerce')
+            if parsed.notna().mean() < 0.5:
+                continue
+            if all(self._parse_date_value(value) == timestamp
+                   for value, timestamp in zip(sample[parsed.notna()], parsed[parsed.notna()])):
+                return date_format
+        return None
+
+    def _parse_date_value(self, value):
+        """Parse one date string like the row-by-row transformers, or None if it cannot be parsed."""
+        try:
+            timestamp = pd.to_datetime(value)
+            return None if pd.isna(timestamp) else timestamp
+        except:
+            return None
+
+    def _merge_parsed_dates(self, data_series, parsed, transformed, transform_value):
+        """
+        Build the output of a date transformer from the transformed parsed dates.
+        Nulls and unparseable strings keep their original value; other values that
+        are not strings (e.g. datetime objects in an object column) go through
+        transform_value(value, position) one by one.
+        """
+        is_parsed = parsed.notna().to_numpy()
+        is_null = data_series.isna().to_numpy()
+        if is_null.all():
+            return data_series.copy()
+        if (is_parsed | is_null).all():
+            return transformed
+
+        values = data_series.to_numpy(dtype=object, copy=True)
+        values[is_parsed] = transformed[is_parsed].astype(object).to_numpy()
+        for position in np.flatnonzero(~is_parsed & ~is_null):
+            value = values[position]
+            if not isinstance(value, str):
+                try:
+                    values[position] = transform_value(value, position)
+                except:
+                    pass
+        return pd.Series(values, index=data_series.index, name=data_series.name).infer_objects()
     
     def _transform_phone(self, data_series, config):
         """Mask phone numbers with a pattern."""
         pattern = config.get('pattern', 'XXX-XXX-{last4}')
-        
+        # Patterns other than plain text around {last4} fields are formatted value by value
+        parts = pattern.split('{last4}')
+        if any('{' in part or '}' in part for part in parts):
+            return self._mask_phones_by_row(data_series, pattern)
+
+        def mask_phones(strings):
+            # Code points of each string, one row per value, zero padded
+            points = strings.view(np.uint32).reshape(len(strings), -1)
+            digits = (points >= ord('0')) & (points <= ord('9'))
+            # If we have enough digits, apply the mask
+            masked = digits.sum(axis=1) >= 10
+            digits = digits[masked]
+            # The last 4 digits are the ones with at most 4 digits from them to the end
+            from_end = np.cumsum(digits[:, ::-1], axis=1)[:, ::-1]
+            last4 = points[masked][digits & (from_end <= 4)].reshape(-1, 4).view('U4').ravel()
+            replacements = np.full(len(last4), parts[0])
+            for part in parts[1:]:
+                replacements = np.strings.add(np.strings.add(replacements, last4), part)
+            return masked, replacements
+
+        return self._map_strings(data_series, mask_phones,
+                                 lambda values: self._mask_phones_by_row(values, pattern))
+
+    def _mask_phones_by_row(self, data_series, pattern):
+        """Row-by-row phone mask, for patterns with format specs or other fields."""
         # Function to mask a phone number
         def mask_phone(phone_val):
             if pd.isna(phone_val):
@@ -170,6 +437,34 @@ class RuleEngine:
     def _transform_email(self, data_series, config):
         """Mask email addresses."""
         mode = config.get('mode', 'preserve_domain')  # preserve_domain, full_mask
+
+        def mask_emails(strings):
+            usernames, at, domains = np.strings.partition(strings, '@')
+            masked = at == '@'
+            if not masked.any():
+                return masked, np.array([], dtype=str)
+            if mode == 'preserve_domain':
+                # MD5 has no vectorized form; hash each distinct username once
+                inverse, distinct = pd.factorize(usernames[masked].astype(object))
+                hashes = np.array([hashlib.md5(username.encode()).hexdigest()[:8] for username in distinct], dtype='U8')
+                return masked, np.strings.add(np.strings.add(hashes[inverse], '@'), domains[masked])
+            # full_mask: keyed surrogate numbers, stable across processes (unlike hash())
+            numbers = self.keyed_random('email_mask', config).integers(pd.Series(strings[masked], dtype=object), 0, 9999)
+            return masked, np.strings.add(np.strings.add('masked_email_', np.strings.zfill(numbers.astype(str), 4)),
+                                          '@example.com')
+
+        return self._map_strings(data_series, mask_emails,
+                                 lambda values: self._mask_emails_by_row(values, config))
+
+    def _mask_emails_by_row(self, data_series, config):
+        """Row-by-row email mask, the reference for the vectorized one."""
+        mode = config.get('mode', 'preserve_domain')  # preserve_domain, full_mask
+
+        # Keyed surrogate numbers for full_mask, stable across processes (unlike hash())
+        suffixes = {}
+        if mode != 'preserve_domain':
+            emails = list(dict.fromkeys(str(value) for value in data_series.dropna()))
+            suffixes = dict(zip(emails, self.keyed_random('email_mask', config).integers(emails, 0, 9999)))
         
         # Function to mask an email
         def mask_email(email_val):
@@ -185,7 +480,7 @@ class RuleEngine:
                         masked_username = hashlib.md5(username.encode()).hexdigest()[:8]
                         return f"{masked_username}@{domain}"
                     else:  # full_mask
-                        return f"masked_email_{hash(email_str) % 10000:04d}@example.com"
+                        return f"masked_email_{suffixes[email_str]:04d}@example.com"
                 
                 return email_val
             except:
@@ -194,26 +489,61 @@ class RuleEngine:
         # Apply mask to each value
         return data_series.apply(mask_email)
     
+    def _map_strings(self, data_series, transform, by_row):
+        """
+        Run a vectorized string transform over the non-null values of a Series, as str()
+        gives them, in a NumPy unicode array. transform returns a mask of the values it
+        changes and their replacements. Values outside ASCII, or with NULs (which NumPy
+        string functions treat as the end of the string), go through the row-by-row
+        transform instead.
+
+        Numbers are transformed as str() gives them (5551237890, not the float
+        5551237890.0 Series.apply gives for Int64 columns), and a Series with no
+        value changed is returned with its dtype and nulls as they are.
+        """
+        notna = data_series.notna().to_numpy(dtype=bool)
+        if not notna.any():
+            return data_series.copy()
+        positions = np.flatnonzero(notna)
+        values = data_series.to_numpy(dtype=object)[notna]
+        strings = values
+        if pd.api.types.infer_dtype(values, skipna=False) != 'string':
+            strings = np.array([str(value) for value in values], dtype=object)
+        unicode = np.array(strings, dtype=str)
+        points = unicode.view(np.uint32).reshape(len(unicode), -1)
+        exact = (points.max(axis=1) < 128) & (
+            np.count_nonzero(points, axis=1) == np.fromiter(map(len, strings), dtype=np.int64, count=len(strings)))
+
+        result = data_series.to_numpy(dtype=object, copy=True)
+        if exact.any():
+            changed, replacements = transform(unicode[exact])
+            result[positions[exact][changed]] = replacements
+        else:
+            changed = np.zeros(0, dtype=bool)
+        if not exact.all():
+            result[positions[~exact]] = by_row(pd.Series(values[~exact], dtype=object)).to_numpy(dtype=object)
+        elif not changed.any():
+            return data_series.copy()
+        # Object results typed as Series.apply would type them
+        return pd.Series(result, index=data_series.index, name=data_series.name).infer_objects()
+    
     def _transform_text_redaction(self, data_series, config):
-        """Redact or replace sensitive text."""
-        patterns = config.get('patterns', [r'\b\d{3}-\d{2}-\d{4}\b'])  # Default: SSN pattern
+        """
+        Redact or replace sensitive text. All patterns (and the PHIDetector categories
+        listed in phi_types, or 'all') are matched on the original text in one pass,
+        and overlapping matches are replaced as one.
+        """
+        patterns = config.get('patterns', [] if config.get('phi_types') else [r'\b\d{3}-\d{2}-\d{4}\b'])  # Default: SSN pattern
         replacement = config.get('replacement', '[REDACTED]')
+        phi_types = config.get('phi_types')
         
-        # Function to redact text
-        def redact_text(text_val):
-            if pd.isna(text_val):
-                return text_val
-            
-            try:
-                text_str = str(text_val)
-                for pattern in patterns:
-                    text_str = re.sub(pattern, replacement, text_str)
-                return text_str
-            except:
-                return text_val
+        # Compile each distinct rule config once
+        key = (tuple(patterns), replacement, phi_types if isinstance(phi_types, str) else tuple(phi_types or ()))
+        redactor = self.redactors.get(key)
+        if redactor is None:
+            redactor = self.redactors[key] = TextRedactor(patterns, replacement, phi_types)
         
-        # Apply redaction to each value
-        return data_series.apply(redact_text)
+        return redactor.redact_series(data_series)
     
     def _transform_fixed_value(self, data_series, config):
         """Replace values with a fixed value."""
@@ -242,29 +572,69 @@ class RuleEngine:
         # Apply hashing to each value
         return data_series.apply(hash_value)
     
-    def _transform_random_value(self, data_series, config):
-        """Replace values with random values of the same type."""
-        seed = config.get('seed', 42)
-        random.seed(seed)
+    def _transform_random_value(self, data_series, config, column_key=None):
+        """
+        Replace values with random values of the same type, the same one for equal values.
+        Whether integers, floats or strings are drawn is decided once per column_key
+        (e.g. (table, column)), from its reflected type or else its first chunk with
+        values, as a NULL turns a chunk of integers into floats.
+        """
+        keyed = self.keyed_random('random_value', config)
+        kind = self.value_kinds.get(column_key) if column_key is not None else None
+        if kind is None:
+            # Including the nullable Int/Float extension dtypes
+            if pd.api.types.is_integer_dtype(data_series.dtype):
+                kind = 'integer'
+            elif pd.api.types.is_float_dtype(data_series.dtype):
+                kind = 'float'
+            else:
+                kind = 'string'
+            if column_key is not None and data_series.notna().any():
+                self.value_kinds[column_key] = kind
         
-        # Determine data type
-        if data_series.dtype == np.int64 or data_series.dtype == np.int32:
+        if kind == 'integer':
             min_val = config.get('min_val', 0)
             max_val = config.get('max_val', 1000)
-            return data_series.apply(lambda x: random.randint(min_val, max_val) if pd.notna(x) else x)
+            draws = keyed.integers(data_series, min_val, max_val)
         
-        elif data_series.dtype == np.float64 or data_series.dtype == np.float32:
+        elif kind == 'float':
             min_val = config.get('min_val', 0.0)
             max_val = config.get('max_val', 1.0)
-            return data_series.apply(lambda x: random.uniform(min_val, max_val) if pd.notna(x) else x)
+            draws = keyed.uniform(data_series, min_val, max_val)
         
         else:  # Treat as string
             length = config.get('length', 8)
-            chars = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
-            return data_series.apply(lambda x: ''.join(random.choice(chars) for _ in range(length)) if pd.notna(x) else x)
+            if length > 0:
+                # Draw character codes as an integer array, map them through an ASCII lookup
+                # table and view each row of bytes as one fixed-width string
+                chars = np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789", dtype=np.uint8)
+                codes = chars[keyed.digits(data_series, len(chars), length)]
+                draws = codes.view(f'S{length}').ravel().astype(f'U{length}').astype(object)
+            else:
+                draws = np.full(len(data_series), '', dtype=object)
+            return pd.Series(draws, index=data_series.index, name=data_series.name).where(data_series.notna(), data_series)
+
+        nulls = data_series.isna().to_numpy()
+        if isinstance(data_series.dtype, np.dtype):
+            # NumPy integer chunks hold no nulls; others keep their NaN (or None)
+            result = pd.Series(draws, index=data_series.index, name=data_series.name)
+            return result.where(~nulls, data_series) if nulls.any() else result
+        # Nullable columns stay nullable
+        result = pd.Series(draws, index=data_series.index, name=data_series.name,
+                           dtype='Int64' if kind == 'integer' else 'Float64')
+        return result.mask(nulls)
     
     def _transform_zipcode(self, data_series, config):
         """Truncate ZIP codes to first 3 digits."""
+        def truncate_zips(strings):
+            strings = np.strings.strip(strings)
+            truncated = np.strings.str_len(strings) >= 5
+            return truncated, np.strings.add(strings[truncated].astype('U3'), "XX")
+
+        return self._map_strings(data_series, truncate_zips, self._truncate_zips_by_row)
+
+    def _truncate_zips_by_row(self, data_series):
+        """Row-by-row ZIP truncation, the reference for the vectorized one."""
         # Function to truncate ZIP code
         def truncate_zip(zip_val):
             if pd.isna(zip_val):
@@ -0,0 +1,111 @@
+import re
+import json
+import time
+import hashlib
+import logging
+from typing import List, Dict, Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledRule:
+    """
+    A de-identification rule with its JSON config parsed and its table and
+    column patterns compiled. Has the rule_type/get_config() interface of
+    DeidentRule, so it can be passed to RuleEngine.apply_rule as is.
+    """
+
+    def __init__(self, rule):
+        self.id = getattr(rule, 'id', None)
+        self.name = rule.name
+        self.rule_type = rule.rule_type
+        self.config = rule.get_config()
+        # Rules without both table and column patterns never match (as in RuleEngine.column_matches_rule)
+        self.has_patterns = 'tables' in self.config and 'columns' in self.config
+        self.table_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in self.config.get('tables', [])]
+        self.column_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in self.config.get('columns', [])]
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.config
+
+    def matches_table(self, table_name: str) -> bool:
+        return self.has_patterns and any(pattern.match(table_name) for pattern in self.table_patterns)
+
+    def matches_column(self, column_name: str) -> bool:
+        return any(pattern.match(column_name) for pattern in self.column_patterns)
+
+    def __repr__(self):
+        return f"<CompiledRule {self.name} - {self.rule_type}>"
+
+
+class RulePlan:
+    """
+    De-identification rules compiled once per run, with an index of the rules
+    that apply to each (table, column), in rule order.
+
+    The index is built up front for the tables and columns passed to compile
+    (reflected from the database), and filled in lazily for any other table.
+    """
+
+    def __init__(self, rules: Iterable[Any]):
+        start = time.perf_counter()
+        self.rules = [rule if isinstance(rule, CompiledRule) else CompiledRule(rule) for rule in rules]
+        self.columns = {}
+        # random_value draw kinds of the reflected numeric columns, per (table, column)
+        self.value_kinds = {}
+        self._table_rules = {}
+        self._index = {}
+        self.compile_seconds = time.perf_counter() - start
+
+    @classmethod
+    def compile(cls, rules: Iterable[Any], table_columns: Dict[str, List[str]] = None,
+                value_kinds: Dict[tuple, str] = None) -> 'RulePlan':
+        """
+        Compile rules and index them for table_columns ({table: [column names]}).
+        value_kinds ({(table, column): 'integer' or 'float'}) is kept for RuleEngine.
+        """
+        start = time.perf_counter()
+        plan = cls(rules)
+        plan.value_kinds.update(value_kinds or {})
+        for table_name, column_names in (table_columns or {}).items():
+            plan.columns[table_name] = list(column_names)
+            for column_name in column_names:
+                plan.rules_for(table_name, column_name)
+        plan.compile_seconds = time.perf_counter() - start
+        logger.info(f"Compiled rule plan of {len(plan.rules)} rules for {len(plan.columns)} tables "
+                    f"in {plan.compile_seconds:.3f}s")
+        return plan
+
+    def rules_for(self, table_name: str, column_name: str) -> List[CompiledRule]:
+        """Rules that apply to a column, in rule order."""
+        key = (table_name, column_name)
+        rules = self._index.get(key)
+        if rules is None:
+            # Table patterns are matched once per table, column patterns only for the rules left
+            table_rules = self._table_rules.get(table_name)
+            if table_rules is None:
+                table_rules = self._table_rules[table_name] = [
+                    rule for rule in self.rules if rule.matches_table(table_name)
+                ]
+            rules = self._index[key] = [rule for rule in table_rules if rule.matches_column(column_name)]
+        return rules
+
+    def digest(self) -> str:
+        """SHA-256 of the rules (names, types and configs, in order), to tell whether a run used the same rules."""
+        rules = [[rule.name, rule.rule_type, rule.config] for rule in self.rules]
+        return hashlib.sha256(json.dumps(rules, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def describe(self) -> Dict[str, Any]:
+        """The resolved plan: rule names per table and column (matched columns only), and the compile time."""
+        tables = {}
+        for (table_name, column_name), rules in self._index.items():
+            if rules:
+                tables.setdefault(table_name, {})[column_name] = [rule.name for rule in rules]
+        return {
+            'rules': len(self.rules),
+            'tables_indexed': len(self._table_rules),
+            'columns_indexed': len(self._index),
+            'columns_matched': sum(len(columns) for columns in tables.values()),
+            'compile_seconds': self.compile_seconds,
+            'tables': tables
+        }
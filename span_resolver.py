@@ -0,0 +1,93 @@
+import bisect
+import logging
+from typing import List, Dict, Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def finding_priority(finding: Dict[str, Any]) -> tuple:
+    """Rank overlapping findings: higher confidence, then longer span, then pattern over AI."""
+    return (
+        finding.get('confidence', 0),
+        finding['end'] - finding['start'],
+        finding.get('source') == 'pattern'
+    )
+
+
+def resolve_overlaps(findings: List[Dict[str, Any]], text: str,
+                     get_context: Optional[Callable[[str, int, int], str]] = None) -> List[Dict[str, Any]]:
+    """
+    Merge overlapping findings into non-overlapping spans in O(n log n).
+
+    Findings are swept in start order; every run of overlapping findings
+    becomes one finding covering their union, carrying the type, confidence
+    and source of its highest-priority member (see finding_priority). Spans
+    that only touch are kept apart. If get_context is given, the context of a
+    widened finding is recomputed with it.
+    """
+    resolved = []
+    cluster = []
+    cluster_end = None
+
+    for finding in sorted(findings, key=lambda x: x['start']):
+        if cluster and finding['start'] >= cluster_end:
+            resolved.append(_merge_cluster(cluster, text, get_context))
+            cluster = []
+        if not cluster:
+            cluster_end = finding['end']
+        cluster.append(finding)
+        cluster_end = max(cluster_end, finding['end'])
+
+    if cluster:
+        resolved.append(_merge_cluster(cluster, text, get_context))
+    return resolved
+
+
+def _merge_cluster(cluster: List[Dict[str, Any]], text: str,
+                   get_context: Optional[Callable[[str, int, int], str]]) -> Dict[str, Any]:
+    """Collapse a run of overlapping findings into its best member, widened to their union."""
+    best = max(cluster, key=finding_priority)
+    if len(cluster) == 1:
+        return best
+
+    start = min(finding['start'] for finding in cluster)
+    end = max(finding['end'] for finding in cluster)
+    merged = dict(best)
+    if (start, end) != (best['start'], best['end']):
+        merged.update({'start': start, 'end': end, 'value': text[start:end]})
+        if get_context and 'context' in merged:
+            merged['context'] = get_context(text, start, end)
+    return merged
+
+
+class SpanIndex:
+    """
+    Sorted, non-overlapping spans supporting O(log n) overlap queries.
+    Overlapping spans added to the index are merged; spans that only touch are not.
+    """
+
+    def __init__(self, spans=None):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(spans or []):
+            if self.starts and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        """Whether [start, end) overlaps any span in the index."""
+        # The span with the largest start before `end` also has the largest end
+        i = bisect.bisect_left(self.starts, end)
+        return i > 0 and self.ends[i - 1] > start
+
+    def add(self, start: int, end: int):
+        """Add [start, end), merging it with any spans it overlaps."""
+        lo = bisect.bisect_right(self.ends, start)
+        hi = bisect.bisect_left(self.starts, end)
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
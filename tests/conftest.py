@@ -0,0 +1,62 @@
+import os
+import pytest
+
+# The app database of the checkpoint tests; set before app is first imported
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+# Keyed randomness secret, so tests do not generate one in instance/
+os.environ.setdefault('DEID_RANDOM_KEY', 'test-key')
+
+
+class Rule:
+    """A DeidentRule stand-in: name, rule_type and a JSON config."""
+
+    def __init__(self, name, rule_type, config):
+        self.name = name
+        self.rule_type = rule_type
+        self.config = config
+
+    def get_config(self):
+        return self.config
+
+
+def sqlite_connector(path):
+    from db_connector import DatabaseConnector
+    connector = DatabaseConnector('sqlite', None, None, str(path), None, None, db_path=str(path))
+    assert connector.connect()
+    return connector
+
+
+@pytest.fixture
+def source(tmp_path):
+    connector = sqlite_connector(tmp_path / 'source.db')
+    yield connector
+    connector.disconnect()
+
+
+@pytest.fixture
+def destination(tmp_path):
+    connector = sqlite_connector(tmp_path / 'destination.db')
+    yield connector
+    connector.disconnect()
+
+
+@pytest.fixture
+def process_log():
+    """A running ProcessLog in the app database; the test runs in the app context."""
+    from app import app, db
+    from models import DBConnection, ProcessLog, ProcessCheckpoint
+    with app.app_context():
+        connection = DBConnection(name='source', db_type='sqlite', host='', port=0, database='source.db',
+                                  username='', password='')
+        db.session.add(connection)
+        db.session.commit()
+        process_log = ProcessLog(process_name='run', source_connection_id=connection.id,
+                                 destination_connection_id=connection.id, status='running',
+                                 log_data='{"parameters": {"rule_ids": ["1"]}}')
+        db.session.add(process_log)
+        db.session.commit()
+        yield process_log
+        ProcessCheckpoint.query.delete()
+        ProcessLog.query.delete()
+        DBConnection.query.delete()
+        db.session.commit()
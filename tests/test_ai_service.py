@@ -0,0 +1,24 @@
+from ai_backends import StubBackend
+from ai_cache import AIResultStore
+from ai_service import AIPhiDetector
+
+
+def test_stored_results_hold_no_phi_and_are_restored():
+    store = AIResultStore(':memory:')
+    backend = StubBackend()
+    texts = ['Seen by Dr. Alice Jones on 01/02/2020', 'Call 555-123-4567']
+    detector = AIPhiDetector(backend=backend, result_store=store)
+    first = detector.analyze_medical_texts(texts)
+    single = detector.analyze_text(texts[0])
+    detector.close()
+
+    stored = ' '.join(result for result, in store.conn.execute("SELECT result FROM ai_results"))
+    for value in ('Alice Jones', '01/02/2020', '555-123-4567'):
+        assert value not in stored
+
+    detector = AIPhiDetector(backend=backend, result_store=store)
+    assert detector.analyze_medical_texts(texts) == first
+    assert detector.analyze_text(texts[0]) == single
+    detector.close()
+    assert backend.calls['analyze_entities'] == 2
+    assert [finding['value'] for finding in first[1]['findings']] == ['555-123-4567']
@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import pytest
+from bulk_writer import BulkWriter
+
+
+def test_chunks_are_written_with_the_table_types(destination):
+    writer = BulkWriter(destination, batch_size=3)
+    writer.write('t', pd.DataFrame({'id': [1, 2], 'name': ['a', '']}))
+    second = pd.DataFrame({'id': [5.0, np.nan, 7.0], 'name': ['\\N', None, 'b']})
+    assert writer._conform('t', second)['id'].dtype == 'Int64'
+    writer.write('t', second)
+
+    rows = destination.execute_query('SELECT typeof(id) AS type, id, name FROM t')
+    assert rows['type'].tolist() == ['integer', 'integer', 'integer', 'null', 'integer']
+    assert rows['name'].tolist() == ['a', '', '\\N', None, 'b']
+    assert writer.get_stats()['rows'] == 5
+
+
+def test_copy_csv_keeps_nulls_apart_from_strings(destination):
+    batch = pd.DataFrame({'id': pd.array([1, None], dtype='Int64'), 'text': ['\\N', None],
+                          'quoted': ['say "hi"', '']})
+    assert BulkWriter(destination)._csv(batch) == '"1","\\N","say ""hi"""\n,,""\n'
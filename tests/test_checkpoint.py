@@ -0,0 +1,53 @@
+import os
+import time
+import datetime
+from sqlalchemy import text
+from app import app, db
+from checkpoint import CheckpointStore, Heartbeat, is_alive
+from deidentifier import Deidentifier
+from conftest import Rule
+
+
+def test_process_is_alive_while_its_server_heartbeats(process_log):
+    assert not is_alive(process_log)
+    with Heartbeat(process_log, seconds=0.05):
+        assert is_alive(process_log)
+        assert process_log.owner_pid == os.getpid()
+        beat = process_log.heartbeat_at
+        time.sleep(0.3)
+        db.session.refresh(process_log)
+        assert process_log.heartbeat_at > beat
+
+    # A server process that is gone, or one that stopped beating
+    process_log.owner_pid = 2 ** 22 + 1
+    assert not is_alive(process_log)
+    process_log.owner_pid = os.getpid()
+    process_log.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    assert not is_alive(process_log)
+
+
+def test_results_page_does_not_fail_a_running_process(process_log):
+    process_log.heartbeat_at = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    db.session.commit()
+    response = app.test_client().get(f'/results/{process_log.id}')
+    assert response.status_code == 200
+    assert b'Process Stopped' in response.data
+    db.session.refresh(process_log)
+    assert process_log.status == 'running'
+
+
+def test_tables_with_stateful_rules_restart(process_log, source):
+    with source.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE k (id INTEGER PRIMARY KEY, mrn TEXT)"))
+        conn.execute(text("INSERT INTO k VALUES (1, 'MRN1'), (2, 'MRN2')"))
+    deidentifier = Deidentifier(source)
+    deidentifier.load_rules([Rule('mrn', 'patient_id', {'tables': ['.*'], 'columns': ['mrn']})])
+    assert deidentifier.checkpoint_key('k') is None
+
+    store = CheckpointStore(process_log.id, deidentifier.rule_plan.digest())
+    store.plan(deidentifier, ['k'], {})
+    store.record('k', None, 1, 1, False)
+    # Patient numbers are not checkpointed, so the table is not resumed after its last key
+    todo, partitions, resume = store.plan(deidentifier, ['k'], {})
+    assert (todo, resume) == (['k'], {})
+    assert store.rows_written() == 0
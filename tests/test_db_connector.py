@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import text
+
+
+def test_integer_primary_key_is_found_by_type(source):
+    with source.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE numbered (id BIGINT PRIMARY KEY, name TEXT)"))
+        conn.execute(text("CREATE TABLE coded (id DECIMAL(10, 2) PRIMARY KEY, name TEXT)"))
+    assert source._integer_primary_key('numbered') == 'id'
+    assert source._integer_primary_key('coded') is None
+
+
+def test_fingerprint_changes_with_inserts(source):
+    with source.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO t (name) VALUES ('a'), ('b')"))
+    fingerprint, rows = source.table_fingerprint('t')
+    assert (fingerprint, rows) == ('max:2', 2)
+    with source.engine.begin() as conn:
+        conn.execute(text("INSERT INTO t (name) VALUES ('c')"))
+    assert source.table_fingerprint('t') == ('max:3', 3)
+
+
+def partition_ids(connector, table, key, partitions):
+    ids = []
+    for where, params in partitions:
+        ids += connector.execute_query(f"SELECT {key} FROM {table} WHERE {where}", params)[key].tolist()
+    return ids
+
+
+@pytest.mark.parametrize('schema, key', [
+    ('id INTEGER PRIMARY KEY, name TEXT', 'id'),
+    ('code TEXT PRIMARY KEY, name TEXT', 'code'),
+    ('name TEXT', 'rowid'),
+])
+def test_partitions_cover_every_row_once(source, schema, key):
+    with source.engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE t ({schema})"))
+        rows = [{'value': f"{i * 7:05d}"} for i in range(1000) if i % 3]
+        column = 'code' if key == 'code' else 'name'
+        conn.execute(text(f"INSERT INTO t ({column}) VALUES (:value)"), rows)
+        if key == 'id':
+            # Gaps in the key range
+            conn.execute(text("UPDATE t SET id = id * 5 WHERE id > 300"))
+        conn.execute(text("DELETE FROM t WHERE rowid % 11 = 0"))
+    partitions = source.get_partitions('t', 4)
+    assert len(partitions) > 1
+    ids = partition_ids(source, 't', key, partitions)
+    assert len(ids) == len(set(ids))
+    assert sorted(ids) == sorted(source.execute_query(f"SELECT {key} FROM t")[key].tolist())
+
+
+def test_range_sample_has_no_duplicate_rows(source):
+    with source.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO t (id, name) VALUES (:id, 'x')"),
+                     [{'id': i} for i in range(1000) if i < 100 or i % 50 == 0])
+    query, params = source.build_sample_query('t', ['rowid'], rows=20)
+    assert 'UNION ALL' in query
+    for _ in range(50):
+        ids = source.sample_table('t', ['rowid'], rows=20)['rowid'].tolist()
+        assert len(ids) == len(set(ids))
@@ -0,0 +1,93 @@
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from deidentifier import Deidentifier
+from conftest import Rule
+
+
+def make_table(connector, name='t', rows=1000):
+    pd.DataFrame({
+        'id': range(rows),
+        'ssn': [f"{i % 900:03d}-45-{i:04d}" for i in range(rows)],
+    }).to_sql(name, connector.engine, index=False)
+
+
+def test_mid_stream_read_error_fails_table(source, monkeypatch):
+    make_table(source)
+    fetchmany = CursorResult.fetchmany
+    calls = []
+
+    def failing_fetchmany(self, size=None):
+        calls.append(size)
+        if len(calls) == 3:
+            raise OperationalError('SELECT', {}, Exception('connection lost'))
+        return fetchmany(self, size)
+
+    monkeypatch.setattr(CursorResult, 'fetchmany', failing_fetchmany)
+    written = []
+    events = []
+    deidentifier = Deidentifier(source, chunk_size=100, writer=lambda table, chunk: written.append(len(chunk)),
+                                checkpoint=lambda *event: events.append(event))
+    deidentifier.load_rules([Rule('ssn', 'hash', {'tables': ['.*'], 'columns': ['ssn']})])
+
+    with pytest.raises(SQLAlchemyError):
+        deidentifier.process_table('t')
+    assert sum(written) == 200
+    assert events and not any(completed for _, _, _, completed in events)
+    assert deidentifier.get_statistics()['tables_processed'] == 0
+
+
+RULES = [
+    Rule('ssn', 'hash', {'tables': ['.*'], 'columns': ['ssn']}),
+    Rule('phone', 'phone_mask', {'tables': ['.*'], 'columns': ['phone']}),
+    Rule('visit', 'date_offset', {'tables': ['.*'], 'columns': ['visit'], 'seed': 3}),
+    Rule('score', 'random_value', {'tables': ['.*'], 'columns': ['score']}),
+    Rule('patient', 'patient_id', {'tables': ['.*'], 'columns': ['patient']}),
+]
+
+
+def make_patients(connector, name='patients', rows=1000):
+    pd.DataFrame({
+        'id': range(rows),
+        'ssn': [f"{i % 900:03d}-45-{i:04d}" for i in range(rows)],
+        'phone': [f"(555) {i % 1000:03d}-{i:04d}" for i in range(rows)],
+        'visit': [f"2020-{i % 12 + 1:02d}-{i % 28 + 1:02d}" for i in range(rows)],
+        'score': [i % 50 for i in range(rows)],
+        'patient': [f"MRN{i % 300}" for i in range(rows)],
+    }).to_sql(name, connector.engine, index=False)
+
+
+def deidentify(connector, chunk_size):
+    chunks = []
+    deidentifier = Deidentifier(connector, chunk_size=chunk_size, writer=lambda table, chunk: chunks.append(chunk))
+    deidentifier.rule_engine.random_key = 'one'
+    deidentifier.load_rules(RULES)
+    deidentifier.process_table('patients')
+    return pd.concat(chunks, ignore_index=True), deidentifier.get_statistics()
+
+
+def test_chunked_processing_matches_whole_table(source):
+    make_patients(source)
+    whole, whole_stats = deidentify(source, chunk_size=0)
+    chunked, chunked_stats = deidentify(source, chunk_size=97)
+    pd.testing.assert_frame_equal(chunked, whole)
+    assert whole['ssn'].ne(pd.read_sql('SELECT ssn FROM patients', source.engine)['ssn']).all()
+    assert chunked_stats['total_records'] == whole_stats['total_records'] == 1000
+
+
+def test_random_values_follow_the_reflected_column_type(source):
+    with source.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE scores (id INTEGER PRIMARY KEY, score INTEGER)"))
+    # Only the last chunk holds a NULL, and reads as float64
+    pd.DataFrame({'id': range(300), 'score': [i % 50 for i in range(299)] + [None]}).to_sql(
+        'scores', source.engine, index=False, if_exists='append')
+    chunks = []
+    deidentifier = Deidentifier(source, chunk_size=100, writer=lambda table, chunk: chunks.append(chunk))
+    deidentifier.load_rules([Rule('score', 'random_value', {'tables': ['.*'], 'columns': ['score']})])
+    deidentifier.process_table('scores')
+    scores = pd.concat(chunks, ignore_index=True)['score']
+    assert chunks[-1]['score'].dtype == 'float64'
+    assert scores[:299].map(float.is_integer).all()
+    assert scores[200:250].tolist() == scores[:50].tolist()
@@ -0,0 +1,124 @@
+import queue
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.exc import OperationalError
+import app  # Before checkpoint, which its routes import
+import parallel_deidentifier
+from bulk_writer import BulkWriter
+from checkpoint import CheckpointStore
+from deidentifier import Deidentifier
+from conftest import Rule, sqlite_connector
+
+RULES = [Rule('ssn', 'hash', {'tables': ['.*'], 'columns': ['ssn']}),
+         Rule('score', 'random_value', {'tables': ['.*'], 'columns': ['score']})]
+
+
+def make_table(connector, rows=1000):
+    with connector.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, ssn TEXT, score INTEGER)"))
+    pd.DataFrame({
+        'id': range(rows),
+        'ssn': [f"{i % 900:03d}-45-{i:04d}" for i in range(rows)],
+        'score': [i % 50 for i in range(rows)],
+    }).to_sql('t', connector.engine, index=False, if_exists='append')
+
+
+def make_deidentifier(source, **kwargs):
+    deidentifier = Deidentifier(source, **kwargs)
+    deidentifier.load_rules(RULES)
+    deidentifier.compile_rule_plan(['t'])
+    return deidentifier
+
+
+def reference(source, tmp_path):
+    """The table de-identified in one serial pass."""
+    connector = sqlite_connector(tmp_path / 'reference.db')
+    make_deidentifier(source, writer=BulkWriter(connector)).process_table('t')
+    expected = connector.execute_query('SELECT * FROM t ORDER BY id')
+    connector.disconnect()
+    return expected
+
+
+def test_partitioned_run_matches_serial_run(source, destination, tmp_path):
+    make_table(source)
+    stats = parallel_deidentifier.run_parallel(make_deidentifier(source), ['t'], max_workers=2,
+                                               destination_params=destination.get_connection_params(),
+                                               partition_rows=300)
+    assert stats['partitioned_tables'] == {'t': 2}
+    assert stats['failed_tables'] == {}
+    assert stats['total_records'] == 1000
+    pd.testing.assert_frame_equal(destination.execute_query('SELECT * FROM t ORDER BY id'),
+                                  reference(source, tmp_path))
+
+
+def test_resume_after_mid_stream_failure_matches_clean_run(source, destination, tmp_path, process_log,
+                                                          monkeypatch):
+    make_table(source)
+    expected = reference(source, tmp_path)
+    deidentifier = make_deidentifier(source)
+    store = CheckpointStore(process_log.id, deidentifier.rule_plan.digest())
+    todo, partitions, resume = store.plan(deidentifier, ['t'], {})
+    assert (todo, resume) == (['t'], {})
+
+    # A worker of this process, reporting its checkpoints on a queue
+    for name in ('_worker_deidentifier', '_worker_writer', '_worker_error', '_worker_checkpoints'):
+        monkeypatch.setattr(parallel_deidentifier, name, None)
+    checkpoints = queue.Queue()
+    parallel_deidentifier._init_worker(source.get_connection_params(), deidentifier.rule_plan, 100,
+                                       destination.get_connection_params(), checkpoints)
+
+    # The connection drops while the fourth chunk is read
+    fetchmany = CursorResult.fetchmany
+    calls = []
+
+    def failing_fetchmany(self, size=None):
+        calls.append(size)
+        if len(calls) == 4:
+            raise OperationalError('SELECT', {}, Exception('connection lost'))
+        return fetchmany(self, size)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(CursorResult, 'fetchmany', failing_fetchmany)
+        result = parallel_deidentifier._process_table('t')
+    assert result['status'] == 'failed'
+    events = []
+    while not checkpoints.empty():
+        events.append(checkpoints.get())
+    assert [event[3] for event in events] == [100, 100, 100]
+    # The last checkpoint is lost with the process: its chunk is in the destination, not in the checkpoints
+    for event in events[:-1]:
+        store.record(*event)
+    assert destination.execute_query('SELECT COUNT(*) AS n FROM t')['n'][0] == 300
+
+    todo, partitions, resume = store.plan(deidentifier, ['t'], {})
+    assert resume == {'t': {None: {'after': 199}}}
+    result = parallel_deidentifier._process_table('t', None, True, resume['t'][None])
+    assert result['status'] == 'completed'
+    while not checkpoints.empty():
+        store.record(*checkpoints.get())
+
+    pd.testing.assert_frame_equal(destination.execute_query('SELECT * FROM t ORDER BY id'), expected)
+    assert store.rows_written() == 1000
+    todo, _, _ = store.plan(deidentifier, ['t'], {})
+    assert todo == []
+
+
+def test_single_worker_runs_in_process(source, destination, tmp_path, process_log, monkeypatch):
+    make_table(source)
+
+    def no_pool(*args, **kwargs):
+        raise AssertionError('A single worker should not start a process pool')
+
+    monkeypatch.setattr(parallel_deidentifier, 'ProcessPoolExecutor', no_pool)
+    deidentifier = make_deidentifier(source)
+    store = CheckpointStore(process_log.id, deidentifier.rule_plan.digest())
+    stats = parallel_deidentifier.run_parallel(deidentifier, ['t'], max_workers=4,
+                                               destination_params=destination.get_connection_params(),
+                                               checkpoints=store)
+    assert stats['workers'] == 1
+    assert stats['failed_tables'] == {}
+    assert store.rows_written() == 1000
+    assert parallel_deidentifier._worker_deidentifier is None
+    pd.testing.assert_frame_equal(destination.execute_query('SELECT * FROM t ORDER BY id'),
+                                  reference(source, tmp_path))
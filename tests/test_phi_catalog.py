@@ -0,0 +1,36 @@
+import json
+from app import app, db
+from models import DBConnection, PHIColumnCatalog
+from phi_catalog import save_analysis, stored_analysis
+
+ANALYSIS = {
+    'table_name': 'patients',
+    'row_count': 100,
+    'columns': [{'name': 'ssn', 'type': 'TEXT', 'analysis': {'phi_types': [{
+        'type': 'SSN', 'frequency': 0.5, 'avg_confidence': 0.9, 'row_share': 0.5,
+        'confidence_interval': [0.4, 0.6], 'example_values': ['123-45-6789'],
+        'contexts': ['ssn 123-45-6789 on file']}]}}],
+    'scanned_columns': [{'name': 'ssn', 'type': 'TEXT', 'sample_size': 100, 'fingerprint': 'f'}],
+}
+
+
+def test_analyses_are_stored_without_phi_values():
+    assert '123-45-6789' not in json.dumps(stored_analysis(ANALYSIS))
+    assert stored_analysis(ANALYSIS)['columns'][0]['analysis']['phi_types'][0]['avg_confidence'] == 0.9
+    assert '123-45-6789' in json.dumps(ANALYSIS)
+
+    with app.app_context():
+        connection = DBConnection(name='source', db_type='sqlite', host='', port=0, database='source.db',
+                                  username='', password='')
+        db.session.add(connection)
+        db.session.commit()
+        try:
+            assert save_analysis(connection.id, ANALYSIS) == 1
+            db.session.commit()
+            entry = PHIColumnCatalog.query.filter_by(connection_id=connection.id).one()
+            assert entry.get_phi_types() == [{'type': 'SSN', 'frequency': 0.5, 'avg_confidence': 0.9,
+                                              'row_share': 0.5, 'confidence_interval': [0.4, 0.6]}]
+        finally:
+            PHIColumnCatalog.query.delete()
+            DBConnection.query.delete()
+            db.session.commit()
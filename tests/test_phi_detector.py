@@ -0,0 +1,83 @@
+import sys
+import pandas as pd
+import pytest
+import phi_scanner
+from phi_detector import PHIDetector
+
+
+@pytest.fixture(scope='module')
+def detector():
+    return PHIDetector(use_ai=False)
+
+
+def phi_types(results):
+    return {entry['type']: entry['frequency'] for entry in results['phi_types']}
+
+
+@pytest.mark.parametrize('rare, common', [
+    ('Rm 1234567', 'Pt 7654321'),
+    ('NPI 1234567890', 'ABC 1234567890'),
+])
+def test_profile_matches_row_by_row_detection(detector, rare, common):
+    values = pd.Series([rare] + [common] * 99, dtype=object)
+    profiled = detector.analyze_database_column('value', values, use_profile=True)
+    scanned = detector.analyze_database_column('value', values, use_profile=False)
+    assert profiled['column_profile']['kind'] == 'structured'
+    assert phi_types(profiled) == pytest.approx(phi_types(scanned))
+
+
+def test_adaptive_sampling_finds_rare_phi(detector):
+    values = ['Follow up in two weeks'] * 1000
+    for row in range(99, 1000, 100):
+        values[row] = 'Pt 1234567 called'
+    results = detector.analyze_database_column_adaptive('note', [values])
+    assert results['total_rows'] >= 300
+    assert 'patient_id' in phi_types(results)
+
+
+TEXTS = [
+    'Pt 1234567 seen on 01/02/2020, SSN 123-45-6789, call (555) 123-4567',
+    'Email john.doe@example.com or write to 12 Main Street, zip 02139-1234',
+    'NPI 1234567890 DEA A12345678 MRN 7654321 Dr. Alice Jones, 45 years old',
+    'Nothing to see here',
+    'Ünïcode Pt 7654321 and ssn: 987-65-4321',
+    '',
+]
+
+
+@pytest.mark.parametrize('use_prefilter', [True, False])
+def test_scanner_matches_per_pattern_detection(use_prefilter):
+    per_pattern = PHIDetector(use_scanner=False, use_ai=False)
+    scanner = PHIDetector(use_prefilter=use_prefilter, use_ai=False)
+    for merge_overlaps in (True, False):
+        for text in TEXTS:
+            assert scanner.detect_phi(text, merge_overlaps) == per_pattern.detect_phi(text, merge_overlaps)
+
+
+
+def test_prefilter_reads_the_patterns_on_this_python():
+    # The prefilter relies on the private regex parser of the re module
+    assert sys.version_info < (3, 11) or phi_scanner.sre_parse.__name__ == 're._parser'
+    scanner = PHIDetector(use_ai=False).scanner
+    assert scanner.prefilter.requirements
+    assert scanner.batch_indexes
+
+
+def test_scanner_without_the_regex_parser_matches_per_pattern_detection(monkeypatch):
+    monkeypatch.setattr(phi_scanner, 'sre_parse', None)
+    per_pattern = PHIDetector(use_scanner=False, use_ai=False)
+    scanner = PHIDetector(use_ai=False)
+    assert not scanner.scanner.prefilter.requirements and not scanner.scanner.batch_indexes
+    for text in TEXTS:
+        assert scanner.detect_phi(text) == per_pattern.detect_phi(text)
+    assert scanner.detect_phi_batch(pd.Series(TEXTS, dtype=object)).equals(
+        per_pattern.detect_phi_batch(pd.Series(TEXTS, dtype=object)))
+
+def test_batch_detection_matches_detect_phi(detector):
+    series = pd.Series(TEXTS + [None, 42], dtype=object)
+    frame = detector.detect_phi_batch(series)
+    assert len(frame) > 10
+    for row, text in series.items():
+        expected = detector.detect_phi(text) if isinstance(text, str) and text else []
+        found = frame[frame['row'] == row].drop(columns='row').to_dict('records')
+        assert found == expected
@@ -0,0 +1,27 @@
+import pandas as pd
+from sqlalchemy.engine import CursorResult
+from phi_service import PHIService
+
+
+def test_columns_fetch_only_the_sample_rows_they_need(source, monkeypatch):
+    pd.DataFrame({
+        'id': range(2000),
+        'status': [f"{'AB'[i % 2]}{i % 7:02d}" for i in range(2000)],
+        'note': ['Follow up in two weeks'] * 2000,
+    }).to_sql('visits', source.engine, index=False)
+
+    fetched = []
+    fetchmany = CursorResult.fetchmany
+
+    def counting_fetchmany(self, size=None):
+        rows = fetchmany(self, size)
+        fetched.append(len(rows))
+        return rows
+
+    monkeypatch.setattr(CursorResult, 'fetchmany', counting_fetchmany)
+    results = PHIService().analyze_database_columns(source, 'visits', max_rows=1000)
+    sample_sizes = {column['name']: column['sample_size'] for column in results['scanned_columns']}
+    # Free text reads enough rows to see rare PHI; a code column is settled by the margin
+    assert sample_sizes['note'] >= 300
+    assert sample_sizes['status'] < 300
+    assert sum(fetched) < 1000
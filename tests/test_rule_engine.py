@@ -0,0 +1,127 @@
+import os
+import datetime
+import pandas as pd
+import pytest
+from conftest import Rule
+from keyed_random import KeyedRandom, load_random_key
+from rule_engine import RuleEngine
+
+
+def test_keyed_random_is_deterministic_and_key_dependent():
+    values = pd.Series([f"value {i}" for i in range(100)], dtype=object)
+    rule = Rule('random', 'random_value', {'length': 12})
+
+    first = RuleEngine(random_key='one').apply_rule(values, rule)
+    # Same key: same draws, whatever the order of the values
+    reordered = RuleEngine(random_key='one').apply_rule(values[::-1], rule)
+    assert first.tolist() == reordered[::-1].tolist()
+    assert (RuleEngine(random_key='two').apply_rule(values, rule) != first).mean() > 0.9
+
+
+
+def test_keyed_hash_does_not_depend_on_the_chunk_dtype():
+    keyed = KeyedRandom('one', 'random_value', 42)
+    expected = keyed.hash(pd.Series([5, 6, 7]))
+    # A NULL makes a chunk of integers float64, Int64 or object
+    for chunk in (pd.Series([5, 6, None]), pd.Series([5, 6, None], dtype='Int64'),
+                  pd.Series([5, 6, None], dtype=object), pd.Series([5.0, 6.0, float('nan')])):
+        assert keyed.hash(chunk)[:2].tolist() == expected[:2].tolist()
+    assert keyed.hash(pd.Series([5.5, 6.0]))[1] == expected[1]
+    # An ASCII string hashes alike whether or not its chunk holds other characters
+    assert keyed.hash(pd.Series(['abc', 'x']))[0] == keyed.hash(pd.Series(['abc', 'é\ud800']))[0]
+
+def test_random_key_is_generated_once_and_kept(tmp_path, monkeypatch):
+    monkeypatch.delenv('DEID_RANDOM_KEY')
+    path = str(tmp_path / 'instance' / 'random_key')
+    key = load_random_key(path)
+    assert len(key) == 64
+    assert load_random_key(path) == key
+    assert os.stat(path).st_mode & 0o077 == 0
+
+    monkeypatch.setenv('DEID_RANDOM_KEY', 'configured')
+    assert load_random_key(path) == 'configured'
+
+
+def test_row_by_row_date_offset_keys_on_the_parsed_date():
+    engine = RuleEngine(random_key='one')
+    config = {'min_days': -300, 'max_days': 300, 'seed': 7}
+    vectorized = engine._transform_date_offset(pd.Series(['2020-01-05'] * 2 + ['2021-06-30']), config)
+    by_row = engine._offset_dates_by_row(pd.Series(['2020-01-05', '01/05/2020', '2021-06-30']), -300, 300, 7)
+    assert by_row.tolist() == vectorized.tolist()
+
+
+MASK_VALUES = ['(555) 123-4567', '555.123.4567 ext 89', '12345', 'john.doe@example.com', 'a@b@c', '',
+               '02139-1234', ' 94110 ', None, 'Ünïcode 555-123-4567', 'nul\x005551234567']
+
+
+def test_vectorized_masks_match_row_by_row_masks_on_text():
+    engine = RuleEngine(random_key='one')
+    values = pd.Series(MASK_VALUES * 3, dtype=object)
+    pattern = 'XXX-XXX-{last4}'
+    assert engine._transform_phone(values, {'pattern': pattern}).tolist() == \
+        engine._mask_phones_by_row(values, pattern).tolist()
+    for mode in ('preserve_domain', 'full_mask'):
+        assert engine._transform_email(values, {'mode': mode}).tolist() == \
+            engine._mask_emails_by_row(values, {'mode': mode}).tolist()
+    assert engine._transform_zipcode(values, {}).tolist() == engine._truncate_zips_by_row(values).tolist()
+
+
+def test_vectorized_masks_format_nullable_integers_as_integers():
+    engine = RuleEngine(random_key='one')
+    phones = pd.Series([5551237890, None], dtype='Int64')
+    masked = engine._transform_phone(phones, {})
+    assert masked[0] == 'XXX-XXX-7890'
+    assert masked[1] is pd.NA
+    # Nothing to mask: the column keeps its dtype and nulls
+    emails = engine._transform_email(phones, {})
+    assert emails.dtype == 'Int64'
+    assert emails.equals(phones)
+
+
+DATE_VALUES = ['2020-01-05', '2021-06-30', '1999-12-31', None, 'not a date', '2020-01-05', '03/04/2019', '']
+
+
+def as_timestamps(series):
+    return [pd.Timestamp(value) if isinstance(value, (pd.Timestamp, datetime.datetime)) else value
+            for value in series]
+
+
+@pytest.mark.parametrize('level', ['year', 'month', 'day'])
+def test_vectorized_date_generalization_matches_row_by_row(level):
+    engine = RuleEngine(random_key='one')
+    values = pd.Series(DATE_VALUES * 3, dtype=object)
+    assert as_timestamps(engine._transform_date_generalization(values, {'level': level})) == \
+        as_timestamps(engine._generalize_dates_by_row(values, level))
+
+
+def test_vectorized_date_offset_matches_row_by_row():
+    engine = RuleEngine(random_key='one')
+    values = pd.Series(DATE_VALUES * 3, dtype=object)
+    config = {'min_days': -300, 'max_days': 300, 'seed': 7}
+    assert as_timestamps(engine._transform_date_offset(values, config)) == \
+        as_timestamps(engine._offset_dates_by_row(values, -300, 300, 7))
+
+
+def test_random_value_draws_one_kind_per_column():
+    engine = RuleEngine(random_key='one')
+    rule = Rule('score', 'random_value', {'tables': ['.*'], 'columns': ['score']})
+    first = engine.apply_rule(pd.Series([5, 6, 7]), rule, table_name='t', column_name='score')
+    # A later chunk with a NULL reads as float64, but still draws the integers of the first chunk
+    later = engine.apply_rule(pd.Series([5, 6, None]), rule, table_name='t', column_name='score')
+    assert later[:2].tolist() == first[:2].tolist()
+    assert later[:2].map(float.is_integer).all() and pd.isna(later[2])
+
+
+def test_text_redaction_fills_and_reuses_the_detection_cache():
+    from phi_detector import PHIDetector
+    from text_redactor import TextRedactor
+    texts = ['Pt 1234567 called, SSN 123-45-6789', 'Nothing here', 'SSN 123-45-6789'] * 2
+    uncached = TextRedactor([r'\bcalled\b'], phi_types='all', detector=PHIDetector(use_ai=False))
+    detector = PHIDetector(use_ai=False, cache_size=100)
+    cached = TextRedactor([r'\bcalled\b'], phi_types='all', detector=detector)
+    expected = uncached.redact(texts)
+    assert cached.redact(texts) == expected
+    assert cached.redact(texts) == expected
+    assert (detector.get_cache_stats()['misses'], detector.get_cache_stats()['hits']) == (6, 6)
+    # Other patterns are cached apart
+    assert TextRedactor(phi_types=['ssn'], detector=detector).redact(texts[:1]) == ['Pt 1234567 called, [REDACTED]']
@@ -0,0 +1,124 @@
+import re
+import json
+import hashlib
+import logging
+from typing import List, Iterable, Optional
+import pandas as pd
+from phi_scanner import PatternScanner
+from span_resolver import SpanIndex
+
+logger = logging.getLogger(__name__)
+
+# Texts scanned per PatternScanner.scan_batch call, so that huge columns are
+# never joined into one string
+REDACTION_BATCH_SIZE = 10000
+
+# PHI types value that redacts every PHIDetector category
+ALL_PHI_TYPES = 'all'
+
+
+class TextRedactor:
+    """
+    Redacts the matches of many patterns in one pass per text.
+
+    The patterns of a rule, and optionally the PHIDetector categories it names,
+    are compiled once into a PatternScanner. Each batch of texts is scanned
+    once for all of them. The match spans of each text are merged where they
+    overlap, and the text is rebuilt once with every span replaced. Spans that
+    only touch are replaced separately, as sequential substitutions would.
+
+    The spans of each text are kept in the result cache of the detector (the
+    shared pattern detector by default), under a version of the redactor's
+    patterns, so repeated texts are not scanned again.
+    """
+
+    def __init__(self, patterns: Iterable[str] = (), replacement: str = '[REDACTED]',
+                 phi_types: Optional[Iterable[str]] = None, detector=None):
+        self.replacement = replacement
+        if detector is None:
+            from phi_detector import get_shared_detector
+            detector = get_shared_detector('pattern')
+        compiled = {}
+        for index, pattern in enumerate(patterns):
+            try:
+                compiled[f'pattern_{index}'] = [re.compile(pattern)]
+            except re.error as e:
+                logger.error(f"Skipping invalid redaction pattern {pattern!r}: {str(e)}")
+
+        if phi_types:
+            phi_types = [phi_types] if isinstance(phi_types, str) else list(phi_types)
+            if ALL_PHI_TYPES in phi_types:
+                phi_types = list(detector.compiled_patterns)
+            for phi_type in phi_types:
+                if phi_type in detector.compiled_patterns:
+                    compiled[phi_type] = detector.compiled_patterns[phi_type]
+                else:
+                    logger.warning(f"Unknown PHI type for redaction: {phi_type}")
+
+        self.categories = list(compiled)
+        self.scanner = PatternScanner(compiled) if compiled else None
+        self.cache = detector.cache
+        sources = [[category, [[pattern.pattern, pattern.flags] for pattern in compiled[category]]]
+                   for category in self.categories]
+        self.cache_version = 'redact:' + hashlib.sha256(json.dumps(sources).encode('utf-8')).hexdigest()[:16]
+
+    def redact(self, texts: List[str]) -> List[str]:
+        """Redact a list of texts, returned in the same order."""
+        if self.scanner is None:
+            return list(texts)
+
+        redacted = []
+        for batch_start in range(0, len(texts), REDACTION_BATCH_SIZE):
+            batch = texts[batch_start:batch_start + REDACTION_BATCH_SIZE]
+            spans = self._spans(batch)
+            redacted.extend(
+                self._replace_spans(text, spans[position]) if position in spans else text
+                for position, text in enumerate(batch)
+            )
+        return redacted
+
+    def _spans(self, batch: List[str]) -> dict:
+        """Spans to redact per position in the batch, from the cache or one scan of the texts not in it."""
+        spans = {}
+        keys = None
+        scanned = range(len(batch))
+        if self.cache is not None:
+            keys = [self.cache.make_key(text, self.cache_version) for text in batch]
+            scanned = []
+            for position, key in enumerate(keys):
+                cached = self.cache.get(key)
+                if cached is None:
+                    scanned.append(position)
+                elif cached:
+                    spans[position] = [(span['start'], span['end']) for span in cached]
+
+        texts = [batch[position] for position in scanned]
+        found = {}
+        for position, _, start, end in self.scanner.scan_batch(texts):
+            # Empty matches have nothing to redact
+            if end > start:
+                found.setdefault(scanned[position], []).append((start, end))
+        spans.update(found)
+        if keys is not None:
+            for position in scanned:
+                self.cache.put(keys[position], [{'start': start, 'end': end} for start, end in found.get(position, [])])
+        return spans
+
+    def redact_series(self, data_series: pd.Series) -> pd.Series:
+        """Redact the non-null values of a Series (as str() gives them); nulls are left as they are."""
+        notna = data_series.notna().to_numpy(dtype=bool)
+        values = data_series.to_numpy(dtype=object, copy=True)
+        values[notna] = self.redact([str(value) for value in values[notna]])
+        return pd.Series(values, index=data_series.index, name=data_series.name)
+
+    def _replace_spans(self, text: str, spans: List[tuple]) -> str:
+        """Build the text once, with each merged span replaced."""
+        merged = SpanIndex(spans)
+        parts = []
+        last = 0
+        for start, end in zip(merged.starts, merged.ends):
+            parts.append(text[last:start])
+            parts.append(self.replacement)
+            last = end
+        parts.append(text[last:])
+        return ''.join(parts)